@@ -31,6 +31,7 @@ files_to_process=(
     "b-script-flpzPert"
     "b-script-flpzCouple"
     "b-script-flpzCoupleAnalyze"
+    "b-script-flpzResume"
 )
 
 # Function to insert file content after the first line
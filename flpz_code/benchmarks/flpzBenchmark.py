@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import resource
+import tempfile
+import contextlib
+import subprocess
+import numpy as np
+
+CODE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The workflow copies every script into one working directory; from the repository the helpers
+# are imported from their own directories instead
+sys.path[:0] = [os.path.join(CODE_DIR, "shared"), os.path.join(CODE_DIR, "polynomialFitting")]
+
+# Benchmarks of the local (non-ABINIT) stages of the workflow on synthetic perovskite supercells,
+# from the 5-atom cubic cell to n x n x n supercells of 1,000+ atoms. Every stage runs in a fresh
+# Python process on inputs generated beforehand (an ABO3 supercell with small random displacements,
+# a smodes-style irrep listing with one symmetry mode per atom, the abinit force outputs of its
+# distortions and a double-well coupling energy surface), so the timing covers the stage alone and
+# the peak resident memory is that of the stage. Nothing is submitted and no external program is
+# run; FLPZ_CACHE_DIR points at the scratch directory so cached results are never reused.
+# Results are written as JSON. Given a baseline (an earlier results file of the same machine), every
+# stage that got slower or bigger by more than the tolerance is reported as a regression.
+#
+# Stages: smodes_modes      SMODES displacement generation (smodes_symmadapt_abinit.py, cached smodes output)
+#         smodes_postproc   force constants and eigenvectors from the distortions (smodes_postproc_abinit.py)
+#         datapoint_inputs  inputs, listings and space groups of a 31-point scan (datapointGen.py)
+#         cell_mapping      mapping the supercell onto the primitive cell (cellMapping.py)
+#         xred_xcart        xred <-> xcart conversion of the supercell inputs (crystalGeometry.py)
+#         polynomial_fit    invariant polynomial fit of a coupling energy grid with ~8 points per atom (polyFit.py)
+
+# Usage: python3 flpzBenchmark.py run [-s <natom,natom,...>] [-o <results_json>] [-b <baseline_json>]
+#                                     [-t <tolerance>] [<stage> ...]
+#        python3 flpzBenchmark.py compare [-t <tolerance>] <results_json> <baseline_json>
+# Sizes are numbers of atoms of the n x n x n supercells (5 n^3, default 5,40,135,320,1080). run and
+# compare exit with status 2 when a regression was found.
+
+STAGES = ("smodes_modes", "smodes_postproc", "datapoint_inputs", "cell_mapping", "xred_xcart", "polynomial_fit")
+DEFAULT_SIZES = (5, 40, 135, 320, 1080)
+DEFAULT_TOLERANCE = 0.25
+# Differences below these are noise whatever the tolerance says
+MIN_SECONDS = 0.05
+MIN_MEMORY_MB = 5.0
+RESULTS_FILE = "flpz_benchmark.json"
+
+ACELL = 7.4
+# Cubic ABO3 perovskite: species and positions in units of the lattice parameter
+SPECIES = ("Ba", "Ti", "O", "O", "O")
+ZNUCL = (56, 22, 8)
+BASIS = np.array([[0.0, 0.0, 0.0], [0.5, 0.5, 0.5], [0.5, 0.5, 0.0], [0.5, 0.0, 0.5], [0.0, 0.5, 0.5]])
+TYPAT = (1, 2, 3, 3, 3)
+MODE_SEPARATOR = "------------------------------------------"
+SMODES_SEPARATOR = "***********************************************"
+IRREP = "M3"
+SCAN_POINTS = 30
+COUPLING_TERMS = ("1", "x^2", "y^2", "x^4", "y^4", "x^2y^2", "x^6", "y^6", "x^4y^2", "x^2y^4")
+
+
+def supercell(natom):
+    """Lattice parameters (bohr), positions (units of ACELL), species labels and typat of a 5 n^3 supercell."""
+    n = round((natom / 5) ** (1 / 3))
+    if 5 * n ** 3 != natom:
+        raise ValueError(f"{natom} atoms is not a 5 n^3 perovskite supercell")
+    cells = np.array(np.meshgrid(range(n), range(n), range(n), indexing="ij")).reshape(3, -1).T
+    positions = (cells[:, None, :] + BASIS[None, :, :]).reshape(-1, 3)
+    species = [label for _ in cells for label in SPECIES]
+    typat = np.array([t for _ in cells for t in TYPAT])
+    # Sorted by species, the way smodes lists the atoms
+    order = np.argsort(typat, kind="stable")
+    return n, positions[order], [species[i] for i in order], typat[order]
+
+
+def smodes_output(natom, rng):
+    """smodes-style listing of one irrep of the supercell with one symmetry mode per atom: mode m moves
+    atom m along axis m mod 3 and half as much atom m+1, so the modes are linearly independent."""
+    n, positions, species, _ = supercell(natom)
+    lines = [f"Irrep {IRREP}", "Degeneracy 1", f"Total number of modes {natom}",
+             "Lattice vectors in units of the lattice parameter"]
+    lines += [" ".join(f"{n if i == j else 0:.6f}" for j in range(3)) for i in range(3)]
+    lines.append("Atomic positions in units of the lattice parameter")
+    lines += [f"{i + 1} {label} {x:.6f} {y:.6f} {z:.6f}" for i, (label, (x, y, z)) in enumerate(zip(species, positions))]
+    lines += ["Symmetry modes:", "Atom Type Displacements", "Mode listing"]
+    for m in range(natom):
+        if m:
+            lines.append(MODE_SEPARATOR)
+        axis = np.eye(3)[m % 3] * (1.0 + 0.1 * rng.random())
+        for atom, weight in ((m, 1.0), ((m + 1) % natom, 0.5)):
+            lines.append(f"{atom + 1} {species[atom]} " + " ".join(f"{v:.6f}" for v in weight * axis))
+    lines.append(SMODES_SEPARATOR)
+    return "\n".join(lines) + "\n"
+
+
+def genstruc(natom, rng):
+    """General structure input of the supercell with small random displacements (xred)."""
+    from abinitInput import AbinitInput
+    n, positions, _, typat = supercell(natom)
+    structure = AbinitInput()
+    structure.set("acell", [f"{ACELL * n:.6f}"] * 3)
+    structure.set("rprim", np.eye(3))
+    structure.set("natom", natom)
+    structure.set("ntypat", len(ZNUCL))
+    structure.set("typat", typat)
+    structure.set("znucl", list(ZNUCL))
+    structure.set("xred", (positions + 1e-3 * rng.standard_normal(positions.shape)) / n)
+    structure.set("ecut", "40")
+    structure.set("ngkpt", [4, 4, 4])
+    return structure
+
+
+def prepare(stage, natom, workdir):
+    """Writes the inputs of a stage into workdir and returns the context the timed part needs."""
+    rng = np.random.default_rng(natom)
+    if stage in ("smodes_modes", "smodes_postproc"):
+        with open(os.path.join(workdir, "smodes.out"), "w") as f:
+            f.write(smodes_output(natom, rng))
+    if stage == "smodes_postproc":
+        from smodes_symmadapt_abinit import split_irreps, parse_irrep, write_irrep
+        smodes_dir = os.path.join(workdir, f"SMODES_{IRREP}")
+        os.makedirs(smodes_dir)
+        os.chdir(smodes_dir)
+        with open(os.path.join(workdir, "smodes.out")) as f, contextlib.redirect_stdout(open(os.devnull, "w")):
+            write_irrep(IRREP, parse_irrep(split_irreps(f.read())[IRREP]), [ACELL] * 3)
+        for m in range(natom + 1):
+            dist_dir = os.path.join(smodes_dir, f"dist_{m}")
+            os.makedirs(dist_dir)
+            forces = 0.01 * rng.standard_normal((natom, 3))
+            with open(os.path.join(dist_dir, f"dist_{m}.abo"), "w") as f:
+                f.write(" etotal  -1.0000000000E+03\n cartesian forces (eV/Angstrom) at end:\n")
+                f.write("".join(f"{i + 1:5d} {x:18.10f} {y:18.10f} {z:18.10f}\n" for i, (x, y, z) in enumerate(forces)))
+                f.write("\n")
+    if stage in ("datapoint_inputs", "xred_xcart"):
+        structure = genstruc(natom, rng)
+        structure.write(os.path.join(workdir, "genstruc.abi"))
+    if stage == "xred_xcart":
+        for i in range(10):
+            structure.set("xred", structure.array("xred", shape=(natom, 3)) + 1e-4 * rng.standard_normal((natom, 3)))
+            structure.write(os.path.join(workdir, f"cell_{i}.abi"))
+    if stage == "polynomial_fit":
+        side = int(np.ceil(np.sqrt(8 * natom)))
+        x, y = np.meshgrid(np.linspace(-0.6, 0.6, side), np.linspace(-0.6, 0.6, side))
+        energy = -0.02 * x ** 2 + 0.05 * x ** 4 - 0.01 * y ** 2 + 0.03 * y ** 4 + 0.02 * x ** 2 * y ** 2
+        np.savetxt(os.path.join(workdir, "energy.dat"),
+                   np.column_stack([x.ravel(), y.ravel(), energy.ravel() + 1e-6 * rng.standard_normal(x.size)]))
+
+
+def run_stage(stage, natom, workdir):
+    """Runs the timed part of a stage in workdir and returns its wall time in seconds."""
+    os.chdir(workdir)
+    quiet = contextlib.redirect_stdout(open(os.devnull, "w"))
+    if stage == "smodes_modes":
+        from smodes_symmadapt_abinit import split_irreps, parse_irrep, write_irrep
+        start = time.perf_counter()
+        with quiet, open("smodes.out") as f:
+            write_irrep(IRREP, parse_irrep(split_irreps(f.read())[IRREP]), [ACELL] * 3)
+        return time.perf_counter() - start
+    if stage == "smodes_postproc":
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(CODE_DIR, "shared", "smodes_postproc_abinit.py"), IRREP],
+                       stdout=subprocess.DEVNULL, check=True)
+        return time.perf_counter() - start
+    if stage == "datapoint_inputs":
+        from abinitInput import AbinitInput
+        from crystalGeometry import cell_from_input
+        from datapointGen import write_datapoints
+        start = time.perf_counter()
+        structure = AbinitInput.read("genstruc.abi")
+        cell = cell_from_input(structure)
+        eig_disps = np.zeros((1, natom, 3))
+        eig_disps[0, :, 2] = np.where(cell["typat"] == 2, 1.0, -0.25)
+        eig_disps /= np.linalg.norm(eig_disps)
+        scan = {"params": {}, "structure": "bench", "vecNum": "1", "genstruc": structure, "cell": cell,
+                "eig_disps": eig_disps}
+        amplitudes = np.linspace(0, 0.6, SCAN_POINTS + 1)[:, None]
+        with quiet:
+            write_datapoints("pert", False, scan, amplitudes, [str(i) for i in range(SCAN_POINTS + 1)])
+        return time.perf_counter() - start
+    if stage == "cell_mapping":
+        from cellMapping import map_cells
+        n, positions, _, typat = supercell(natom)
+        target = (positions + 1e-3 * np.random.default_rng(natom).standard_normal(positions.shape)) / n
+        start = time.perf_counter()
+        map_cells(ACELL * np.eye(3), BASIS, ACELL * n * np.eye(3), target, np.array(TYPAT), typat)
+        return time.perf_counter() - start
+    if stage == "xred_xcart":
+        from crystalGeometry import convert_files
+        files = [f"cell_{i}.abi" for i in range(10)]
+        start = time.perf_counter()
+        convert_files(files, "xcart")
+        convert_files(files, "xred")
+        return time.perf_counter() - start
+    if stage == "polynomial_fit":
+        from polyFit import compile_terms, fit
+        start = time.perf_counter()
+        data = np.loadtxt("energy.dat", ndmin=2)
+        fit(compile_terms(COUPLING_TERMS, "xy"), data[:, :-1].T, data[:, -1])
+        return time.perf_counter() - start
+    raise ValueError(f"unknown stage {stage}")
+
+
+def peak_memory_mb():
+    """Peak resident memory of this process and of the processes it waited for, in MB."""
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit = 1.0 if sys.platform == "darwin" else 1024.0
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak * unit / 1024 ** 2
+
+
+def measure(stage, natom):
+    """Prepares a stage in a scratch directory and times it in a fresh process. Returns a result record."""
+    workdir = tempfile.mkdtemp(prefix=f"flpzBenchmark_{stage}_{natom}_")
+    env = {**os.environ, "FLPZ_CACHE_DIR": os.path.join(workdir, "cache")}
+    try:
+        for step in ("prepare", "stage"):
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), step, stage, str(natom), workdir],
+                                  capture_output=True, text=True, env=env)
+            if proc.returncode != 0:
+                message = (proc.stderr.strip() or proc.stdout.strip()).splitlines()
+                raise RuntimeError(f"{stage} ({natom} atoms) failed: {message[-1] if message else proc.returncode}")
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {"stage": stage, "natom": natom, "seconds": result["seconds"], "peak_mb": result["peak_mb"]}
+
+
+def machine():
+    return {"host": platform.node(), "platform": platform.platform(), "python": platform.python_version(),
+            "numpy": np.__version__, "cpus": os.cpu_count()}
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Regressions of results against a baseline: a stage at a size that got slower or used more
+    memory by more than the tolerance (fraction) and by more than the noise floor."""
+    reference = {(record["stage"], record["natom"]): record for record in baseline["results"]}
+    regressions = []
+    for record in results["results"]:
+        base = reference.get((record["stage"], record["natom"]))
+        if base is None:
+            continue
+        for key, floor in (("seconds", MIN_SECONDS), ("peak_mb", MIN_MEMORY_MB)):
+            if record[key] > base[key] * (1 + tolerance) and record[key] - base[key] > floor:
+                regressions.append(f"{record['stage']} ({record['natom']} atoms): {key} {base[key]:.3f} -> "
+                                   f"{record[key]:.3f} (+{100 * (record[key] / base[key] - 1):.0f}%)")
+    if baseline.get("machine", {}).get("host") != results.get("machine", {}).get("host"):
+        print("Warning: the baseline was recorded on another machine, timings may not be comparable")
+    return regressions
+
+
+def report(regressions):
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(2)
+    print("No regressions against the baseline")
+
+
+def run(stages, sizes, output, baseline=None, tolerance=DEFAULT_TOLERANCE):
+    results = {"machine": machine(), "created": time.time(), "sizes": list(sizes), "results": []}
+    for natom in sizes:
+        for stage in stages:
+            record = measure(stage, natom)
+            results["results"].append(record)
+            print(f"{stage:18s} {natom:6d} atoms {record['seconds']:10.3f} s {record['peak_mb']:9.1f} MB", flush=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=1)
+    print(f"Results written to {output}")
+    if baseline:
+        with open(baseline) as f:
+            report(compare(results, json.load(f), tolerance))
+
+
+def main():
+    args = sys.argv[1:]
+    try:
+        if len(args) == 4 and args[0] in ("prepare", "stage"):
+            stage, natom, workdir = args[1], int(args[2]), args[3]
+            if args[0] == "prepare":
+                prepare(stage, natom, workdir)
+            else:
+                seconds = run_stage(stage, natom, workdir)
+                print(json.dumps({"seconds": seconds, "peak_mb": peak_memory_mb()}))
+            return
+        if args and args[0] in ("run", "compare"):
+            command, args = args[0], args[1:]
+            options = {"-s": ",".join(map(str, DEFAULT_SIZES)), "-o": RESULTS_FILE, "-b": None,
+                       "-t": str(DEFAULT_TOLERANCE)}
+            while len(args) > 1 and args[0] in options:
+                options[args[0]] = args[1]
+                args = args[2:]
+            tolerance = float(options["-t"])
+            if command == "compare" and len(args) == 2:
+                with open(args[0]) as f, open(args[1]) as g:
+                    report(compare(json.load(f), json.load(g), tolerance))
+                return
+            if command == "run":
+                unknown = [stage for stage in args if stage not in STAGES]
+                if unknown:
+                    raise ValueError(f"unknown stages {' '.join(unknown)}, choose from {' '.join(STAGES)}")
+                sizes = [int(size) for size in options["-s"].split(",")]
+                for natom in sizes:
+                    supercell(natom)
+                run(args or STAGES, sizes, options["-o"], options["-b"], tolerance)
+                return
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print("Usage: python3 flpzBenchmark.py run [-s <natom,natom,...>] [-o <results_json>] [-b <baseline_json>]")
+    print("                                    [-t <tolerance>] [<stage> ...]")
+    print("       python3 flpzBenchmark.py compare [-t <tolerance>] <results_json> <baseline_json>")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
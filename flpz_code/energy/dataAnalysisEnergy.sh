@@ -22,22 +22,25 @@ vector_number="$4"
 output_file="Datasets_vec${vector_number}.m"
 energy_output_file="totEnergy_${vector_number}.m"
 
+# Link the outputs of the datapoints that a symmetry reduced grid did not calculate
+if [ -f "gridSymmetry_vec${vector_number}.in" ]; then
+    python3 gridSymmetry.py unfold "gridSymmetry_vec${vector_number}.in"
+fi
+
 # Initialize total energy vector
 echo "totEnergy_vec = [" >"$energy_output_file"
 
-# Get number of datapoints
-num_datapoints=$(sed -n '1p' "$derivative_db_file")
-
 # Extract and store total energy for each dataset
-for dataset in $(seq 1 $((num_datapoints + 1))); do
-    abo_file=$(sed -n "${dataset}p" "$abo_files_list")
-    etotal=$(grep "etotal1" "$abo_file" | awk '{print $2}')
-    echo "$etotal" >>"$energy_output_file"
-done
+python3 aboParser.py etotal "$abo_files_list" >>"$energy_output_file"
 
 # Finalize total energy vector
 echo "];" >>"$energy_output_file"
 
+# Keep the finished calculations in the result cache for later runs
+python3 resultCache.py store $(sed 's/\.abo$/.abi/' "$abo_files_list")
+# and their measured costs in the history of the resource estimates
+python3 resourceEstimator.py learn $(sed 's/\.abo$/.abi/' "$abo_files_list")
+
 # Combine x points and total energy vectors in final output
 cat "$x_points_file" "$energy_output_file" >"$output_file"
 
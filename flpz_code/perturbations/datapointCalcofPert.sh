@@ -19,32 +19,6 @@ while getopts "${OPTSTRING}" opt; do
 done
 shift $(( OPTIND - 1 ))
 
-# Python-based calculation function. Eliminates the need to install bc
-calculate() {
-    python3 - <<END
-from decimal import Decimal, getcontext
-import math
-
-def decimal_sqrt(x):
-    return Decimal(x).sqrt()
-
-getcontext().prec = 10  # Set precision to 10 digits total
-
-x = '$1'
-# Replace math functions with Decimal-compatible versions
-x = x.replace('sqrt', 'decimal_sqrt')
-x = x.replace('^', '**')  # Replace ^ with ** for exponentiation
-x = x.replace('abs', 'abs')  # Keep abs as is
-
-for func in ['sin', 'cos', 'tan', 'exp', 'log']:
-    x = x.replace(func, f'Decimal({func})')
-x = x.replace('pi', str(Decimal(math.pi)))
-
-result = eval(x, {'Decimal': Decimal, 'decimal_sqrt': decimal_sqrt, 'abs': abs}, {})
-print(f'{result:.10g}')
-END
-}
-
 # Function to check correct number of arguments
 check_args() {
     if [ "$#" -ne 1 ] && [ "$#" -ne 2 ]; then
@@ -60,411 +34,182 @@ read_input_params() {
     structure=$(grep "name" "$input_file" | awk '{print $2}' | tr '[:upper:]' '[:lower:]')
     general_structure_file=$(grep "genstruc" "$input_file" | awk '{print $2}')
     nproc=$(grep "nproc" "$input_file" | awk '{print $2}')
-    natom=$(grep "natom" "$general_structure_file" | awk '{print $2}')
     vecNum=$(grep "vecNum" "$input_file" | awk '{print $2}')
     bScriptPreamble=$(grep "sbatch_preamble" "$input_file" | awk '{print $2}')
-    phonon_coupling=$(grep "phonon_coupling" "$input_file" | awk '{print $2}')
-
-    # Reads certain arguments depending on whether the user specified a phonon coupling calculation.
-    if [ "$phonon_coupling" = 1 ]; then
-        grid_dimX=$(grep "grid_dim" "$input_file" | awk '{print $2}')
-        grid_dimY=$(grep "grid_dim" "$input_file" | awk '{print $3}')
-        xmin=$(grep "grid_range" "$input_file" | awk '{print $2}')
-        xmax=$(grep "grid_range" "$input_file" | awk '{print $3}')
-        ymin=$(grep "grid_range" "$input_file" | awk '{print $4}')
-        ymax=$(grep "grid_range" "$input_file" | awk '{print $5}')
-    else
-        num_datapoints=$(grep "num_datapoints" "$input_file" | awk '{print $2}')
-        max=$(grep "max" "$input_file" | awk '{print $2}')
-        min=$(grep "min" "$input_file" | awk '{print $2}')
-    fi
-}
-
-
-# Function to calculate step size
-calc_step_size() {
-    if [ "$phonon_coupling" = 1 ]; then
-        step_sizeX=$(calculate "($xmax-$xmin)/$grid_dimX")
-        step_sizeY=$(calculate "($ymax-$ymin)/$grid_dimY")
-        echo "Step Size X: $step_sizeX"
-        echo "Step Size Y: $step_sizeY"
-    else
-        step_size=$(calculate "($max-$min)/$num_datapoints")
-        echo "Step Size: $step_size"
-    fi
-}
+    job_array=$(grep "^job_array" "$input_file" | awk '{print $2}')
+    array_throttle=$(grep "^array_throttle" "$input_file" | awk '{print $2}')
+    sampling=$(grep "^sampling" "$input_file" | awk '{print $2}')
+    warm_start=$(grep "^warm_start " "$input_file" | awk '{print $2}')
+    estimate_resources=$(grep "^estimate_resources" "$input_file" | awk '{print $2}')
+    dfpt_stages=$(grep "^dfpt_stages" "$input_file" | awk '{print $2}')
 
-# Function to initialize output files
-init_output_files() {
     xpoints="xpoints${structure}_vec$vecNum.m"
     datasets_file="datasets_file${structure}_vec$vecNum.in"
     datasetsAbo_file="datasetsAbo_vec$vecNum.in"
-
-    echo "%x displacement vector magnitude" >"$xpoints"
-    echo "x_vec = [" >>"$xpoints"
-    echo "$num_datapoints" >"$datasets_file"
-
-    if [ "$phonon_coupling" = 1 ]; then
-        density="$(calculate "$grid_dimX*$grid_dimY")" 
-        echo "$density" >"$datasets_file"
-    else
-        echo "$num_datapoints" >"$datasets_file"
-    fi
-    : >"$datasetsAbo_file"
-
-    echo "Output files initialized:"
-    echo "xpoints: $xpoints"
-    echo "datasets_file: $datasets_file"
-    echo "datasetsAbo_file: $datasetsAbo_file"
+    space_groups_file="spaceGroups_vec$vecNum.in"
+    grid_symmetry_file="gridSymmetry_vec$vecNum.in"
 }
 
-# Function to extract and normalize eigenvector displacements 
-extract_normalize_eigdisp1() {
+# Function to generate every datapoint input file in a single python process
+generate_datapoints() {
     local input_file="$1"
-    # Extraction of the eigen displacement in the input file. 
-    mode_location=$(grep -in "eigen_disp1" "$input_file" | cut -d: -f1)
-
-    if [ -z "$mode_location" ]; then
-        echo "Error: Could not find eigen_disp1 in $input_file"
-        exit 1
-    fi
-
-    local begin_mode=$((mode_location + 1))
-    local end_mode=$((begin_mode + natom - 1))
-
-    eig_disp1=$(sed -n "${begin_mode},${end_mode}p" "$input_file")
-    echo "Printing eigdisp_array1 before normalization"
-    echo "$eig_disp1"
-
-    if [ -z "$eig_disp1" ]; then
-        echo "Error: Could not extract eigenvector data"
+    if ! python3 flpzTrace.py run inputs python3 datapointGen.py "${gen_opts[@]}" pert "$input_file"; then
+        echo "Error: Failed to generate the datapoint input files from $input_file"
         exit 1
     fi
-
-    # Declare an array that will hold the eigen displacement
-    eigdisp_array1=()
-
-    # Read all components into the array
-    while read -r line; do
-        read -ra temp_array <<<"$line"
-        eigdisp_array+=("${temp_array[@]}")
-    done <<<"$eig_disp1"
-
-    # Calculate the normalized eigen displacement
-    local eig_squaresum=0
-    for eig_component in "${eigdisp_array[@]}"; do
-        eig_squaresum=$(calculate "($eig_component)**2 + $eig_squaresum")
-    done
-    normfact=$(calculate "sqrt($eig_squaresum)")
-
-    echo "Normfact for eigen displacement 1:"
-    echo "$normfact"
-
-    local normalized_array=()
-    for i in "${!eigdisp_array[@]}"; do
-        normalized_value=$(calculate "${eigdisp_array[i]}/$normfact")
-        normalized_array+=("$normalized_value")
-    done
-
-    # Assign the normalized array back to eigdisp_array
-    eigdisp_array1=("${normalized_array[@]}")
 }
 
-# Function to extract and normalize eigenvector displacements 
-extract_normalize_eigdisp2() {
+# Function to sample the amplitudes adaptively: each batch written by adaptiveSampling.py is submitted
+# and waited for before the energies are refitted and the next batch is placed
+run_adaptive_sampling() {
     local input_file="$1"
-    # Extraction of the eigen displacement in the input file. 
-    mode_location=$(grep -in "eigen_disp2" "$input_file" | cut -d: -f1)
-
-    if [ -z "$mode_location" ]; then
-        echo "Error: Could not find eigen_disp1 in $input_file"
-        exit 1
-    fi
-
-    local begin_mode=$((mode_location + 1))
-    local end_mode=$((begin_mode + natom - 1))
-
-    eig_disp2=$(sed -n "${begin_mode},${end_mode}p" "$input_file")
-    echo "Printing eigdisp_array2 before normalization"
-    echo "$eig_disp2"
-
-    if [ -z "$eig_disp2" ]; then
-        echo "Error: Could not extract eigenvector data"
-        exit 1
-    fi
-
-    # Declare an array that will hold the eigen displacement
-    eigdisp_array2=()
-
-    # Read all components into the array
-    while read -r line; do
-        read -ra temp_array <<<"$line"
-        eigdisp_array2+=("${temp_array[@]}")
-    done <<<"$eig_disp2"
-
-    # Calculate the normalized eigen displacement
-    local eig_squaresum=0
-    for eig_component in "${eigdisp_array2[@]}"; do
-        eig_squaresum=$(calculate "($eig_component)**2 + $eig_squaresum")
-    done
-    normfact=$(calculate "sqrt($eig_squaresum)")
-
-    echo "Normfact for eigen displacement 2:"
-    echo "$normfact"
-
-    local normalized_array=()
-    for i in "${!eigdisp_array2[@]}"; do
-        normalized_value=$(calculate "${eigdisp_array2[i]}/$normfact")
-        normalized_array+=("$normalized_value")
+    local batch_file="adaptiveBatch_vec${vecNum}.in"
+    while true; do
+        if ! python3 flpzTrace.py run sampling python3 adaptiveSampling.py "${gen_opts[@]}" pert "$input_file"; then
+            echo "Error: Adaptive sampling failed for $input_file"
+            exit 1
+        fi
+        if [ ! -s "$batch_file" ]; then
+            break
+        fi
+        submit_datapoints "$input_file" "$batch_file"
+        if [ "${#job_ids[@]}" -gt 0 ] && ! wait_for_jobs; then
+            exit 1
+        fi
     done
-
-    # Assign the normalized array back to eigdisp_array
-    eigdisp_array2=("${normalized_array[@]}")
 }
 
-# Function to create perturbed system files
-create_perturbed_files() {
-    local iteration="$1"
-    local filename="${structure}_${iteration}_vec$vecNum"
-    local filename_abi="${filename}.abi"
-
-    echo "${structure}_${iteration}_vec${vecNum}o_DS4_DDB" >>"$datasets_file"
-    if [ "$run_piezo" != "true" ]; then
-        echo "${structure}_${iteration}_vec${vecNum}o_DS5_DDB" >>"$datasets_file"
-    fi
-    echo "${filename}.abo" >>"$datasetsAbo_file"
-
-    # Extract and perturb cartesian coordinates
-    xcart_location=$(grep -n "xcart" "$general_structure_file" | cut -d: -f1)
-    if [ -z "$xcart_location" ]; then
-        echo "Error: Could not find 'xcart' in $general_structure_file"
-        exit 1
-    fi
-
-    local xcart_start=$((xcart_location + 1))
-
-    local xcart_end=$((xcart_start + natom - 1))
-    xcart=$(sed -n "${xcart_start},${xcart_end}p" "$general_structure_file")
+# Function to read the space groups that datapointGen.py found for every perturbed cell
+read_space_groups() {
+    local abi_file number point_group
+    while read -r abi_file number point_group; do
+        space_groups["$abi_file"]="$number"
+        point_groups["$abi_file"]="$point_group"
+    done <"$space_groups_file"
+}
 
-    if [ -z "$xcart" ]; then
-        echo "Error: Failed to extract xcart coordinates from $general_structure_file"
-        exit 1
+# Function to read the representative datapoint of every grid point when the grid is symmetry reduced
+read_grid_symmetry() {
+    local abi_file representative rotation
+    if [ -f "$grid_symmetry_file" ]; then
+        while read -r abi_file representative rotation; do
+            representatives["$abi_file"]="$representative"
+        done <"$grid_symmetry_file"
     fi
+}
 
-    local count=0
-    local nxcart_array=()
-    local displacement_vector=()
-    cstep_sizew=$(calculate "${step_size} * ${iteration}")
-    cstep_size=$(calculate "${cstep_sizew} + ${min}")
-    for component in $xcart; do
-        local eig_dispcomp="${eigdisp_array1[$count]}"
-        perturbation=$(calculate "${eig_dispcomp} * ${cstep_size}")
-        nxcart_array+=("$(calculate "${perturbation}+${component}")")
-        displacement_vector+=("$perturbation")
-        count=$((count + 1))
-    done
-
-    echo "$cstep_size" >>"$xpoints"
-    echo ""
-    # Echo displacement vector
-    echo "Displacement vector for ${filename}:"
-    for ((i = 0; i < ${#displacement_vector[@]}; i += 3)); do
-        echo "${displacement_vector[i]} ${displacement_vector[i + 1]} ${displacement_vector[i + 2]}"
-    done
+# Function to print the space group of a perturbed cell
+report_space_group() {
+    local filename_abi="$1"
+    local space_group="${space_groups[$filename_abi]}"
     echo ""
-    # Echo new cartesian coordinates
-    echo "New cartesian coordinates for ${filename}:"
-    for ((i = 0; i < ${#nxcart_array[@]}; i += 3)); do
-        echo "${nxcart_array[i]} ${nxcart_array[i + 1]} ${nxcart_array[i + 2]}"
-    done
+    if [ -z "${space_group}" ] || [ "${space_group}" = "-" ]; then
+        echo "The space group of cell ${filename_abi%.abi} is unavailable (point group ${point_groups[$filename_abi]:-unknown})"
+    else
+        echo "The space group of cell ${filename_abi%.abi} is $space_group (point group ${point_groups[$filename_abi]})"
+    fi
     echo ""
-    # Create ABINIT input file
-    create_abinit_input "$filename_abi" "${nxcart_array[@]}"
-
-    # Create and submit batch script
-    create_batch_script "$filename" "$filename_abi"
 }
 
-# Function to create perturbed system files
-create_perturbedcoupled_files() {
-    local iterationX="$1"
-    local iterationY="$2"
-    local filename="${structure}_${iterationX}_${iterationY}_vec$vecNum"
-    local filename_abi="${filename}.abi"
+# Function to restore the datapoints that were already calculated from the result cache
+fetch_cached_results() {
+    local abo_list="$1"
+    local abi_files=()
+    while IFS= read -r abo_file; do
+        abi_files+=("${abo_file%.abo}.abi")
+    done <"$abo_list"
+    cached_inputs=$(python3 resultCache.py fetch "${abi_files[@]}")
+}
 
-    echo "${structure}_${iterationX}_${iterationY}_vec${vecNum}o_DS4_DDB" >>"$datasets_file"
-    if [ "$run_piezo" != "true" ]; then
-        echo "${structure}_${iterationX}_${iterationY}_vec${vecNum}o_DS5_DDB" >>"$datasets_file"
+# Function to estimate the ranks, walltime and memory of datapoint inputs from the runs that already
+# finished; without an estimate the jobs request nproc ranks and the limits of the preamble
+estimate_job_resources() {
+    local estimate job_time job_memory
+    job_nproc="$nproc"
+    resource_opts=()
+    if [ "$estimate_resources" != "1" ]; then
+        return 0
     fi
-    echo "${filename}.abo" >>"$datasetsAbo_file"
-
-    # Extract and perturb cartesian coordinates
-    xcart_location=$(grep -n "xcart" "$general_structure_file" | cut -d: -f1)
-    if [ -z "$xcart_location" ]; then
-        echo "Error: Could not find 'xcart' in $general_structure_file"
-        exit 1
+    if ! estimate=$(python3 resourceEstimator.py estimate "$input_file" "$@"); then
+        echo "No resource estimate, requesting ${nproc} ranks: $estimate"
+        return 0
     fi
-
-    local xcart_start=$((xcart_location + 1))
-
-    local xcart_end=$((xcart_start + natom - 1))
-    xcart=$(sed -n "${xcart_start},${xcart_end}p" "$general_structure_file")
-
-    if [ -z "$xcart" ]; then
-        echo "Error: Failed to extract xcart coordinates from $general_structure_file"
-        exit 1
+    read -r job_nproc job_time job_memory <<<"$estimate"
+    resource_opts=(--ntasks="$job_nproc" --time="$job_time")
+    if [ "$job_memory" != "-" ]; then
+        resource_opts+=(--mem-per-cpu="${job_memory}M")
     fi
+}
 
-    local count=0
-    local nxcart_array=()
-    local displacement_vector=()
-    cstep_sizeXw=$(calculate "${step_sizeX} * ${iterationX}")
-    cstep_sizeYw=$(calculate "${step_sizeY} * ${iterationY}")
-    cstep_sizeX=$(calculate "${cstep_sizeXw} + ${xmin}")
-    cstep_sizeY=$(calculate "${cstep_sizeYw} + ${ymin}")
-    for component in $xcart; do
-        local eig_dispcompX="${eigdisp_array1[$count]}"
-        local eig_dispcompY="${eigdisp_array2[$count]}"
-        perturbationX=$(calculate "${eig_dispcompX}*${cstep_sizeX}")
-        perturbationY=$(calculate "${eig_dispcompY}*${cstep_sizeY}")
-        nxcart_array+=("$(calculate "${component}+${perturbationX}+${perturbationY}")")
-        displacement_vector+=("$(calculate "$perturbationX+$perturbationY")")
-        count=$((count + 1))
-    done
-
-    echo "$cstep_sizeX $cstep_sizeY" >>"$xpoints"
-
-    # Echo displacement vector
-    echo ""
-    echo "Displacement vector for ${filename}:"
-    for ((i = 0; i < ${#displacement_vector[@]}; i += 3)); do
-        echo "${displacement_vector[i]} ${displacement_vector[i + 1]} ${displacement_vector[i + 2]}"
+# Function to hand the estimated resources of a job array to arraySubmit.sh
+array_resource_opts() {
+    local opt
+    array_opts=()
+    for opt in "${resource_opts[@]}"; do
+        array_opts+=(-r "$opt")
     done
-    echo ""
-    # Echo new cartesian coordinates
-    echo "New cartesian coordinates for ${filename}:"
-    for ((i = 0; i < ${#nxcart_array[@]}; i += 3)); do
-        echo "${nxcart_array[i]} ${nxcart_array[i + 1]} ${nxcart_array[i + 2]}"
-    done
-    echo ""
-    # Create ABINIT input file
-    create_abinit_input "$filename_abi" "${nxcart_array[@]}"
-
-    # Create and submit batch script
-    create_batch_script "$filename" "$filename_abi"
 }
 
-# Function to create ABINIT input file
-create_abinit_input() {
-    local filename_abi="$1"
-    shift
-    local nxcart_array=("$@")
-
-    cat <<EOF >"$filename_abi"
-##################################################
-# ${structure}: Flexoelectric Tensor Calculation #
-##################################################
-
-$(if [ "$run_piezo" = "true" ]; then 
-    echo "ndtset 4"
-else 
-    echo "ndtset 5"
-fi 
-)
-
-# Set 1: Ground State Self-Consistency
-#*************************************
-
-getwfk1 0
-kptopt1 1
-tolvrs1 1.0d-18
-
-# Set 2: Reponse function calculation of d/dk wave function
-#**********************************************************
-
-iscf2 -3
-rfelfd2 2
-tolwfr2 1.0d-20
-
-# Set 3: Response function calculation of d2/dkdk wavefunction
-#*************************************************************
-
-getddk3 2
-iscf3 -3
-rf2_dkdk3 3
-tolwfr3 1.0d-16
-rf2_pert1_dir3 1 1 1
-rf2_pert2_dir3 1 1 1
-
-# Set 4: Response function calculation to q=0 phonons, electric field and strain
-#*******************************************************************************
-getddk4 2
-rfelfd4 3
-rfphon4 1
-rfstrs4 3
-rfstrs_ref4 1
-tolvrs4 1.0d-8
-
-$(if [ "$run_piezo" != "true" ]; then 
-    echo "prepalw4 1"
-
-    echo "# Set 5: Long-wave Calculations
-#******************************
-
-optdriver5 10
-get1wf5 4
-get1den5 4
-getddk5 2
-getdkdk5 3
-lw_flexo5 1
-
-# turn off various file outputs
-prtpot 0
-prteig 0" 
-fi
-)
-
-EOF
-    # Add general info about the structure
-    cat "$general_structure_file" >>"$filename_abi"
-
-    # Find the line number where xcart starts
-    xcart_start=$(grep -n "^xcart" "$filename_abi" | cut -d: -f1)
+# Function to list the inputs of the datapoints that still need a calculation: not equivalent by
+# symmetry to another one, not restored from the result cache and not linked to an identical one
+list_submittable() {
+    local abo_list="$1"
+    local abo_file abi_file
+    submittable=()
+    while IFS= read -r abo_file; do
+        abi_file="${abo_file%.abo}.abi"
+        if [ "${representatives[$abi_file]:-$abi_file}" = "$abi_file" ] && ! grep -qxF "$abi_file" <<<"$cached_inputs" \
+            && [ -z "${duplicates[$abi_file]}" ]; then
+            submittable+=("$abi_file")
+        fi
+    done <"$abo_list"
+}
 
-    if [ -z "$xcart_start" ]; then
-        echo "Error: Unable to locate xcart coordinates in $filename_abi"
-        exit 1
+# Function to link the datapoints whose input is identical to one already submitted (e.g. the
+# zero-amplitude datapoint of an earlier vector), or to an earlier one of the list, to its outputs
+link_duplicates() {
+    local abo_list="$1"
+    local abi_file original job_id
+    duplicates=()
+    list_submittable "$abo_list"
+    if [ "${#submittable[@]}" -eq 0 ]; then
+        return 0
     fi
+    while read -r abi_file original job_id; do
+        duplicates["$abi_file"]="$original $job_id"
+    done < <(python3 flpzCatalog.py duplicates "${submittable[@]}")
+}
 
-    xcart_end=$((xcart_start + natom))
-
-    echo "Printing old xcart:"
-    sed -n "${xcart_start},${xcart_end}p" "$filename_abi"
-
-    # Delete existing xcart coordinates
-    sed -i "${xcart_start},${xcart_end}d" "$filename_abi"
-
-    # Insert new xcart coordinates
-    sed -i "${xcart_start}ixcart" "$filename_abi"
-    for ((i = 0; i < ${#nxcart_array[@]}; i += 3)); do
-        sed -i "${xcart_start}a${nxcart_array[i]} ${nxcart_array[i + 1]} ${nxcart_array[i + 2]}" "$filename_abi"
-        xcart_start=$((xcart_start + 1))
+# Function to give every linked datapoint the job of the datapoint it is linked to
+record_duplicate_jobs() {
+    local abi_file original job_id submission
+    for abi_file in "${!duplicates[@]}"; do
+        read -r original job_id <<<"${duplicates[$abi_file]}"
+        if [ "$job_id" = "-" ]; then
+            # Linked to a datapoint of this submission, or to a finished one
+            job_id=""
+            for submission in "${submissions[@]}"; do
+                if [ "${submission#* }" = "$original" ]; then
+                    job_id="${submission%% *}"
+                fi
+            done
+        else
+            job_ids+=("$job_id")
+        fi
+        if [ -n "$job_id" ]; then
+            submissions+=("$job_id $abi_file")
+        fi
     done
+}
 
-    echo "Printing new xcart:"
-    grep -A "$natom" "^xcart" "$filename_abi"
-
-    bash xcartToxred.sh "$filename_abi"
-    echo ""
-    # Print the space group of the perturbed cell
-    space_group=$(bash findSpaceGroup.sh "$filename_abi")
-    if [ -z "${space_group}" ]; then
-        echo "The space group of cell ${iteration} is unavailable"
-    else
-        echo "The space group of cell ${iteration} is $space_group"
+# Function to print the resources every datapoint left to submit will request, and their total
+plan_resources() {
+    local input_file="$1"
+    local abo_list="$2"
+    list_submittable "$abo_list"
+    if [ "${#submittable[@]}" -gt 0 ]; then
+        python3 resourceEstimator.py plan "$input_file" "${submittable[@]}"
     fi
-    echo ""
-    bash xredToxcart.sh "$filename_abi"
 }
 
 # Function to create and submit batch script
@@ -477,99 +222,236 @@ create_batch_script() {
     if [ -z "$preamble" ]; then
         preamble=$(<"$bScriptPreamble")
     fi
+    estimate_job_resources "$filename_abi"
 
     cat <<EOF >"${script}"
 #!/bin/bash
 $preamble
 
-mpirun -hosts=localhost -np  ${nproc}  abinit  ${filename_abi} >& ${filename}.log
+trace_start=\$(date +%s.%N)
+mpirun -hosts=localhost -np  ${job_nproc}  abinit  ${filename_abi} >& ${filename}.log
+status=\$?
+python3 flpzTrace.py record -d ${filename} -s "\$status" job "\$trace_start"
+exit "\$status"
 EOF
 
-    job_id=$(sbatch "${script}" | awk '{print $4}')
     local job_id
+    job_id=$(python3 executors.py submit "${resource_opts[@]}" "${script}" | awk '{print $4}')
     job_ids+=("$job_id")
+    submissions+=("$job_id $filename_abi")
     echo "Submitted batch job $job_id"
     #    rm "${script}"
 }
 
-# Function to wait for all jobs to complete or timeout after 3 hours
-wait_for_jobs() {
-    start_time=$(date +%s)
-    timeout=172800 # 48 hours in seconds
+# Function to submit every datapoint of the scan as a single job array
+submit_job_array() {
+    local task_list="datapointTasks_vec${vecNum}.in"
+    local script="b-script-${structure}_vec${vecNum}_array"
+    local throttle_opts=()
+    if [ -n "$array_throttle" ]; then
+        throttle_opts=(-t "$array_throttle")
+    fi
 
-    while true; do
-        all_completed=true
-        for job_id in "${job_ids[@]}"; do
-            if squeue -h -j "$job_id" &>/dev/null; then
-                all_completed=false
-                break
-            else
-                echo "Job $job_id completed"
-            fi
-        done
+    local job_id
+    if [ "${#pending_tasks[@]}" -eq 0 ]; then
+        echo "Every datapoint was restored from the result cache, nothing to submit"
+        return 0
+    fi
+    printf '%s\n' "${pending_tasks[@]}" >"$task_list"
+    # Every task of the array requests the largest estimate of the datapoints
+    estimate_job_resources "${pending_tasks[@]/%/.abi}"
+    array_resource_opts
+    job_id=$(bash arraySubmit.sh "${throttle_opts[@]}" "${array_opts[@]}" "$task_list" "$script" "$bScriptPreamble" \
+        "mpirun -hosts=localhost -np  ${job_nproc}  abinit  \"\${task}.abi\" >& \"\${task}.log\"")
+    if [ -z "$job_id" ]; then
+        echo "Error: Failed to submit the job array for $task_list"
+        exit 1
+    fi
+    job_ids+=("$job_id")
+    for task in "${pending_tasks[@]}"; do
+        submissions+=("$job_id ${task}.abi")
+    done
+    echo "Submitted array job $job_id with $(grep -c . "$task_list") tasks"
+}
+
+# Function to submit the datapoints as warm-started chains: every step of the chains is a job array
+# whose task i starts from the wavefunctions of task i of the previous step. A failed task still
+# releases its successor (-k), which then starts cold (warmStart.py check)
+submit_warm_start_chains() {
+    local task_list="datapointTasks_vec${vecNum}.in"
+    local script="b-script-${structure}_vec${vecNum}_warm"
+    local dependency_opts=()
+    local step_lists step_list job_id task
+
+    if [ "${#pending_tasks[@]}" -eq 0 ]; then
+        echo "Every datapoint was restored from the result cache, nothing to submit"
+        return 0
+    fi
+    printf '%s\n' "${pending_tasks[@]}" >"$task_list"
+    if ! step_lists=$(python3 warmStart.py plan "$input_file" "$task_list"); then
+        echo "Error: Failed to plan the warm start chains: $step_lists"
+        exit 1
+    fi
+    estimate_job_resources "${pending_tasks[@]/%/.abi}"
+    array_resource_opts
+    for step_list in $step_lists; do
+        job_id=$(bash arraySubmit.sh -k "${dependency_opts[@]}" "${array_opts[@]}" "$step_list" "$script" "$bScriptPreamble" \
+            "python3 warmStart.py check \"\${task}.abi\"; mpirun -hosts=localhost -np  ${job_nproc}  abinit  \"\${task}.abi\" >& \"\${task}.log\"")
+        if [ -z "$job_id" ]; then
+            echo "Error: Failed to submit the job array for $step_list"
+            exit 1
+        fi
+        job_ids+=("$job_id")
+        while IFS= read -r task; do
+            submissions+=("$job_id ${task}.abi")
+        done <"$step_list"
+        echo "Submitted array job $job_id with $(grep -c . "$step_list") tasks"
+        dependency_opts=(-d "aftercorresponding:$job_id")
+    done
+}
+
+# Function to submit the datapoints as staged DFPT runs: every stage left to run is a job array whose
+# task i waits for task i of the stages it reads, and stages that already completed are reused
+submit_dfpt_stages() {
+    local task_list="datapointTasks_vec${vecNum}.in"
+    local script="b-script-${structure}_vec${vecNum}_stage"
+    local throttle_opts=() dependency_opts=()
+    local stage_plan stage reads read dependency job_id task
+    local -A stage_jobs=()
+    if [ -n "$array_throttle" ]; then
+        throttle_opts=(-t "$array_throttle")
+    fi
 
-        if $all_completed; then
-            echo "All Batch Scripts have Completed."
-            return 0
+    if [ "${#pending_tasks[@]}" -eq 0 ]; then
+        echo "Every datapoint was restored from the result cache, nothing to submit"
+        return 0
+    fi
+    printf '%s\n' "${pending_tasks[@]}" >"$task_list"
+    if ! stage_plan=$(python3 dfptStages.py plan "$task_list"); then
+        echo "Error: Failed to plan the DFPT stages: $stage_plan"
+        exit 1
+    fi
+    if [ -z "$stage_plan" ]; then
+        echo "Every DFPT stage was already completed, nothing to submit"
+        return 0
+    fi
+    while read -r stage reads; do
+        dependency=""
+        for read in $reads; do
+            dependency="${dependency}:${stage_jobs[$read]}"
+        done
+        dependency_opts=()
+        if [ -n "$dependency" ]; then
+            dependency_opts=(-d "aftercorresponding${dependency}")
         fi
+        job_id=$(bash arraySubmit.sh "${throttle_opts[@]}" "${dependency_opts[@]}" -c "$nproc" "$task_list" "${script}_${stage}" \
+            "$bScriptPreamble" "python3 dfptStages.py run ${stage} \"\${task}\" ${nproc}")
+        if [ -z "$job_id" ]; then
+            echo "Error: Failed to submit the $stage stage job array for $task_list"
+            exit 1
+        fi
+        stage_jobs[$stage]="$job_id"
+        job_ids+=("$job_id")
+        echo "Submitted array job $job_id for the $stage stage of $(grep -c . "$task_list") datapoints"
+    done <<<"$stage_plan"
+    # The datapoint is finished with the last stage
+    while IFS= read -r task; do
+        submissions+=("$job_id ${task}.abi")
+    done <"$task_list"
+}
 
-        current_time=$(date +%s)
-        elapsed_time=$((current_time - start_time))
+# Function to wait for all jobs to complete or timeout after 48 hours
+wait_for_jobs() {
+    local timeout=172800 # 48 hours in seconds
+
+    if python3 jobTracker.py wait -t "$timeout" "${job_ids[@]}"; then
+        echo "All Batch Scripts have Completed."
+        return 0
+    fi
+    echo "Timeout reached. Exiting after 48 hours."
+    return 1
+}
 
-        if [ $elapsed_time -ge $timeout ]; then
-            echo "Timeout reached. Exiting after 3 hours."
-            return 1
+# Function to submit the datapoints whose .abo files are listed in a file, restoring the ones
+# already in the result cache
+submit_datapoints() {
+    local input_file="$1"
+    local abo_list="$2"
+    local abo_file filename representative
+    local submit_start
+    submit_start=$(date +%s.%N)
+    job_ids=()
+    pending_tasks=()
+    submissions=()
+    read_space_groups
+    read_grid_symmetry
+    fetch_cached_results "$abo_list"
+    python3 flpzCatalog.py register "$input_file"
+    if [ "$estimate_resources" = "1" ]; then
+        plan_resources "$input_file" "$abo_list"
+    fi
+    if [ -n "$cached_inputs" ]; then
+        python3 flpzCatalog.py restored $cached_inputs
+    fi
+    link_duplicates "$abo_list"
+    while IFS= read -r abo_file; do
+        filename="${abo_file%.abo}"
+        report_space_group "${filename}.abi"
+        representative="${representatives[${filename}.abi]:-${filename}.abi}"
+        if [ "$representative" != "${filename}.abi" ]; then
+            echo "Skipping ${filename}, it is equivalent by symmetry to ${representative%.abi}"
+        elif grep -qxF "${filename}.abi" <<<"$cached_inputs"; then
+            echo "Restored ${filename} from the result cache, skipping submission"
+        elif [ -n "${duplicates[${filename}.abi]}" ]; then
+            echo "Skipping ${filename}, its input is identical to ${duplicates[${filename}.abi]%% *}"
+        elif [ "$job_array" = "1" ] || [ "$warm_start" = "1" ] || [ "$dfpt_stages" = "1" ]; then
+            pending_tasks+=("$filename")
+        else
+            create_batch_script "$filename" "${filename}.abi"
         fi
+    done <"$abo_list"
+
+    if [ "$dfpt_stages" = "1" ]; then
+        submit_dfpt_stages
+    elif [ "$warm_start" = "1" ]; then
+        submit_warm_start_chains
+    elif [ "$job_array" = "1" ]; then
+        submit_job_array
+    fi
 
-        sleep 60 # Check every minute
-    done
+    record_duplicate_jobs
+
+    # Record the job id of every submitted datapoint in the campaign catalog
+    printf '%s\n' "${submissions[@]}" | python3 flpzCatalog.py submitted
+    python3 flpzTrace.py record submit "$submit_start"
 }
 
 # Main execution
 check_args "$@"
 read_input_params "$1"
-calc_step_size
-init_output_files
-extract_normalize_eigdisp1 "$1"
-echo ""
-echo "Printing eigdisp_array1:"
-for ((i = 0; i < ${#eigdisp_array1[@]}; i += 3)); do
-    echo "${eigdisp_array1[i]} ${eigdisp_array1[i + 1]} ${eigdisp_array1[i + 2]}"
-done
-echo ""
+# The DFPT stages run side by side and would drop the warm start of their ground state
+if [ "$dfpt_stages" = "1" ] && [ "$warm_start" = "1" ]; then
+    echo "Error: dfpt_stages 1 and warm_start 1 cannot be combined, remove one of them from $1"
+    exit 1
+fi
+
+gen_opts=()
+if [ "$run_piezo" = "true" ]; then
+    gen_opts=(-p)
+fi
 
 # Create perturbed files
-if [ "$phonon_coupling" = 1 ]; then
-    extract_normalize_eigdisp2 "$1"
-    echo ""
-    echo "Printing eigdisp_array2:"
-    for ((i = 0; i < ${#eigdisp_array2[@]}; i += 3)); do
-        echo "${eigdisp_array2[i]} ${eigdisp_array2[i + 1]} ${eigdisp_array2[i + 2]}"
-    done
-    echo ""
-    for iterationX in $(seq 1 "$grid_dimX"); do
-        for iterationY in $(seq 1 "$grid_dimY"); do
-            create_perturbedcoupled_files "$iterationX" "$iterationY"
-        done
-    done
+declare -A space_groups point_groups representatives duplicates
+if [ "$sampling" = "adaptive" ]; then
+    run_adaptive_sampling "$1"
 else
-    for iteration in $(seq 0 "$num_datapoints"); do
-        create_perturbed_files "$iteration"
-    done
+    generate_datapoints "$1"
+    submit_datapoints "$1" "$datasetsAbo_file"
 fi
 
-job_ids=()
-
-
-
-
-
-
 # wait_for_jobs
 # echo "Data Analysis Begins"
 
-echo "];" >>"$xpoints"
-
 # Organize files
 mkdir -p "datapointAbiFiles_vec${vecNum}" "DDBs_vec${vecNum}"
 mv "${structure}_*_vec${vecNum}.abi" "datapointAbiFiles_vec${vecNum}/"
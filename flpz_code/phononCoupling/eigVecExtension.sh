@@ -2,11 +2,12 @@
 
 # Check if correct number of arguments is provided
 if [ "$#" -ne 2 ] && [ "$#" -ne 3 ]; then
-  echo "Usage: $0 -m/p <eig_vec> <mapping>"
+  echo "Usage: $0 -m/p/g <eig_vec> <mapping>"
   exit 1
 fi
 
-OPTSTRING=":m:p:"
+# -g expands the eigendisplacement with a single gather in cellMapping.py
+OPTSTRING=":m:p:g:"
 
 # Parse command line options
 while getopts "${OPTSTRING}" opt; do
@@ -17,6 +18,9 @@ while getopts "${OPTSTRING}" opt; do
   p)
     eigVecExtOpt="python"
     ;;
+  g)
+    eigVecExtOpt="gather"
+    ;;
   \?)
     echo "Invalid option: -$OPTARG" >&2
     exit 1
@@ -59,6 +63,9 @@ elif [ "$eigVecExtOpt" = "python" ]; then
       echo "Warning: Invalid element '$element' skipped" >&2
     fi
   done
+elif [ "$eigVecExtOpt" = "gather" ]; then
+  read -ra indices <<< "$(echo "$clean_mapping" | tr -cs '0-9' ' ')"
+  echo "$eig_vec" | python3 cellMapping.py gather "${indices[@]}"
 fi
 
 
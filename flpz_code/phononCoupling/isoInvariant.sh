@@ -25,8 +25,13 @@ read_input_params() {
 
 # Create FINDSYM input file
 create_invariant_input() {
+    local parent
+    if ! parent=$(bash findSpaceGroup.sh "$general_structure_file"); then
+        echo "Error: no space group for $general_structure_file: $parent"
+        exit 1
+    fi
     cat <<EOF >"$isoInput"
-VALUE PARENT $(bash findSpaceGroup.sh "$general_structure_file")
+VALUE PARENT ${parent}
 VALUE IRREP ${irrep_1} ${irrep_2}
 Value degree ${min_degree} ${max_degree}
 value direction ${irrepDir_1} ${irrepDir_2}
@@ -1,5 +1,11 @@
 #!/bin/bash
 
+# Maps the atoms of the target cell onto the atoms of the original cell with cellMapping.py
+# Prints the 1-based mapping on the line after "Mapping:", followed by the per-atom offsets and
+# lattice translations
+# Usage: ./transformCellpy.sh <OriginalCell> <TargetCell>
+# Both arguments are irrep input files; their genstruc is read relative to the irrep directory
+
 # Check if correct number of arguments is provided
 if [ "$#" -ne 2 ]; then
     echo "Usage: $0 <OriginalCell> <TargetCell>"
@@ -8,104 +14,20 @@ fi
 
 originalCell="$1"
 targetCell="$2"
-pythonFile="transformCell_Map.py"
-newPythonFile="transformCell_MapTest_modified.py"
 
-# Function to extract cell data from input files
-extract_cell_data() {
+# Function to locate the general structure file of an irrep input file (../<irrepDir>/<genstruc>)
+genstruc_path() {
     local file="$1"
-    local cellType="$2"
-
-    natom=$(grep "natom" "$file" | awk '{print $2}')
-
-    #Extract rprim with proper indentation
-    rprim=$(awk '
-        /^rprim/{flag=1; next} 
-        flag && NF==3 {
-            print "        [" $1 ", " $2 ", " $3 "],"
-            if (++count == 3) exit
-        }
-    ' "$file")
-
-
-    # Extract xred and format it with 3 columns and proper indentation
-        # Extract and perturb cartesian coordinates
-    #xred_location=$(grep -n "xred" "$file" | cut -d: -f1)
-   # local xred_start=$((xred_location + 1))
-
-    #local xred_end=$((xred_start + natom - 1))
-    #xred=$(sed -n "${xred_start},${xred_end}p" "$file")
-    
-    
-    # Extract xred (or xcart) and format it with 3 columns and proper indentation
-    xred=$(awk -v natom="$natom" '
-        /^xred/{flag=1; next} 
-        flag && NF==3 {
-            print "        [" $1 ", " $2 ", " $3 "],"
-            if (++count == natom) exit
-        }
-    ' "$file")
-
-    # Format the data for Python with proper indentation
-    echo "# Primitive vectors of the $cellType cell"
-    echo "${cellType}Cell = np.array(["
-    echo "$rprim"
-    echo "    ])"
-    echo "# $cellType cell expressed in reduced coordinates"
-    echo "${cellType}_posfrac = np.array(["
-    echo "$xred"
-    echo "    ])"
+    local irrepDir
+    irrepDir=$(echo "${file#../}" | cut -d'/' -f1)
+    echo "../${irrepDir}/$(grep "genstruc" "$file" | awk '{print $2}')"
 }
 
-originalCellGenStruc=../catio3_GM4-_Energy/$(grep "genstruc" "$originalCell" | awk '{print $2}')
-targetCellGenStruc=../catio3_GM4-_Energy/$(grep "genstruc" "$targetCell" | awk '{print $2}')
+originalCellGenStruc=$(genstruc_path "$originalCell")
+targetCellGenStruc=$(genstruc_path "$targetCell")
 
 echo "Original structures"
-
 echo "$originalCellGenStruc"
 echo "$targetCellGenStruc"
 
-# Extract data from input files. I have place holder in rn.
-originalCellData=$(extract_cell_data "$originalCellGenStruc" "ORIGINAL")
-targetCellData=$(extract_cell_data "$targetCellGenStruc" "TARGET")
-
-echo "Original Cell Data"
-
-echo "$originalCellData"
-
-
-echo "targetCellData"
-echo "$targetCellData"
-
-# Create temporary files with the cell data
-originalTempFile=$(mktemp)
-targetTempFile=$(mktemp)
-echo "$originalCellData" >"$originalTempFile"
-echo "$targetCellData" >"$targetTempFile"
-
-# Create modified Python file
-cp "$pythonFile" "$newPythonFile"
-
-# Add numpy import if not present
-sed -i '1iimport numpy as np' "$newPythonFile"
-
-# Replace ORIGINALCELL and TARGETCELL in the new file
-sed -i "/ORIGINALCELL/ r $originalTempFile" "$newPythonFile"
-sed -i "s/ORIGINALCELL//g" "$newPythonFile"
-sed -i "/TARGETCELL/ r $targetTempFile" "$newPythonFile"
-sed -i "s/TARGETCELL//g" "$newPythonFile"
-
-# Add code to call the function at the end of the file
-#echo "" >>"$newPythonFile"
-#echo "# Call the function" >>"$newPythonFile"
-#echo "Mapping, outDiff = transformCell_Map(ORIGINALCell, TARGETCell, ORIGINAL_posfrac, TARGET_posfrac)" >>"$newPythonFile"
-#echo "print('Mapping:', Mapping)" >>"$newPythonFile"
-#echo "print('outDiff:', outDiff)" >>"$newPythonFile"
-
-# Remove temporary files
-rm "$originalTempFile" "$targetTempFile"
-
-# Execute the modified Python script
-python3 "$newPythonFile"
-
-echo "Python script executed. Check the results in $newPythonFile"
+python3 cellMapping.py map "$originalCellGenStruc" "$targetCellGenStruc"
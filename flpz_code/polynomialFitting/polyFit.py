@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+import re
+import sys
+import json
+import numpy as np
+
+# Linear least-squares core shared by the polynomial fitting scripts. The models are linear in their
+# coefficients, so instead of iterating a nonlinear optimizer the term list is compiled once into an
+# exponent matrix (one row per term, one column per variable), the design matrix is built in a single
+# broadcast power/product and the fit is solved in closed form with lstsq on column-scaled data.
+# Terms are written as products of variables with optional powers: x, x^2, xy, x^2y^4, 1 (constant).
+# Fit results are written as JSON (data points plus one record per fit) so that plots can be drawn
+# later, and only for the fits that are wanted, with renderFits.py.
+
+# Usage: python3 polyFit.py <data_file> <term> [<term> ...]
+# The data file holds one column per variable followed by the fitted values.
+
+VARIABLES = "xyz"
+FACTOR_RE = re.compile(r"([a-z])(?:\^(\d+))?")
+
+
+def parse_term(term, variables=VARIABLES):
+    """Returns the exponent of every variable in a term string such as 'x^2y^2' (repeated letters add up)."""
+    exponents = [0] * len(variables)
+    if term in ("", "1"):
+        return exponents
+    position = 0
+    for match in FACTOR_RE.finditer(term):
+        if match.start() != position or match.group(1) not in variables:
+            raise ValueError(f"Cannot parse polynomial term '{term}'")
+        exponents[variables.index(match.group(1))] += int(match.group(2) or 1)
+        position = match.end()
+    if position != len(term):
+        raise ValueError(f"Cannot parse polynomial term '{term}'")
+    return exponents
+
+
+def compile_terms(terms, variables=VARIABLES):
+    """Compiles a term list into an (nterms, nvariables) exponent matrix."""
+    return np.array([parse_term(term, variables) for term in terms], dtype=int).reshape(len(terms), len(variables))
+
+
+def compile_powers(powers):
+    """Exponent matrix of a one variable polynomial with the given powers followed by a constant term."""
+    return np.array(list(powers) + [0], dtype=int)[:, None]
+
+
+def design_matrix(exponents, *coords):
+    """Evaluates every term at every point: returns an array of shape coords[0].shape + (nterms,)."""
+    points = np.stack(np.broadcast_arrays(*[np.asarray(c, dtype=float) for c in coords]), axis=-1)
+    return np.prod(points[..., None, :] ** exponents, axis=-1)
+
+
+def evaluate(exponents, coefficients, *coords):
+    return design_matrix(exponents, *coords) @ np.asarray(coefficients, dtype=float)
+
+
+def fit(exponents, coords, values):
+    """Solves the linear least-squares problem for the coefficients of every term.
+
+    Returns a dictionary with 'coefficients', 'covariance' (estimated from the residual variance, as
+    curve_fit does), 'mse', 'r2' and 'predicted'.
+    """
+    values = np.ravel(np.asarray(values, dtype=float))
+    A = design_matrix(exponents, *[np.ravel(c) for c in coords])
+    # Scaling the columns to unit norm keeps high powers from ruining the conditioning
+    scale = np.linalg.norm(A, axis=0)
+    scale[scale == 0] = 1.0
+    scaled_coefficients, _, rank, _ = np.linalg.lstsq(A / scale, values, rcond=None)
+    coefficients = scaled_coefficients / scale
+
+    predicted = A @ coefficients
+    residuals = values - predicted
+    ssr = np.sum(residuals ** 2)
+    sst = np.sum((values - np.mean(values)) ** 2)
+    dof = len(values) - A.shape[1]
+    if dof > 0 and rank == A.shape[1]:
+        scaled_covariance = np.linalg.pinv((A / scale).T @ (A / scale)) * ssr / dof
+        covariance = scaled_covariance / np.outer(scale, scale)
+    else:
+        covariance = np.full((A.shape[1], A.shape[1]), np.inf)
+    return {"coefficients": coefficients, "covariance": covariance, "mse": ssr / len(values),
+            "r2": 1 - ssr / sst if sst > 0 else 1.0, "predicted": predicted}
+
+
+def fit_record(label, title, terms, exponents, coefficients, mse, r2, equation, outputs):
+    """One fit of a results file: what renderFits.py needs to draw it into the listed output files."""
+    return {"label": str(label), "title": title, "terms": list(terms), "exponents": np.asarray(exponents).tolist(),
+            "coefficients": np.asarray(coefficients, dtype=float).tolist(), "mse": float(mse), "r2": float(r2),
+            "equation": equation, "outputs": list(outputs)}
+
+
+def write_fit_results(filename, data, fits):
+    """Writes the fitted data points ({'x': ..., 'y': ..., ['z': ...]}) and the fit records as JSON."""
+    with open(filename, "w") as f:
+        json.dump({"data": {name: np.asarray(values, dtype=float).tolist() for name, values in data.items()},
+                   "fits": fits}, f, indent=1)
+
+
+def main():
+    if len(sys.argv) < 3:
+        print("Usage: python3 polyFit.py <data_file> <term> [<term> ...]")
+        sys.exit(1)
+    data = np.loadtxt(sys.argv[1], ndmin=2)
+    terms = sys.argv[2:]
+    exponents = compile_terms(terms, VARIABLES[:data.shape[1] - 1])
+    result = fit(exponents, data[:, :-1].T, data[:, -1])
+    errors = np.sqrt(np.diag(result["covariance"]))
+    for term, coefficient, error in zip(terms, result["coefficients"], errors):
+        print(f"{term}: {coefficient:.6e} +/- {error:.6e}")
+    print(f"MSE: {result['mse']:.6e}")
+    print(f"R-squared: {result['r2']:.6f}")
+
+
+if __name__ == "__main__":
+    main()
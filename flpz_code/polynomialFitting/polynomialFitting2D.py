@@ -1,50 +1,37 @@
 #!/usr/bin/env python3
 import sys
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
+from polyFit import compile_powers, evaluate, fit, fit_record, write_fit_results
+
+# The fits are written to RESULTS_FILE; plot them with renderFits.py, or pass -r to plot right away
+RESULTS_FILE = "polynomial_fit_results.json"
 
 def parse_args():
-    if len(sys.argv) < 3:
-        print("Usage: python script.py <data_file> <powers>")
+    args = sys.argv[1:]
+    render_plots = bool(args) and args[0] == "-r"
+    if render_plots:
+        args = args[1:]
+    if len(args) < 2:
+        print("Usage: python script.py [-r] <data_file> <powers>")
         print("Example: python script.py data.txt 2 4")
         sys.exit(1)
-    return sys.argv[1], [int(p) for p in sys.argv[2:]]
+    return args[0], [int(p) for p in args[1:]], render_plots
 
 def load_data(filename):
     data = np.loadtxt(filename)
     return data[:, 0], data[:, 1]
 
 def create_polynomial_function(powers):
+    # The powers are compiled once; the constant term is the last parameter
+    exponents = compile_powers(powers)
     def polynomial(x, *params):
-        return sum(param * x**power for param, power in zip(params, powers)) + params[-1]
+        return evaluate(exponents, params, x)
+    polynomial.exponents = exponents
     return polynomial
 
-def fit_and_evaluate(x, y, func, p0):
-    popt, _ = curve_fit(func, x, y, p0=p0, maxfev=10000)
-    y_pred = func(x, *popt)
-    mse = np.mean((y - y_pred)**2)
-    r2 = 1 - np.sum((y - y_pred)**2) / np.sum((y - np.mean(y))**2)
-    return popt, mse, r2, y_pred
-
-def plot_results(x, y, func, popt, powers, step, filename):
-    plt.figure(figsize=(10, 6))
-    plt.scatter(x, y, color='blue', label='Data points')
-    
-    x_smooth = np.linspace(min(x), max(x), 1000)
-    y_smooth = func(x_smooth, *popt)
-    
-    plt.plot(x_smooth, y_smooth, color='red', label='Fitted polynomial')
-    plt.xlabel('X')
-    plt.ylabel('Y')
-    plt.title(f"Polynomial Fit (Step {step})")
-    plt.legend()
-    
-    y_range = max(y) - min(y)
-    plt.ylim(min(y) - 0.1*y_range, max(y) + 0.1*y_range)
-    
-    plt.savefig(filename)
-    plt.close()
+def fit_and_evaluate(x, y, func):
+    result = fit(func.exponents, (x,), y)
+    return result["coefficients"], result["mse"], result["r2"], result["predicted"]
 
 def print_equation(popt, powers):
     equation = "y = "
@@ -54,30 +41,31 @@ def print_equation(popt, powers):
     return equation
 
 def main():
-    data_file, powers = parse_args()
+    data_file, powers, render_plots = parse_args()
     x, y = load_data(data_file)
+    fits = []
     
     for step, power in enumerate(powers, 1):
         current_powers = powers[:step]
         poly_func = create_polynomial_function(current_powers)
         
-        if step == 1:
-            initial_guess = [1.0] * (step + 1)  # +1 for the constant term
-        else:
-            initial_guess = list(previous_popt) + [0.0]  # Add a new parameter
-        
-        popt, mse, r2, y_pred = fit_and_evaluate(x, y, poly_func, initial_guess)
+        popt, mse, r2, y_pred = fit_and_evaluate(x, y, poly_func)
         
         print(f"Step {step}: Fitting terms up to x^{power}")
         print(print_equation(popt, current_powers))
         print(f"MSE: {mse:.6e}")
         print(f"R-squared: {r2:.6f}\n")
         
-        plot_filename = f"polynomial_fit_step_{step}.png"
-        plot_results(x, y, poly_func, popt, current_powers, step, plot_filename)
-        print(f"Plot saved as {plot_filename}")
-        
-        previous_popt = popt
+        fits.append(fit_record(step, f"Polynomial Fit (Step {step})", [f"x^{p}" for p in current_powers] + ["1"],
+                               poly_func.exponents, popt, mse, r2, print_equation(popt, current_powers),
+                               [f"polynomial_fit_step_{step}.png"]))
+    
+    write_fit_results(RESULTS_FILE, {"x": x, "y": y}, fits)
+    print(f"Fit results saved as {RESULTS_FILE}")
+    if render_plots:
+        from renderFits import render
+        for path in render(RESULTS_FILE):
+            print(f"Plot saved as {path}")
     
     print("\nFitting process completed.")
 
@@ -2,21 +2,21 @@
 import sys
 import os
 import numpy as np
-import matplotlib
-print("Matplotlib backend:", matplotlib.get_backend())
-import matplotlib.pyplot as plt
-from scipy.optimize import leastsq
-from mpl_toolkits.mplot3d import Axes3D
-from itertools import combinations
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+from polyFit import compile_terms, evaluate, fit, fit_record, write_fit_results
+
+# The fit is written to RESULTS_FILE; plot it with renderFits.py, or pass -r to plot right away
+RESULTS_FILE = "polynomial_fit2D3D_results.json"
 
 def parse_args():
-    if len(sys.argv) < 3:
-        print("Usage: python script.py <data_file> <terms>")
+    args = sys.argv[1:]
+    render_plots = bool(args) and args[0] == "-r"
+    if render_plots:
+        args = args[1:]
+    if len(args) < 2:
+        print("Usage: python script.py [-r] <data_file> <terms>")
         print("Example: python script.py data.txt x^2 y^2 x^4 y^4 x^2y^2")
         sys.exit(1)
-    return sys.argv[1], sys.argv[2].split()  # Split the terms string into a list
+    return args[0], args[1].split(), render_plots  # Split the terms string into a list
 
 def load_data(filename):
     data = np.loadtxt(filename)
@@ -29,91 +29,16 @@ def scale_data(x, y, z):
     return x_scaled, y_scaled, z_scaled
 
 def create_polynomial_function(terms):
+    # The terms are compiled once into an exponent matrix; the constant term is the last parameter
+    exponents = compile_terms(list(terms) + ['1'], "xy")
     def polynomial_surface(x, y, *params):
-        result = params[-1]  # Constant term
-        for param, term in zip(params[:-1], terms):
-            if 'x' in term and 'y' in term:
-                if '^' in term:
-                    x_part, y_part = term.split('y')
-                    x_power = int(x_part.split('^')[1]) if '^' in x_part else 1
-                    y_power = int(y_part.split('^')[1]) if '^' in y_part else 1
-                else:
-                    x_power = y_power = 1
-                result += param * (x**x_power) * (y**y_power)
-            elif 'x' in term:
-                power = int(term.split('^')[1]) if '^' in term else 1
-                result += param * x**power
-            elif 'y' in term:
-                power = int(term.split('^')[1]) if '^' in term else 1
-                result += param * y**power
-        return result
+        return evaluate(exponents, params, x, y)
+    polynomial_surface.exponents = exponents
     return polynomial_surface
 
-def fit_surface(x_data, y_data, z_data, func, initial_params):
-    def residuals(params, x, y, z):
-        z_pred = func(x, y, *params)
-        return z - z_pred
-
-    # Flatten data for optimization
-    x_flat = x_data.flatten()
-    y_flat = y_data.flatten()
-    z_flat = z_data.flatten()
-
-    # Least squares optimization
-    optimized_params, _ = leastsq(residuals, initial_params, args=(x_flat, y_flat, z_flat))
-    return optimized_params
-
-def create_2d_plot(x_scaled, y, y_pred, axis_label, terms, popt):
-    plt.figure(figsize=(10, 6))
-    plt.scatter(x_scaled, y, color='blue', label='Data points')
-    plt.plot(x_scaled, y_pred, color='red', label='Fitted curve')
-    plt.xlabel(axis_label)
-    plt.ylabel('Z')
-    plt.title(f'2D Polynomial Fit for {axis_label}-axis')
-    plt.legend()
-    
-    equation = "z = " + " + ".join([f"{coef:.6e}{term}" for coef, term in zip(popt[:-1], terms[:-1])] + [f"{popt[-1]:.6e}"])
-    plt.text(0.05, 0.95, equation, transform=plt.gca().transAxes, verticalalignment='top', fontsize=9)
-    
-    plt.savefig(f'2d_fit_{axis_label.lower()}.png')
-    plt.close()
-
-def create_interactive_plot(x, y, z, X, Y, Z, terms, popt):
-    fig = make_subplots(rows=1, cols=1, specs=[[{'type': 'surface'}]])
-    
-    fig.add_trace(
-        go.Scatter3d(x=x, y=y, z=z, mode='markers', marker=dict(size=4, color='blue'), name='Data points'),
-        row=1, col=1
-    )
-    
-    fig.add_trace(
-        go.Surface(x=X, y=Y, z=Z, colorscale='Viridis', name='Fitted surface'),
-        row=1, col=1
-    )
-    
-    fig.update_layout(
-        title="Interactive Polynomial Surface Fit",
-        scene=dict(
-            xaxis_title='X',
-            yaxis_title='Y',
-            zaxis_title='Z'
-        ),
-        autosize=False,
-        width=900,
-        height=700,
-    )
-    
-    equation = print_equation(popt, terms)
-    fig.add_annotation(
-        xref="paper", yref="paper",
-        x=0.0, y=1.05,
-        text=equation,
-        showarrow=False,
-        font=dict(size=12),
-        align="left",
-    )
-    
-    fig.write_html("interactive_plot_final.html")
+def fit_surface(x_data, y_data, z_data, func):
+    # The model is linear in its parameters, so the least-squares solution is found in closed form
+    return fit(func.exponents, (x_data.flatten(), y_data.flatten()), z_data.flatten())["coefficients"]
 
 def print_equation(popt, terms):
     equation = "z = "
@@ -128,18 +53,15 @@ def print_equation(popt, terms):
 
 def main():
     print("Current working directory:", os.getcwd())
-    data_file, terms = parse_args()
+    data_file, terms, render_plots = parse_args()
     x, y, z = load_data(data_file)
     x_scaled, y_scaled, z_scaled = scale_data(x, y, z)
 
     # Create the polynomial function
     poly_func = create_polynomial_function(terms)
 
-    # Initial guess for parameters (one for each term plus a constant term)
-    initial_guess = [1.0] * (len(terms) + 1)
-
-    # Fit the surface
-    best_popt = fit_surface(x_scaled, y_scaled, z_scaled, poly_func, initial_guess)
+    # Fit the surface (one parameter for each term plus a constant term)
+    best_popt = fit_surface(x_scaled, y_scaled, z_scaled, poly_func)
 
     # Calculate predictions and metrics
     z_pred = poly_func(x_scaled, y_scaled, *best_popt)
@@ -152,15 +74,14 @@ def main():
     print(f"MSE: {mse:.6e}")
     print(f"R-squared: {r2:.6f}")
 
-    # Create smooth grid for surface plot
-    x_smooth = np.linspace(0, 1, 100)
-    y_smooth = np.linspace(0, 1, 100)
-    X, Y = np.meshgrid(x_smooth, y_smooth)
-    Z = poly_func(X, Y, *best_popt)
-
-    # Create interactive plot
-    create_interactive_plot(x_scaled, y_scaled, z_scaled, X, Y, Z, terms + ['1'], best_popt)
-    print("Interactive plot for final fit saved as 'interactive_plot_final.html'")
+    write_fit_results(RESULTS_FILE, {"x": x_scaled, "y": y_scaled, "z": z_scaled},
+                      [fit_record("final", "Polynomial Surface Fit", terms + ['1'], poly_func.exponents, best_popt,
+                                  mse, r2, print_equation(best_popt, terms + ['1']), ["interactive_plot_final.html"])])
+    print(f"Fit results saved as {RESULTS_FILE}")
+    if render_plots:
+        from renderFits import render
+        render(RESULTS_FILE)
+        print("Interactive plot for final fit saved as 'interactive_plot_final.html'")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
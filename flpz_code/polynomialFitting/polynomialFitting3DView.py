@@ -1,19 +1,22 @@
 #!/usr/bin/env python3
 import sys
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
-from mpl_toolkits.mplot3d import Axes3D
-from itertools import combinations
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+from polyFit import compile_terms, evaluate, fit, fit_record, write_fit_results
+from subsetSearch import select_models
+
+# The fits are written to RESULTS_FILE; plot them with renderFits.py, or pass -r to plot right away
+RESULTS_FILE = "polynomial_surface_fit_results.json"
 
 def parse_args():
-    if len(sys.argv) < 3:
-        print("Usage: python script.py <data_file> <terms>")
+    args = sys.argv[1:]
+    render_plots = bool(args) and args[0] == "-r"
+    if render_plots:
+        args = args[1:]
+    if len(args) < 2:
+        print("Usage: python script.py [-r] <data_file> <terms>")
         print("Example: python script.py data.txt x^2 xy y^4")
         sys.exit(1)
-    return sys.argv[1], sys.argv[2:]
+    return args[0], args[1:], render_plots
 
 def load_data(filename):
     data = np.loadtxt(filename)
@@ -26,93 +29,17 @@ def scale_data(x, y, z):
     return x_scaled, y_scaled, z_scaled
 
 def create_polynomial_function(terms):
+    # The terms are compiled once into an exponent matrix instead of being re-parsed on every call
+    exponents = compile_terms(terms, "xy")
     def polynomial(xy, *params):
         x, y = xy
-        result = 0
-        for param, term in zip(params, terms):
-            if 'x' in term and 'y' in term:
-                x_power = term.count('x')
-                y_power = term.count('y')
-                result += param * (x**x_power) * (y**y_power)
-            elif 'x' in term:
-                power = term.count('x')
-                result += param * x**power
-            elif 'y' in term:
-                power = term.count('y')
-                result += param * y**power
-            else:
-                result += param  # constant term
-        return result
+        return evaluate(exponents, params, x, y)
+    polynomial.exponents = exponents
     return polynomial
 
-def fit_and_evaluate(x, y, z, func, p0):
-    popt, _ = curve_fit(func, (x, y), z, p0=p0, maxfev=10000)
-    z_pred = func((x, y), *popt)
-    mse = np.mean((z - z_pred)**2)
-    r2 = 1 - np.sum((z - z_pred)**2) / np.sum((z - np.mean(z))**2)
-    return popt, mse, r2, z_pred
-
-def plot_results(x, y, z, func, popt, terms, step, filename):
-    # Static plot
-    fig = plt.figure(figsize=(12, 8))
-    ax = fig.add_subplot(111, projection='3d')
-    
-    ax.scatter(x, y, z, color='blue', label='Data points')
-    
-    x_smooth = np.linspace(0, 1, 100)
-    y_smooth = np.linspace(0, 1, 100)
-    X, Y = np.meshgrid(x_smooth, y_smooth)
-    Z = func((X, Y), *popt)
-    
-    ax.plot_surface(X, Y, Z, color='red', alpha=0.5, label='Fitted surface')
-    ax.set_xlabel('X')
-    ax.set_ylabel('Y')
-    ax.set_zlabel('Z')
-    ax.set_title(f"Polynomial Surface Fit (Step {step})")
-    
-    plt.savefig(filename)
-    plt.close()
-
-    # Interactive plot
-    create_interactive_plot(x, y, z, X, Y, Z, step, terms, popt)
-
-def create_interactive_plot(x, y, z, X, Y, Z, step, terms, popt):
-    fig = make_subplots(rows=1, cols=1, specs=[[{'type': 'surface'}]])
-    
-    fig.add_trace(
-        go.Scatter3d(x=x, y=y, z=z, mode='markers', marker=dict(size=4, color='blue'), name='Data points'),
-        row=1, col=1
-    )
-    
-    fig.add_trace(
-        go.Surface(x=X, y=Y, z=Z, colorscale='Viridis', name='Fitted surface'),
-        row=1, col=1
-    )
-    
-    fig.update_layout(
-        title=f"Interactive Polynomial Surface Fit (Step {step})",
-        scene=dict(
-            xaxis_title='X',
-            yaxis_title='Y',
-            zaxis_title='Z'
-        ),
-        autosize=False,
-        width=900,
-        height=700,
-    )
-    
-    # Add equation as annotation
-    equation = print_equation(popt, terms)
-    fig.add_annotation(
-        xref="paper", yref="paper",
-        x=0.0, y=1.05,
-        text=equation,
-        showarrow=False,
-        font=dict(size=12),
-        align="left",
-    )
-    
-    fig.write_html(f"interactive_plot_step_{step}.html")
+def fit_and_evaluate(x, y, z, func):
+    result = fit(func.exponents, (x, y), z)
+    return result["coefficients"], result["mse"], result["r2"], result["predicted"]
 
 def print_equation(popt, terms):
     equation = "z = "
@@ -123,43 +50,33 @@ def print_equation(popt, terms):
             equation += f"{coef:.6e}"
     return equation.rstrip(" + ")
 
-def stepwise_fitting(x, y, z, terms):
-    best_terms = []
-    best_mse = float('inf')
-    best_r2 = -float('inf')
-    best_popt = None
-
-    for i in range(1, len(terms) + 1):
-        for combination in combinations(terms, i):
-            current_terms = list(combination)
-            poly_func = create_polynomial_function(current_terms)
-            initial_guess = [1.0] * len(current_terms)
-            
-            popt, mse, r2, _ = fit_and_evaluate(x, y, z, poly_func, initial_guess)
-            
-            if r2 > best_r2:
-                best_terms = current_terms
-                best_mse = mse
-                best_r2 = r2
-                best_popt = popt
+def stepwise_fitting(x, y, z, terms, fits):
+    # Exact branch-and-bound search for the best model of every size; the final model is the one
+    # with the lowest BIC rather than the highest R-squared
+    models, best = select_models(terms, (x, y), z)
 
-        print(f"Step {i}: Best terms {', '.join(best_terms)}")
-        print(print_equation(best_popt, best_terms))
-        print(f"MSE: {best_mse:.6e}")
-        print(f"R-squared: {best_r2:.6f}\n")
+    for model in models:
+        i = len(model["terms"])
+        print(f"Step {i}: Best terms {', '.join(model['terms'])}")
+        print(print_equation(model["coefficients"], model["terms"]))
+        print(f"MSE: {model['mse']:.6e}")
+        print(f"R-squared: {model['r2']:.6f}\n")
 
-        plot_filename = f"polynomial_surface_fit_step_{i}.png"
-        plot_results(x, y, z, create_polynomial_function(best_terms), best_popt, best_terms, i, plot_filename)
-        print(f"Plot saved as {plot_filename}")
+        fits.append(fit_record(i, f"Polynomial Surface Fit (Step {i})", model["terms"],
+                               compile_terms(model["terms"], "xy"), model["coefficients"], model["mse"], model["r2"],
+                               print_equation(model["coefficients"], model["terms"]),
+                               [f"polynomial_surface_fit_step_{i}.png", f"interactive_plot_step_{i}.html"]))
 
+    best_terms, best_popt, best_mse, best_r2 = best["terms"], best["coefficients"], best["mse"], best["r2"]
     return best_terms, best_popt, best_mse, best_r2
 
 def main():
-    data_file, terms = parse_args()
+    data_file, terms, render_plots = parse_args()
     x, y, z = load_data(data_file)
     x_scaled, y_scaled, z_scaled = scale_data(x, y, z)
     
-    best_terms, best_popt, best_mse, best_r2 = stepwise_fitting(x_scaled, y_scaled, z_scaled, terms)
+    fits = []
+    best_terms, best_popt, best_mse, best_r2 = stepwise_fitting(x_scaled, y_scaled, z_scaled, terms, fits)
     
     print("\nFinal best fit:")
     print(f"Terms: {', '.join(best_terms)}")
@@ -167,13 +84,17 @@ def main():
     print(f"MSE: {best_mse:.6e}")
     print(f"R-squared: {best_r2:.6f}")
 
-    # Create interactive plot for the final best fit
-    x_smooth = np.linspace(0, 1, 100)
-    y_smooth = np.linspace(0, 1, 100)
-    X, Y = np.meshgrid(x_smooth, y_smooth)
-    Z = create_polynomial_function(best_terms)((X, Y), *best_popt)
-    create_interactive_plot(x_scaled, y_scaled, z_scaled, X, Y, Z, "Final", best_terms, best_popt)
-    print("Interactive plot for final fit saved as 'interactive_plot_step_Final.html'")
+    # Interactive plot for the final best fit
+    fits.append(fit_record("Final", "Polynomial Surface Fit (Step Final)", best_terms, compile_terms(best_terms, "xy"),
+                           best_popt, best_mse, best_r2, print_equation(best_popt, best_terms),
+                           ["interactive_plot_step_Final.html"]))
+
+    write_fit_results(RESULTS_FILE, {"x": x_scaled, "y": y_scaled, "z": z_scaled}, fits)
+    print(f"Fit results saved as {RESULTS_FILE}")
+    if render_plots:
+        from renderFits import render
+        for path in render(RESULTS_FILE):
+            print(f"Plot saved as {path}")
 
 if __name__ == "__main__":
     main()
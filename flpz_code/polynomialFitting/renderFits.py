@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from polyFit import evaluate
+
+# Draws the plots of fits written by the polynomial fitting scripts. Fitting only writes a JSON
+# results file; this separate step renders the fits that are wanted, later or on another machine,
+# with several fits drawn in parallel. matplotlib and plotly are imported only by the process that
+# draws a figure of their kind. Every fit lists its output files: .png files are drawn with
+# matplotlib (a curve for one variable, a surface for two) and .html files with plotly.
+
+# Usage: python3 renderFits.py [-j <workers>] <results_json> [<label> ...]
+# Without labels every fit in the results file is rendered.
+
+
+def plot_curve(data, fit, filename):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    x, y = np.array(data["x"]), np.array(data["y"])
+    plt.figure(figsize=(10, 6))
+    plt.scatter(x, y, color='blue', label='Data points')
+
+    x_smooth = np.linspace(min(x), max(x), 1000)
+    y_smooth = evaluate(np.array(fit["exponents"]), fit["coefficients"], x_smooth)
+
+    plt.plot(x_smooth, y_smooth, color='red', label='Fitted polynomial')
+    plt.xlabel('X')
+    plt.ylabel('Y')
+    plt.title(fit["title"])
+    plt.legend()
+
+    y_range = max(y) - min(y)
+    plt.ylim(min(y) - 0.1*y_range, max(y) + 0.1*y_range)
+
+    plt.savefig(filename)
+    plt.close()
+
+
+def surface_grid(data, fit):
+    x, y = np.array(data["x"]), np.array(data["y"])
+    X, Y = np.meshgrid(np.linspace(min(x), max(x), 100), np.linspace(min(y), max(y), 100))
+    return X, Y, evaluate(np.array(fit["exponents"]), fit["coefficients"], X, Y)
+
+
+def plot_surface(data, fit, filename):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(12, 8))
+    ax = fig.add_subplot(111, projection='3d')
+    ax.scatter(data["x"], data["y"], data["z"], color='blue', label='Data points')
+
+    X, Y, Z = surface_grid(data, fit)
+    ax.plot_surface(X, Y, Z, color='red', alpha=0.5, label='Fitted surface')
+    ax.set_xlabel('X')
+    ax.set_ylabel('Y')
+    ax.set_zlabel('Z')
+    ax.set_title(fit["title"])
+
+    plt.savefig(filename)
+    plt.close()
+
+
+def plot_interactive(data, fit, filename):
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    X, Y, Z = surface_grid(data, fit)
+    fig = make_subplots(rows=1, cols=1, specs=[[{'type': 'surface'}]])
+    fig.add_trace(
+        go.Scatter3d(x=data["x"], y=data["y"], z=data["z"], mode='markers', marker=dict(size=4, color='blue'),
+                     name='Data points'),
+        row=1, col=1
+    )
+    fig.add_trace(
+        go.Surface(x=X, y=Y, z=Z, colorscale='Viridis', name='Fitted surface'),
+        row=1, col=1
+    )
+    fig.update_layout(
+        title=f"Interactive {fit['title']}",
+        scene=dict(
+            xaxis_title='X',
+            yaxis_title='Y',
+            zaxis_title='Z'
+        ),
+        autosize=False,
+        width=900,
+        height=700,
+    )
+    fig.add_annotation(
+        xref="paper", yref="paper",
+        x=0.0, y=1.05,
+        text=fit["equation"],
+        showarrow=False,
+        font=dict(size=12),
+        align="left",
+    )
+    fig.write_html(filename)
+
+
+def render_fit(data, fit):
+    """Draws every output file of one fit. Returns the files written."""
+    written = []
+    for filename in fit["outputs"]:
+        if filename.endswith(".html"):
+            plot_interactive(data, fit, filename)
+        elif "z" in data:
+            plot_surface(data, fit, filename)
+        else:
+            plot_curve(data, fit, filename)
+        written.append(filename)
+    return written
+
+
+def render(results_file, labels=None, workers=None):
+    """Renders the selected fits of a results file, in parallel when there are several."""
+    with open(results_file) as f:
+        results = json.load(f)
+    fits = [fit for fit in results["fits"] if not labels or fit["label"] in labels]
+    missing = set(labels or []) - {fit["label"] for fit in fits}
+    if missing:
+        raise ValueError(f"No fits labelled {', '.join(sorted(missing))} in {results_file}")
+    workers = min(len(fits), workers or os.cpu_count() or 1)
+    if workers <= 1:
+        return [path for fit in fits for path in render_fit(results["data"], fit)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        written = pool.map(render_fit, [results["data"]] * len(fits), fits)
+        return [path for paths in written for path in paths]
+
+
+def main():
+    args = sys.argv[1:]
+    workers = None
+    if len(args) > 1 and args[0] == "-j":
+        workers = int(args[1])
+        args = args[2:]
+    if not args:
+        print("Usage: python3 renderFits.py [-j <workers>] <results_json> [<label> ...]")
+        sys.exit(1)
+    try:
+        written = render(args[0], args[1:], workers)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    for path in written:
+        print(f"Plot saved as {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+import os
+import sys
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from polyFit import VARIABLES, compile_terms, design_matrix, fit
+
+# Best-subset selection over a list of candidate polynomial terms. The residual sum of squares (RSS)
+# of every model is scored from the Gram matrix of the column-scaled design matrix: removing term j
+# from a model with inverse Gram H and coefficients beta raises the RSS by beta_j^2 / H_jj, and the
+# inverse of the smaller model follows from a rank-one downdate, so no candidate model is refitted.
+# An exact branch-and-bound search (leaps and bounds) finds the lowest RSS model of every size:
+# removing terms can only raise the RSS, so a branch is abandoned once its RSS is no better than the
+# best model already known for every size it can still reach. Backward elimination seeds the bounds
+# and the branches are spread over a process pool. The final model is the one with the lowest
+# information criterion (AIC or BIC) instead of the highest R^2, which always favours more terms.
+# A constant term ("1") among the candidates is kept in every model.
+
+# Usage: python3 subsetSearch.py [-c aic/bic] [-j <workers>] <data_file> <term> [<term> ...]
+# The data file holds one column per variable followed by the fitted values.
+
+CRITERIA = ("aic", "bic")
+# Problems with fewer candidate terms than this are searched in the calling process
+PARALLEL_MIN_TERMS = 14
+# Depth of the search tree at which branches are handed to the process pool
+SPLIT_DEPTH = 2
+
+
+def record(best, model, rss):
+    """Keeps the lowest RSS model of every size."""
+    size = len(model)
+    if rss < best[size][0]:
+        best[size] = (rss, tuple(sorted(model)))
+
+
+def downdate(H, position):
+    """Inverse Gram matrix of a model after removing the term at position (rank-one downdate)."""
+    keep = np.arange(len(H)) != position
+    column = H[keep, position]
+    return H[np.ix_(keep, keep)] - np.outer(column, column) / H[position, position]
+
+
+def search(G, b, yy, model, start, H, best, depth=0, split_depth=None, tasks=None):
+    """Depth-first branch and bound below one model.
+
+    model lists the term indices of the current model; only the terms at positions >= start may be
+    removed in this branch. When split_depth is given, the branches at that depth are appended to
+    tasks instead of being searched.
+    """
+    beta = H @ b[model]
+    rss = max(yy - b[model] @ beta, 0.0)
+    record(best, model, rss)
+    if split_depth is not None and depth == split_depth:
+        tasks.append((model, start, H))
+        return
+
+    positions = np.arange(start, len(model))
+    if len(positions) == 0:
+        return
+    diagonal = np.diag(H)[positions]
+    increase = np.where(diagonal > 0, beta[positions] ** 2 / np.where(diagonal > 0, diagonal, 1.0), 0.0)
+    # Removing the most important term first gives the largest branch the highest RSS, so it prunes best
+    order = positions[np.argsort(-increase, kind="stable")]
+    permutation = np.concatenate((np.arange(start), order))
+    model = [model[p] for p in permutation]
+    H = H[np.ix_(permutation, permutation)]
+    increase = np.concatenate((np.zeros(start), np.sort(increase)[::-1]))
+
+    for position in range(start, len(model)):
+        child_rss = rss + increase[position]
+        # The branch can still remove the terms after position, reaching models of size position..len(model) - 1
+        if all(child_rss >= best[size][0] for size in range(max(position, 1), len(model))):
+            continue
+        if H[position, position] <= 0:
+            continue
+        child = model[:position] + model[position + 1:]
+        search(G, b, yy, child, position, downdate(H, position), best, depth + 1, split_depth, tasks)
+
+
+def search_branch(G, b, yy, model, start, H, best):
+    """Worker entry point: searches one branch and returns the best model of every size it found."""
+    best = dict(best)
+    search(G, b, yy, model, start, H, best)
+    return best
+
+
+def backward_elimination(G, b, yy, model, start, H, best):
+    """Greedy path that removes the least important term at every step; its models seed the bounds."""
+    while True:
+        beta = H @ b[model]
+        record(best, model, max(yy - b[model] @ beta, 0.0))
+        if len(model) <= max(start, 1):
+            return
+        diagonal = np.diag(H)[start:]
+        increase = np.where(diagonal > 0, beta[start:] ** 2 / np.where(diagonal > 0, diagonal, 1.0), np.inf)
+        position = start + int(np.argmin(increase))
+        model = model[:position] + model[position + 1:]
+        H = downdate(H, position)
+
+
+def best_subsets(A, values, forced=(), workers=None):
+    """Returns {size: (rss, term indices)} with the lowest RSS model of every size.
+
+    A is the design matrix of all candidate terms; the terms listed in forced are kept in every model.
+    """
+    values = np.asarray(values, dtype=float)
+    scale = np.linalg.norm(A, axis=0)
+    scale[scale == 0] = 1.0
+    scaled = A / scale
+    G = scaled.T @ scaled
+    b = scaled.T @ values
+    yy = float(values @ values)
+
+    nterms = A.shape[1]
+    model = list(forced) + [t for t in range(nterms) if t not in forced]
+    H = np.linalg.pinv(G[np.ix_(model, model)])
+    best = {size: (np.inf, ()) for size in range(nterms + 1)}
+    backward_elimination(G, b, yy, model, len(forced), H, best)
+
+    workers = os.cpu_count() if workers is None else workers
+    if workers <= 1 or nterms < PARALLEL_MIN_TERMS:
+        search(G, b, yy, model, len(forced), H, best)
+    else:
+        tasks = []
+        search(G, b, yy, model, len(forced), H, best, split_depth=SPLIT_DEPTH, tasks=tasks)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(search_branch, G, b, yy, *task, best) for task in tasks]
+            for future in futures:
+                for size, (rss, subset) in future.result().items():
+                    if rss < best[size][0]:
+                        best[size] = (rss, subset)
+    return {size: entry for size, entry in best.items() if entry[1]}
+
+
+def information_criteria(rss, nparams, npoints):
+    """Gaussian AIC and BIC of a least-squares model (up to a shared constant)."""
+    log_likelihood_term = npoints * np.log(max(rss, np.finfo(float).tiny) / npoints)
+    return {"aic": log_likelihood_term + 2 * nparams, "bic": log_likelihood_term + nparams * np.log(npoints)}
+
+
+def select_models(terms, coords, values, criterion="bic", workers=None):
+    """Finds the best model of every size and refits it.
+
+    Returns the list of per-size models (terms, fit results and information criteria, ordered by
+    size) and the model with the lowest criterion.
+    """
+    if criterion not in CRITERIA:
+        raise ValueError(f"Unknown information criterion '{criterion}', use one of {', '.join(CRITERIA)}")
+    exponents = compile_terms(terms, VARIABLES[:len(coords)])
+    A = design_matrix(exponents, *[np.ravel(c) for c in coords])
+    forced = [t for t, row in enumerate(exponents) if not row.any()]
+    values = np.ravel(values)
+
+    models = []
+    for size, (_, subset) in sorted(best_subsets(A, values, forced, workers).items()):
+        result = fit(exponents[list(subset)], coords, values)
+        result.update(information_criteria(result["mse"] * len(values), size, len(values)))
+        result["terms"] = [terms[t] for t in subset]
+        models.append(result)
+    return models, min(models, key=lambda model: model[criterion])
+
+
+def equation(model):
+    return " + ".join(f"{coef:.6e}{term if term != '1' else ''}" for coef, term in
+                      zip(model["coefficients"], model["terms"]))
+
+
+def main():
+    args = sys.argv[1:]
+    criterion = "bic"
+    workers = None
+    while len(args) > 1 and args[0] in ("-c", "-j"):
+        if args[0] == "-c":
+            criterion = args[1].lower()
+        else:
+            workers = int(args[1])
+        args = args[2:]
+    if len(args) < 2 or criterion not in CRITERIA:
+        print("Usage: python3 subsetSearch.py [-c aic/bic] [-j <workers>] <data_file> <term> [<term> ...]")
+        sys.exit(1)
+
+    data = np.loadtxt(args[0], ndmin=2)
+    models, chosen = select_models(args[1:], data[:, :-1].T, data[:, -1], criterion, workers)
+    for model in models:
+        print(f"{len(model['terms'])} terms: {', '.join(model['terms'])}")
+        print(f"    {equation(model)}")
+        print(f"    MSE: {model['mse']:.6e}  R-squared: {model['r2']:.6f}  "
+              f"AIC: {model['aic']:.3f}  BIC: {model['bic']:.3f}")
+    print(f"\nSelected by {criterion.upper()}: {', '.join(chosen['terms'])}")
+    print(equation(chosen))
+
+
+if __name__ == "__main__":
+    main()
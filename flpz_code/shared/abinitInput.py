@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+import re
+import sys
+import math
+import numpy as np
+
+# In-memory model of an ABINIT input file. Parsing turns the file into its variables in file order,
+# each a list of value tokens with the n*value shorthand expanded and multi-line arrays joined;
+# dataset suffixes stay part of the name (tolvrs1) and get() falls back to the unsuffixed variable
+# the way ABINIT does. Edits replace whole variables in memory (set, remove, update) and the input
+# is serialized in a single write, so producing many displaced inputs never rewrites a file line by
+# line. Comments and layout are not kept; arrays are written one row per line.
+
+# Usage: python3 abinitInput.py get <abi_file> <variable> [<dataset>]
+#        python3 abinitInput.py remove <abi_file> <out_file> <variable> [<variable> ...]
+#        python3 abinitInput.py merge <out_file> <abi_file> [<abi_file> ...]
+# merge writes the variables of all inputs to out_file, later inputs overriding earlier ones.
+
+UNITS = {"angstrom", "angstr", "bohr", "au", "ev", "ha", "hartree", "ry", "rydberg", "mev", "k", "kelvin",
+         "t", "tesla", "s", "sec", "fs", "nm"}
+# Factors to atomic units of the units that array() converts
+UNIT_FACTORS = {"angstrom": 1.8897261246, "angstr": 1.8897261246, "nm": 18.897261246, "bohr": 1.0, "au": 1.0,
+                "ev": 1 / 27.211386246, "mev": 1e-3 / 27.211386246, "ha": 1.0, "hartree": 1.0,
+                "ry": 0.5, "rydberg": 0.5}
+TOKEN_RE = re.compile(r'"[^"]*"|\S+')
+VARIABLE_RE = re.compile(r"^[a-z][a-z0-9_]*[?:+*]?$")
+REPEAT_RE = re.compile(r"^(\d+)\*(.+)$")
+DATASET_RE = re.compile(r"^(.*?[a-z_])(\d+|\d*[?:+*]\d*)$")
+NUMBER_FORMAT = "%.10f"
+# Values written on one line by variables without a row layout
+VALUES_PER_LINE = 20
+
+
+def to_number(token):
+    """Evaluates an ABINIT numerical token (1.0d-8, 1/2, sqrt(3)) or returns None."""
+    token = token.lower().replace("d", "e")
+    sign = -1.0 if token.startswith("-sqrt(") else 1.0
+    try:
+        if token.lstrip("-").startswith("sqrt(") and token.endswith(")"):
+            return sign * math.sqrt(float(token.lstrip("-")[5:-1]))
+        if "/" in token:
+            numerator, denominator = token.split("/")
+            return float(numerator) / float(denominator)
+        return float(token)
+    except ValueError:
+        return None
+
+
+def is_variable(token):
+    return not token.startswith('"') and VARIABLE_RE.match(token.lower()) is not None \
+        and to_number(token) is None and token.lower() not in UNITS
+
+
+def split_dataset(name):
+    """Splits a variable name into its base name and dataset suffix: tolvrs1 -> (tolvrs, '1')."""
+    match = DATASET_RE.match(name)
+    return (match.group(1), match.group(2)) if match else (name, "")
+
+
+def format_value(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, np.integer)):
+        return str(value)
+    return NUMBER_FORMAT % value
+
+
+def format_array(array):
+    """Value tokens of a numerical array, formatted in a single call whatever its size."""
+    values = tuple(array.ravel().tolist())
+    if array.dtype.kind == "f":
+        return ((NUMBER_FORMAT + " ") * len(values) % values).split()
+    return [str(v) for v in values]
+
+
+class AbinitInput:
+    """Variables of an ABINIT input in file order, each a list of value tokens."""
+
+    def __init__(self, variables=None, columns=None):
+        self.variables = dict(variables or {})
+        # Values per line of the variables written as rows (xred, rprim, kptrlatt)
+        self.columns = dict(columns or {})
+
+    @classmethod
+    def parse(cls, text):
+        model = cls()
+        current = None
+        # Set while the values of a variable whose name ended its line are still to be seen
+        pending = None
+        for line in text.splitlines():
+            line = re.split(r"[#!]", line, maxsplit=1)[0]
+            tokens = TOKEN_RE.findall(line)
+            if pending is not None and tokens and not is_variable(tokens[0]):
+                values = 0
+                for token in tokens:
+                    if is_variable(token):
+                        break
+                    values += 1
+                model.columns[pending] = values
+            pending = None
+            for token in tokens:
+                if is_variable(token):
+                    current = token.lower()
+                    model.variables[current] = []
+                    model.columns.pop(current, None)
+                    continue
+                if current is None:
+                    continue
+                match = REPEAT_RE.match(token)
+                if match:
+                    model.variables[current].extend([match.group(2)] * int(match.group(1)))
+                else:
+                    model.variables[current].append(token)
+            if tokens and current is not None and tokens[-1].lower() == current:
+                pending = current
+        return model
+
+    @classmethod
+    def read(cls, abi_file):
+        with open(abi_file) as f:
+            return cls.parse(f.read())
+
+    def __contains__(self, name):
+        return name in self.variables
+
+    def names(self):
+        return list(self.variables)
+
+    def copy(self):
+        return AbinitInput({name: list(values) for name, values in self.variables.items()}, self.columns)
+
+    def get(self, name, dataset=None, default=None):
+        """Value tokens of a variable, preferring its value for the given dataset."""
+        if dataset is not None and f"{name}{dataset}" in self.variables:
+            return self.variables[f"{name}{dataset}"]
+        return self.variables.get(name, default)
+
+    def array(self, name, dataset=None, shape=None, default=None):
+        """Numerical value of a variable in atomic units, reshaped to shape (extra values are dropped)."""
+        tokens = self.get(name, dataset)
+        if tokens is None:
+            if default is None:
+                raise KeyError(f"Variable {name} not found")
+            return np.array(default, dtype=float)
+        factor = 1.0
+        if tokens and tokens[-1].lower() in UNITS:
+            factor = UNIT_FACTORS.get(tokens[-1].lower(), 1.0)
+            tokens = tokens[:-1]
+        values = np.array([to_number(token) for token in tokens], dtype=float) * factor
+        if shape is None:
+            return values
+        size = int(np.prod(shape))
+        if len(values) < size:
+            raise ValueError(f"{name} has {len(values)} values, {size} expected")
+        return values[:size].reshape(shape)
+
+    def scalar(self, name, dataset=None, default=None):
+        tokens = self.get(name, dataset)
+        if not tokens:
+            if default is None:
+                raise KeyError(f"Variable {name} not found")
+            return default
+        return to_number(tokens[0])
+
+    def set(self, name, values, replace=None):
+        """Sets a variable from a scalar, a token list or an array (2D arrays are written one row per line).
+
+        With replace, the variable takes the place of the replaced one in the file order.
+        """
+        array = np.asarray(values) if not isinstance(values, str) else None
+        if array is not None and array.dtype.kind in "iuf":
+            tokens = format_array(array)
+            columns = array.shape[-1] if array.ndim > 1 else None
+        else:
+            tokens = [values] if isinstance(values, str) else [format_value(v) for v in values]
+            columns = None
+        if replace is not None and replace in self.variables and name not in self.variables:
+            self.variables = {(name if key == replace else key): value for key, value in self.variables.items()}
+            self.columns.pop(replace, None)
+        self.variables[name] = tokens
+        if columns:
+            self.columns[name] = columns
+        else:
+            self.columns.pop(name, None)
+
+    def remove(self, *names):
+        for name in names:
+            self.variables.pop(name, None)
+            self.columns.pop(name, None)
+
+    def update(self, other):
+        """Takes over every variable of another input."""
+        for name, values in other.variables.items():
+            self.variables[name] = list(values)
+            if name in other.columns:
+                self.columns[name] = other.columns[name]
+            else:
+                self.columns.pop(name, None)
+
+    def lines(self):
+        lines = []
+        for name, tokens in self.variables.items():
+            columns = self.columns.get(name)
+            if columns:
+                lines.append(name)
+                lines.extend("   " + " ".join(tokens[i:i + columns]) for i in range(0, len(tokens), columns))
+            else:
+                lines.append(" ".join([name] + tokens[:VALUES_PER_LINE]))
+                lines.extend("   " + " ".join(tokens[i:i + VALUES_PER_LINE])
+                             for i in range(VALUES_PER_LINE, len(tokens), VALUES_PER_LINE))
+        return lines
+
+    def text(self, header=""):
+        return header + "\n".join(self.lines()) + "\n"
+
+    def write(self, abi_file, header=""):
+        with open(abi_file, "w") as f:
+            f.write(self.text(header))
+
+
+def main():
+    args = sys.argv[1:]
+    try:
+        if len(args) in (3, 4) and args[0] == "get":
+            values = AbinitInput.read(args[1]).get(args[2], args[3] if len(args) == 4 else None)
+            if values is None:
+                print(f"Error: {args[2]} not found in {args[1]}")
+                sys.exit(1)
+            print(" ".join(values))
+            return
+        if len(args) >= 4 and args[0] == "remove":
+            model = AbinitInput.read(args[1])
+            model.remove(*args[3:])
+            model.write(args[2])
+            return
+        if len(args) >= 3 and args[0] == "merge":
+            model = AbinitInput()
+            for abi_file in args[2:]:
+                model.update(AbinitInput.read(abi_file))
+            model.write(args[1])
+            return
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print("Usage: python3 abinitInput.py get <abi_file> <variable> [<dataset>]")
+    print("       python3 abinitInput.py remove <abi_file> <out_file> <variable> [<variable> ...]")
+    print("       python3 abinitInput.py merge <out_file> <abi_file> [<abi_file> ...]")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
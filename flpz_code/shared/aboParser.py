@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+import re
+import sys
+import numpy as np
+from flpzTrace import span
+
+# Streaming parser for ABINIT (.abo) and anaddb output files. Each file is read once, line by
+# line, and the results are returned as NumPy arrays:
+#   parse_abo    -> total energies, cartesian forces and stress tensors per dataset
+#   parse_anaddb -> flexoelectric tensor blocks and clamped/relaxed ion piezoelectric tensors
+# Blocks whose shape does not match what anaddb documents raise a ValueError instead of being
+# silently truncated.
+
+# Usage: python3 aboParser.py etotal <abo_files_list> [<dataset>]
+#        python3 aboParser.py tensors [-p] <anaddb_output_N> [<anaddb_output_M> ...]
+#        python3 aboParser.py forces <abo_file>
+# The dataset number of each anaddb output is the suffix after its last underscore (anaddbElec_N).
+
+FLOAT = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eEdD][-+]?\d+)?"
+DATASET_RE = re.compile(r"^\s*==\s*DATASET\s+(\d+)")
+ETOTAL_RE = re.compile(r"^\s*etotal(\d*)\s+(" + FLOAT + r")\s*$")
+FORCE_ROW_RE = re.compile(r"^\s*\d+\s+(" + FLOAT + r")\s+(" + FLOAT + r")\s+(" + FLOAT + r")\s*$")
+SIGMA_RE = re.compile(r"sigma\(([123]) ([123])\)=\s*(" + FLOAT + ")")
+TENSOR_ROW_RE = re.compile(r"^\s*([xyz]{2})((?:\s+" + FLOAT + r")+)\s*$")
+PIEZO_ROW_RE = re.compile(r"^\s*(" + FLOAT + r")\s+(" + FLOAT + r")\s+(" + FLOAT + r")\s*$")
+
+FLEXO_SHAPE = (9, 6)
+PIEZO_SHAPE = (6, 3)
+
+
+def to_float(token):
+    return float(token.replace("d", "e").replace("D", "e"))
+
+
+def read_force_block(lines):
+    """Reads the rows of a 'cartesian forces' block until the first line that is not an atom row."""
+    rows = []
+    for line in lines:
+        match = FORCE_ROW_RE.match(line)
+        if not match:
+            break
+        rows.append([to_float(v) for v in match.groups()])
+    if not rows:
+        raise ValueError("Empty cartesian forces block")
+    return np.array(rows)
+
+
+def read_stress_block(lines):
+    """Reads the three sigma(i j) lines that follow the stress tensor header."""
+    stress = np.full((3, 3), np.nan)
+    for line, _ in zip(lines, range(3)):
+        for i, j, value in SIGMA_RE.findall(line):
+            stress[int(i) - 1, int(j) - 1] = stress[int(j) - 1, int(i) - 1] = to_float(value)
+    if np.isnan(stress).any():
+        raise ValueError("Incomplete stress tensor block")
+    return stress
+
+
+def parse_abo(path):
+    """Parses an ABINIT output file in a single pass.
+
+    Returns a dictionary with 'etotal' (dataset -> Ha), 'forces' (dataset -> (natom, 3) array in
+    eV/Angstrom) and 'stress' (dataset -> (3, 3) array in Ha/bohr^3).
+    """
+    results = {"etotal": {}, "forces": {}, "stress": {}}
+    dataset = 1
+    with open(path) as f:
+        for line in f:
+            match = DATASET_RE.match(line)
+            if match:
+                dataset = int(match.group(1))
+                continue
+            match = ETOTAL_RE.match(line)
+            if match:
+                results["etotal"][int(match.group(1) or 1)] = to_float(match.group(2))
+            elif "cartesian forces (eV/Angstrom)" in line:
+                results["forces"].setdefault(dataset, read_force_block(f))
+            elif "Cartesian components of stress tensor (hartree/bohr^3)" in line:
+                results["stress"].setdefault(dataset, read_stress_block(f))
+    return results
+
+
+def read_flexo_block(lines):
+    """Reads the labelled rows of a flexoelectric tensor block (e.g. 'xx  v1 ... v6')."""
+    rows = []
+    for line in lines:
+        match = TENSOR_ROW_RE.match(line)
+        if match:
+            rows.append([to_float(v) for v in match.group(2).split()])
+        elif rows:
+            break
+        elif line.strip() and not set(line.split()) <= {"xx", "yy", "zz", "yz", "xz", "xy", "zy", "zx", "yx"}:
+            raise ValueError(f"Unexpected line in flexoelectric tensor block: {line.strip()}")
+    if not rows or len({len(row) for row in rows}) != 1:
+        raise ValueError("Malformed flexoelectric tensor block")
+    return np.array(rows)
+
+
+def read_piezo_block(lines):
+    """Reads the 6x3 rows that follow a 'Proper piezoelectric constants' header."""
+    rows = []
+    for line in lines:
+        match = PIEZO_ROW_RE.match(line)
+        if match:
+            rows.append([to_float(v) for v in match.groups()])
+            if len(rows) == PIEZO_SHAPE[0]:
+                break
+        elif rows or line.strip():
+            break
+    tensor = np.array(rows)
+    if tensor.shape != PIEZO_SHAPE:
+        raise ValueError(f"Piezoelectric tensor block has shape {tensor.shape}, expected {PIEZO_SHAPE}")
+    return tensor
+
+
+def parse_anaddb(path):
+    """Parses an anaddb output file in a single pass.
+
+    Returns a dictionary with 'flexo' (block label -> array, the 'TOTAL' block is (9, 6) in nC/m),
+    'piezo_clamped' and 'piezo_relaxed' ((6, 3) arrays in C/m^2, when present).
+    """
+    results = {"flexo": {}}
+    with open(path) as f:
+        for line in f:
+            if "flexoelectric tensor" in line and "(units=" in line:
+                label = line.split("flexoelectric tensor")[0].strip()
+                results["flexo"][label] = read_flexo_block(f)
+            elif "Proper piezoelectric constants (clamped ion)" in line:
+                results["piezo_clamped"] = read_piezo_block(f)
+            elif "Proper piezoelectric constants (relaxed ion)" in line:
+                results["piezo_relaxed"] = read_piezo_block(f)
+    total = results["flexo"].get("TOTAL")
+    if total is not None and total.shape != FLEXO_SHAPE:
+        raise ValueError(f"TOTAL flexoelectric tensor has shape {total.shape}, expected {FLEXO_SHAPE}")
+    return results
+
+
+def matlab_vector(name, array):
+    """Formats an array as the column vector assignment read by the dataViewing scripts."""
+    return f"{name} = [" + "\n".join(repr(float(v)) for v in np.ravel(array)) + "];"
+
+
+def print_etotal(abo_list, dataset):
+    with open(abo_list) as f:
+        abo_files = [line.strip() for line in f if line.strip()]
+    for abo_file in abo_files:
+        try:
+            print(repr(parse_abo(abo_file)["etotal"][dataset]))
+        except (OSError, KeyError) as e:
+            print(f"Warning: no etotal{dataset} in {abo_file} ({e})", file=sys.stderr)
+
+
+def print_tensors(anaddb_file, run_piezo):
+    dataset = anaddb_file.rsplit("_", 1)[-1]
+    results = parse_anaddb(anaddb_file)
+    if not run_piezo:
+        print(f"%Flexoelectric Tensor: Dataset {dataset}\n")
+        print(matlab_vector(f"mu{dataset}", results["flexo"]["TOTAL"]))
+        print("\n\n\n")
+    print(f"%Piezoelectric Tensor: Dataset {dataset}\n")
+    print(matlab_vector(f"chi{dataset}", results["piezo_relaxed"]))
+    print("\n\n\n")
+
+
+def main():
+    args = sys.argv[1:]
+    if len(args) >= 2 and args[0] == "etotal":
+        with span("parse"):
+            print_etotal(args[1], int(args[2]) if len(args) > 2 else 1)
+    elif len(args) >= 2 and args[0] == "tensors":
+        run_piezo = args[1] == "-p"
+        with span("parse"):
+            for anaddb_file in args[2 if run_piezo else 1:]:
+                print_tensors(anaddb_file, run_piezo)
+    elif len(args) == 2 and args[0] == "forces":
+        with span("parse"):
+            for dataset, forces in parse_abo(args[1])["forces"].items():
+                print(f"Dataset {dataset}")
+                for row in forces:
+                    print(" ".join(f"{v:.10f}" for v in row))
+    else:
+        print("Usage: python3 aboParser.py etotal <abo_files_list> [<dataset>]")
+        print("       python3 aboParser.py tensors [-p] <anaddb_output_N> [<anaddb_output_M> ...]")
+        print("       python3 aboParser.py forces <abo_file>")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+import io
+import os
+import sys
+import json
+import itertools
+import contextlib
+import numpy as np
+from polyFit import design_matrix, fit
+from aboParser import parse_abo
+from datapointGen import read_input_params, amplitude_grid, load_scan, write_datapoints
+from gridSymmetry import representative_labels
+
+# Adaptive amplitude sampling for the energy and perturbation scans. Instead of computing every
+# amplitude of the uniform scan (num_datapoints + 1 amplitudes, or the grid_dim grid of a coupling
+# scan), the scan starts from a coarse subset of those amplitudes and grows batch by batch: after
+# each batch the total energies are refitted with a polynomial (a curve for one eigendisplacement,
+# a surface for two) and the next batch goes to the amplitudes where the fit is least certain,
+# weighted towards high curvature. The batch is picked greedily, each pick counting as observed for
+# the next ones, so a batch spreads over the scan instead of piling up. Sampling stops once the well
+# depth and the position of the minimum of two consecutive fits agree within the user tolerances,
+# or when the whole uniform scan has been computed. Datapoints keep the labels of the uniform scan,
+# so their inputs, cached results and catalog entries are the ones a uniform scan would produce.
+#
+# Input file keywords (in the vector input file):
+#   sampling adaptive        turns adaptive sampling on
+#   batch_size <n>           datapoints per batch (default array_throttle, else 4)
+#   initial_points <n>       coarse datapoints (default 6, or 3 per eigendisplacement for a coupling scan)
+#   depth_tol <Ha>           tolerance on the well depth (default 1e-5)
+#   position_tol <amplitude> tolerance on the position of the minimum (default 1% of the scan range)
+
+# Usage: python3 adaptiveSampling.py [-p] <pert/energy> <vec_input_file>
+# Every call is one step of the loop run by datapointCalcofPert.sh and datapointCalcofEnergy.sh:
+# the first call writes the inputs of the coarse batch, later calls fit the energies of the finished
+# datapoints and write the next batch. The .abo files of the new batch are listed in
+# adaptiveBatch_vec<N>.in, which is left empty once sampling has stopped.
+
+DEFAULT_BATCH_SIZE = 4
+DEFAULT_DEPTH_TOL = 1e-5
+# Default position tolerance as a fraction of the scan range
+DEFAULT_POSITION_TOL = 0.01
+MAX_DEGREE_1D = 6
+MAX_DEGREE_2D = 4
+# Points per axis of the grid the fitted minimum is searched on
+SEARCH_POINTS_1D = 2001
+SEARCH_POINTS_2D = 201
+
+
+def state_file(vecNum):
+    return f"adaptiveSampling_vec{vecNum}.json"
+
+
+def batch_file(vecNum):
+    return f"adaptiveBatch_vec{vecNum}.in"
+
+
+def is_adaptive(params):
+    return params.get("sampling", ["uniform"])[0].lower() == "adaptive"
+
+
+def read_state(vecNum):
+    if not os.path.isfile(state_file(vecNum)):
+        return {"labels": [], "fits": [], "stopped": ""}
+    with open(state_file(vecNum)) as f:
+        return json.load(f)
+
+
+def write_state(vecNum, state):
+    with open(state_file(vecNum), "w") as f:
+        json.dump(state, f, indent=1)
+
+
+def candidate_grid(params):
+    """The amplitudes and labels of the uniform scan, which adaptive sampling picks its datapoints from."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return amplitude_grid(params)
+
+
+def planned_datapoints(params):
+    """Amplitudes and labels of the datapoints calculated in a scan: the uniform scan (one datapoint per
+    orbit of a symmetry reduced grid), or the datapoints sampled so far."""
+    amplitudes, labels = candidate_grid(params)
+    if is_adaptive(params):
+        sampled = set(read_state(params.get("vecNum", [""])[0])["labels"])
+    else:
+        sampled = set(representative_labels(params, labels))
+    keep = [i for i, label in enumerate(labels) if label in sampled]
+    return amplitudes[keep], [labels[i] for i in keep]
+
+
+def sampling_settings(params, amplitudes):
+    span = amplitudes.max(axis=0) - amplitudes.min(axis=0)
+    throttle = params.get("array_throttle", [str(DEFAULT_BATCH_SIZE)])[0]
+    initial = 6 if amplitudes.shape[1] == 1 else 3
+    return {"batch_size": int(params.get("batch_size", [throttle])[0]),
+            "initial_points": int(params.get("initial_points", [initial])[0]),
+            "depth_tol": float(params.get("depth_tol", [DEFAULT_DEPTH_TOL])[0]),
+            "position_tol": float(params.get("position_tol", [DEFAULT_POSITION_TOL * np.linalg.norm(span)])[0])}
+
+
+def coarse_indices(amplitudes, initial_points):
+    """Indices of the candidates nearest to a uniform coarse grid spanning the scan (initial_points per axis
+    for a coupling scan)."""
+    lower, upper = amplitudes.min(axis=0), amplitudes.max(axis=0)
+    axes = [np.linspace(lo, hi, max(initial_points, 2)) for lo, hi in zip(lower, upper)]
+    targets = np.array(list(itertools.product(*axes)))
+    scale = np.where(upper > lower, upper - lower, 1.0)
+    distances = np.linalg.norm((amplitudes[None, :, :] - targets[:, None, :]) / scale, axis=-1)
+    return sorted(set(np.argmin(distances, axis=1).tolist()))
+
+
+def polynomial_exponents(nvariables, npoints):
+    """Exponent matrix of the richest polynomial the sampled points can fit with a spare degree of freedom."""
+    if nvariables == 1:
+        degree = max(2, min(MAX_DEGREE_1D, npoints - 2))
+        return np.arange(degree + 1)[:, None]
+    degree = 2
+    while degree < MAX_DEGREE_2D and (degree + 2) * (degree + 3) // 2 <= npoints - 1:
+        degree += 1
+    return np.array([(i, total - i) for total in range(degree + 1) for i in range(total, -1, -1)])
+
+
+def laplacian_rows(exponents, points):
+    """Design rows of the sum of the second derivatives of every term along every variable."""
+    rows = 0.0
+    for k in range(exponents.shape[1]):
+        factor = exponents[:, k] * (exponents[:, k] - 1)
+        lowered = exponents.copy()
+        lowered[:, k] = np.maximum(lowered[:, k] - 2, 0)
+        rows = rows + design_matrix(lowered, *points.T) * factor
+    return rows
+
+
+def fit_energies(amplitudes, energies):
+    exponents = polynomial_exponents(amplitudes.shape[1], len(energies))
+    result = fit(exponents, list(amplitudes.T), energies)
+    return exponents, result["coefficients"]
+
+
+def well_summary(amplitudes, exponents, coefficients):
+    """Position of the minimum of a fit over the scan and its depth below the fit at zero amplitude
+    (or the scan point closest to it)."""
+    lower, upper = amplitudes.min(axis=0), amplitudes.max(axis=0)
+    npoints = SEARCH_POINTS_1D if amplitudes.shape[1] == 1 else SEARCH_POINTS_2D
+    axes = np.meshgrid(*[np.linspace(lo, hi, npoints) for lo, hi in zip(lower, upper)], indexing="ij")
+    search = np.column_stack([axis.ravel() for axis in axes])
+    energies = design_matrix(exponents, *search.T) @ coefficients
+    minimum = search[np.argmin(energies)]
+    reference = np.clip(np.zeros(amplitudes.shape[1]), lower, upper)
+    depth = design_matrix(exponents, *reference) @ coefficients - energies.min()
+    return minimum, float(depth)
+
+
+def propose_batch(amplitudes, sampled, exponents, coefficients, batch_size):
+    """Greedily picks the batch among the unsampled candidates. The score is the prediction standard
+    deviation of the fit (up to the common residual variance factor) weighted by the curvature, and
+    every pick joins the fitted points before the next one is scored."""
+    scale = np.where(np.ptp(amplitudes, axis=0) > 0, np.ptp(amplitudes, axis=0), 1.0)
+    rows = design_matrix(exponents, *(amplitudes / scale).T)
+    curvature = np.abs(laplacian_rows(exponents, amplitudes) @ coefficients)
+    weight = 1.0 + curvature / curvature.max() if curvature.max() > 0 else np.ones(len(amplitudes))
+
+    chosen = list(sampled)
+    batch = []
+    for _ in range(batch_size):
+        candidates = np.setdiff1d(np.arange(len(amplitudes)), chosen)
+        if len(candidates) == 0:
+            break
+        inverse = np.linalg.pinv(rows[chosen].T @ rows[chosen])
+        variance = np.einsum("ij,jk,ik->i", rows[candidates], inverse, rows[candidates])
+        pick = candidates[np.argmax(np.sqrt(np.maximum(variance, 0.0)) * weight[candidates])]
+        batch.append(int(pick))
+        chosen.append(int(pick))
+    return batch
+
+
+def finished_energy(abo_file):
+    """Total energy of a finished datapoint (first dataset) or None."""
+    try:
+        etotal = parse_abo(abo_file)["etotal"]
+    except (OSError, ValueError):
+        return None
+    return etotal[min(etotal)] if etotal else None
+
+
+def step(program, run_piezo, input_file):
+    """Runs one sampling step and returns the .abo files of the new batch (empty once sampling has stopped)."""
+    params, _ = read_input_params(input_file)
+    structure = params["name"][0].lower()
+    vecNum = params.get("vecNum", [""])[0]
+    amplitudes, labels = candidate_grid(params)
+    settings = sampling_settings(params, amplitudes)
+    state = read_state(vecNum)
+    index = {label: i for i, label in enumerate(labels)}
+    sampled = [index[label] for label in state["labels"]]
+
+    if not sampled:
+        batch = coarse_indices(amplitudes, settings["initial_points"])
+        print(f"Adaptive sampling: coarse batch of {len(batch)} of {len(labels)} datapoints")
+    elif state["stopped"]:
+        batch = []
+    else:
+        energies = {i: finished_energy(f"{structure}_{labels[i]}_vec{vecNum}.abo") for i in sampled}
+        finished = [i for i in sampled if energies[i] is not None]
+        if len(finished) < len(sampled):
+            print(f"Adaptive sampling: {len(sampled) - len(finished)} datapoints have no total energy and are "
+                  f"left out of the fit")
+        if len(finished) < 3:
+            raise ValueError(f"only {len(finished)} datapoints of vector {vecNum} have a total energy")
+        exponents, coefficients = fit_energies(amplitudes[finished], np.array([energies[i] for i in finished]))
+        minimum, depth = well_summary(amplitudes, exponents, coefficients)
+        state["fits"].append({"points": len(finished), "minimum": minimum.tolist(), "depth": depth})
+        print(f"Adaptive sampling: fit of {len(finished)} datapoints has its minimum at "
+              f"{' '.join(f'{a:.6g}' for a in minimum)} with well depth {depth:.6g} Ha")
+
+        if len(state["fits"]) > 1:
+            previous = state["fits"][-2]
+            depth_change = abs(depth - previous["depth"])
+            position_change = float(np.linalg.norm(minimum - np.array(previous["minimum"])))
+            if depth_change <= settings["depth_tol"] and position_change <= settings["position_tol"]:
+                state["stopped"] = (f"converged (depth changed by {depth_change:.3g} Ha, minimum moved by "
+                                    f"{position_change:.3g})")
+        if not state["stopped"] and len(sampled) == len(labels):
+            state["stopped"] = "every datapoint of the uniform scan was computed"
+        batch = [] if state["stopped"] else propose_batch(amplitudes, sampled, exponents, coefficients,
+                                                          settings["batch_size"])
+
+    new_labels = [labels[i] for i in batch]
+    abo_files = []
+    if new_labels:
+        state["labels"] += new_labels
+        keep = sorted(sampled + batch)
+        with contextlib.redirect_stdout(io.StringIO()):
+            scan = load_scan(input_file)
+        abo_files = write_datapoints(program, run_piezo, scan, amplitudes[keep], [labels[i] for i in keep],
+                                     new_labels)
+        abo_files = [abo_file for abo_file, i in zip(abo_files, keep) if i in batch]
+        print(f"Adaptive sampling: batch of {len(batch)} datapoints ({len(state['labels'])} of {len(labels)})")
+    elif state["stopped"]:
+        print(f"Adaptive sampling stopped after {len(state['labels'])} of {len(labels)} datapoints: "
+              f"{state['stopped']}")
+    write_state(vecNum, state)
+    with open(batch_file(vecNum), "w") as f:
+        f.write("".join(abo_file + "\n" for abo_file in abo_files))
+    return abo_files
+
+
+def main():
+    args = sys.argv[1:]
+    run_piezo = False
+    if args and args[0] == "-p":
+        run_piezo = True
+        args = args[1:]
+    if len(args) != 2 or args[0] not in ("pert", "energy"):
+        print("Usage: python3 adaptiveSampling.py [-p] <pert/energy> <vec_input_file>")
+        sys.exit(1)
+    try:
+        step(args[0], run_piezo, args[1])
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+import os
+import sys
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flpzTrace import span
+
+# Runs the anaddb post-processing of every datapoint in parallel. For each datapoint the DS4 and
+# DS5 DDBs are merged with mrgddb and a single anaddb run extracts the elastic, piezoelectric,
+# internal strain and flexoelectric tensors. Every run works in its own scratch directory so the
+# fort.7 and _anaddb.nc files written by anaddb never collide. Every run is an anaddb span of the
+# run's trace (flpzTrace.py).
+
+# Usage: python3 anaddbPool.py [-p] <datasets_file> [<nworkers>]
+
+SCRATCH_DIR = "anaddb_scratch"
+
+ANADDB_INPUT = """! Input file for the anaddb code
+
+elaflag 3  ! flag for the elastic constant
+piezoflag 3 !the flag for the piezoelectric constant
+instrflag 1 ! the flag for the internal strain tensor
+"""
+
+FLEXO_INPUT = """flexoflag 1 ! flag for the flexoelectric tensor
+"""
+
+
+def parse_args():
+    args = sys.argv[1:]
+    run_piezo = False
+    if args and args[0] == "-p":
+        run_piezo = True
+        args = args[1:]
+    if len(args) not in (1, 2):
+        print("Usage: python3 anaddbPool.py [-p] <datasets_file> [<nworkers>]")
+        sys.exit(1)
+    nworkers = int(args[1]) if len(args) == 2 else available_cores()
+    return run_piezo, args[0], nworkers
+
+
+def available_cores():
+    """Number of cores this process may use (respects SLURM/cgroup affinity)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def read_datasets(datasets_file, run_piezo):
+    """Groups the DDB names of the datasets file into (DS4,) or (DS4, DS5) tuples per datapoint."""
+    with open(datasets_file) as f:
+        names = [line.strip() for line in f.read().splitlines()[1:] if line.strip()]
+    stride = 1 if run_piezo else 2
+    if len(names) % stride != 0:
+        raise ValueError(f"{datasets_file} does not list a DS5 DDB for every DS4 DDB")
+    return [tuple(names[i:i + stride]) for i in range(0, len(names), stride)]
+
+
+def merge_ddbs(scratch, ddbs):
+    """Merges the DDBs of one datapoint with mrgddb and returns the merged DDB path."""
+    merged = os.path.join(scratch, "merged_DDB")
+    mrgddb_input = "merged_DDB\nMerged DS4 and DS5 DDBs\n{}\n{}\n".format(
+        len(ddbs), "\n".join(os.path.abspath(ddb) for ddb in ddbs))
+    with open(os.path.join(scratch, "mrgddb.log"), "w") as log:
+        subprocess.run(["mrgddb"], input=mrgddb_input, text=True, cwd=scratch,
+                       stdout=log, stderr=subprocess.STDOUT, check=True)
+    return merged
+
+
+def run_datapoint(dataset, ddbs, run_piezo):
+    """Runs mrgddb (if needed) and anaddb for one datapoint inside its own scratch directory."""
+    scratch = os.path.abspath(os.path.join(SCRATCH_DIR, f"dataset_{dataset}"))
+    os.makedirs(scratch, exist_ok=True)
+    output = os.path.abspath(f"anaddbElec_{dataset}")
+
+    missing = [ddb for ddb in ddbs if not os.path.isfile(ddb)]
+    if missing:
+        return dataset, f"missing {' '.join(missing)}"
+
+    try:
+        ddb = os.path.abspath(ddbs[0]) if run_piezo else merge_ddbs(scratch, ddbs)
+    except subprocess.CalledProcessError:
+        return dataset, f"mrgddb failed, see {scratch}/mrgddb.log"
+
+    with open(os.path.join(scratch, "anaddb.abi"), "w") as f:
+        f.write(ANADDB_INPUT if run_piezo else ANADDB_INPUT + FLEXO_INPUT)
+    with open(os.path.join(scratch, "anaddb.files"), "w") as f:
+        f.write(f"anaddb.abi\n{output}\n{ddb}\ndummy1\ndummy2\ndummy3\ndummy4\n")
+
+    with open(os.path.join(scratch, "anaddb.files")) as stdin, \
+            open(os.path.join(scratch, "anaddb.log"), "w") as log:
+        proc = subprocess.run(["anaddb"], stdin=stdin, stdout=log, stderr=subprocess.STDOUT, cwd=scratch)
+    if proc.returncode != 0 or not os.path.isfile(output):
+        return dataset, f"anaddb failed, see {scratch}/anaddb.log"
+    return dataset, None
+
+
+def run_traced(dataset, ddbs, run_piezo):
+    """run_datapoint recorded as an anaddb span of the datapoint (the prefix of its DS4 DDB)."""
+    with span("anaddb", datapoint=os.path.basename(ddbs[0]).split("o_DS")[0]) as details:
+        dataset, error = run_datapoint(dataset, ddbs, run_piezo)
+        details["status"] = 1 if error else 0
+    return dataset, error
+
+
+def run_pool(datapoints, run_piezo, nworkers):
+    """Fans the anaddb runs out over a bounded pool and returns the failed datapoints. Datapoints whose
+    DDBs are the same files (the linked datapoints of a symmetry reduced grid) share one run."""
+    failures = {}
+    first, copies = {}, {}
+    for dataset, ddbs in enumerate(datapoints, 1):
+        key = tuple(os.path.realpath(ddb) for ddb in ddbs)
+        if key in first:
+            copies[dataset] = first[key]
+        else:
+            first[key] = dataset
+    # Each worker only waits on its anaddb child process, so threads are enough to keep
+    # nworkers anaddb processes running at once.
+    with ThreadPoolExecutor(max_workers=max(1, nworkers)) as pool:
+        futures = [pool.submit(run_traced, dataset, datapoints[dataset - 1], run_piezo)
+                   for dataset in first.values()]
+        for future in as_completed(futures):
+            dataset, error = future.result()
+            if error:
+                print(f"Error: dataset {dataset}: {error}")
+                failures[dataset] = error
+            else:
+                print(f"Processed dataset {dataset}")
+    for dataset, source in copies.items():
+        if source in failures:
+            failures[dataset] = failures[source]
+        else:
+            shutil.copyfile(f"anaddbElec_{source}", f"anaddbElec_{dataset}")
+            print(f"Processed dataset {dataset} (same DDBs as dataset {source})")
+    return failures
+
+
+def main():
+    run_piezo, datasets_file, nworkers = parse_args()
+    for program in ["anaddb"] + ([] if run_piezo else ["mrgddb"]):
+        if shutil.which(program) is None:
+            print(f"Error: {program} is not installed or not in PATH")
+            sys.exit(1)
+
+    datapoints = read_datasets(datasets_file, run_piezo)
+    print(f"Running anaddb on {len(datapoints)} datapoints with {nworkers} workers")
+    failures = run_pool(datapoints, run_piezo, nworkers)
+    if len(failures) == len(datapoints):
+        sys.exit(1)
+    if not failures:
+        shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/bin/bash
+# Submits a whole scan as a single job array instead of one submission per datapoint
+# Line N+1 of the task list is handed to array task N as $task, and the command is run with it
+# The array goes through executors.py, so it runs on SLURM or on the local executor (FLPZ_EXECUTOR)
+# Usage: ./arraySubmit.sh [-t <throttle>] [-d <dependency>] [-c <cores>] [-r <resource>] [-k] <task_list> <script_name> <preamble_file> <command>
+# Example: ./arraySubmit.sh -t 10 tasks.in b-script-array preamble.txt 'abinit "${task}.abi" >& "${task}.log"'
+# The dependency is handed to sbatch --dependency (e.g. aftercorresponding:<job_id>); tasks whose
+# dependency can never be satisfied are cancelled instead of staying pending
+# The cores of a task are only read by the local executor, for commands that start mpirun indirectly
+# Each -r passes a resource request of every task to executors.py (e.g. -r --time=02:30:00 -r --ntasks=8)
+# Every task records a job span of its task in the run's trace (flpzTrace.py)
+# With -k every task exits 0 whatever the status of its command (still recorded in the trace), so the
+# tasks of a later array that depend on it through aftercorresponding run even when it failed
+# Prints the array job id on success
+
+throttle=""
+dependency_opts=()
+cores_opts=()
+resource_opts=()
+release="false"
+while [ "$1" = "-t" ] || [ "$1" = "-d" ] || [ "$1" = "-c" ] || [ "$1" = "-r" ] || [ "$1" = "-k" ]; do
+    if [ "$1" = "-k" ]; then
+        release="true"
+        shift
+        continue
+    fi
+    if [ "$1" = "-t" ]; then
+        throttle="$2"
+    elif [ "$1" = "-d" ]; then
+        dependency_opts=(--dependency="$2" --kill-on-invalid-dep=yes)
+    elif [ "$1" = "-c" ]; then
+        cores_opts=(--local-cores="$2")
+    else
+        resource_opts+=("$2")
+    fi
+    shift 2
+done
+
+# Function to check correct number of arguments
+check_args() {
+    if [ "$#" -ne 4 ]; then
+        echo "Usage: $0 [-t <throttle>] [-d <dependency>] [-c <cores>] [-r <resource>] [-k] <task_list> <script_name> <preamble_file> <command>" >&2
+        exit 1
+    fi
+}
+
+# Function to write the array script that maps SLURM_ARRAY_TASK_ID to a line of the task list
+write_array_script() {
+    local task_list="$1"
+    local script="$2"
+    local preamble_file="$3"
+    local command="$4"
+    local preamble exit_status="\"\$status\""
+    preamble=$(<"$preamble_file")
+    if [ "$release" = "true" ]; then
+        exit_status="0"
+    fi
+
+    cat <<EOF >"${script}"
+#!/bin/bash
+$preamble
+
+cd "$(pwd)" || exit 1
+task=\$(sed -n "\$((SLURM_ARRAY_TASK_ID + 1))p" "${task_list}")
+if [ -z "\$task" ]; then
+    echo "No task for array index \$SLURM_ARRAY_TASK_ID in ${task_list}"
+    exit 1
+fi
+trace_start=\$(date +%s.%N)
+$command
+status=\$?
+python3 "$(pwd)/flpzTrace.py" record -d "\$task" -s "\$status" job "\$trace_start"
+exit ${exit_status}
+EOF
+}
+
+# Main execution
+check_args "$@"
+task_list="$1"
+script="$2"
+preamble_file="$3"
+command="$4"
+
+if [ ! -f "$task_list" ] || [ ! -f "$preamble_file" ]; then
+    echo "Error: task list '$task_list' or preamble '$preamble_file' not found" >&2
+    exit 1
+fi
+
+num_tasks=$(grep -c . "$task_list")
+if [ "$num_tasks" -eq 0 ]; then
+    echo "Error: task list '$task_list' is empty" >&2
+    exit 1
+fi
+
+array_range="0-$((num_tasks - 1))"
+if [ -n "$throttle" ]; then
+    array_range="${array_range}%${throttle}"
+fi
+
+write_array_script "$task_list" "$script" "$preamble_file" "$command"
+job_id=$(python3 executors.py submit "${cores_opts[@]}" --array="$array_range" "${dependency_opts[@]}" "${resource_opts[@]}" "$script" | awk '{print $4}')
+if [ -z "$job_id" ]; then
+    echo "Error: no job id was returned for $script" >&2
+    exit 1
+fi
+echo "$job_id"
@@ -15,7 +15,6 @@ read_input_params() {
     local input_file="$1"
     general_structure_file=$(grep "genstruc" "$input_file" | awk '{print $2}')
 #   time_limit=$(grep "time_limit" "$input_file" | awk '{print $2}')
-    ntypat=$(grep "ntypat" "$general_structure_file" | awk '{print $2}')
     bScriptPreamble=$(grep "sbatch_preamble" "$input_file" | awk '{print $2}')
 
 }
@@ -27,14 +26,13 @@ setup_boilerplate() {
         echo "Error: General structure file '$general_structure_file' not found"
         exit 1
     fi
-    pp_dirpath=$(grep "pp_dirpath" "$general_structure_file" | awk '{print $2}' | sed 's/[,"]//g')
+    pp_dirpath=$(python3 "$script_dir/abinitInput.py" get "$general_structure_file" pp_dirpath | tr -d '",')
     if [ -z "$pp_dirpath" ]; then
         echo "Error: pp_dirpath not found in $general_structure_file"
         exit 1
     fi
 
-    for i in $(seq 2 $((ntypat + 1))); do
-        pseudos=$(grep "pseudos" "$general_structure_file" | awk "{print \$$i}" | sed 's/[,"]//g')
+    for pseudos in $(python3 "$script_dir/abinitInput.py" get "$general_structure_file" pseudos | tr -d '",'); do
         cp -r "${pp_dirpath}${pseudos}" boilerplate/
     done
 }
@@ -50,32 +48,19 @@ mpirun -hosts=localhost -np  $SLURM_NTASKS  abinit  DISTNAME.abi >& log
 EOF
 }
 
-# Function to prepare template.abi
+# Function to prepare template.abi: the general structure without its cell, which each distortion supplies
 prepare_template() {
     if [ ! -f "$general_structure_file" ]; then
         echo "Error: General structure file '$general_structure_file' not found"
         exit 1
     fi
-    cp "$general_structure_file" boilerplate/template.abi
-    sed -i '/acell/c\CELLDEF' boilerplate/template.abi
-    sed -i '/natom/d; /ntypat/d; /typat/d; /znucl/d' boilerplate/template.abi
-
-    local vars=("rprim" "xred" "xcart")
-    for var in "${vars[@]}"; do
-        if grep -q "^[[:space:]]*$var" boilerplate/template.abi; then
-            start_line=$(grep -n "$var" boilerplate/template.abi | cut -d: -f1)
-            if [ "$var" = "rprim" ]; then
-                end_line=$((start_line + 3))
-            else
-                end_line=$((start_line + $(grep "natom" "$general_structure_file" | awk '{print $2}')))
-            fi
-            sed -i "${start_line},${end_line}d" boilerplate/template.abi
-        fi
-    done
+    python3 "$script_dir/abinitInput.py" remove "$general_structure_file" boilerplate/template.abi \
+        acell rprim xred xcart natom ntypat typat znucl
 }
 
 # Main execution
 check_args "$@"
+script_dir=$(dirname "$0")
 read_input_params "$1"
 
 # Read preamble content
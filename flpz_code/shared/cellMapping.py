@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+import sys
+import numpy as np
+from scipy.spatial import cKDTree
+from crystalGeometry import read_cell
+
+# Maps the atoms of a target cell (usually a supercell) onto the atoms of an original cell under
+# periodic boundary conditions. The target positions are folded into the original cell and matched
+# against a KD-tree of the 27 neighbouring images of every original atom, one tree per species, so
+# mapping an N-atom supercell costs O(N log n) instead of comparing every image with every atom.
+# For every target atom the mapping returns the original atom it sits on, the offset vector between
+# the two (bohr) and the integer lattice translation (in original lattice vectors) that carries the
+# original atom onto it. Any species and any number of atoms are supported.
+
+# Usage: python3 cellMapping.py map [-t <tolerance>] <original_abi> <target_abi>
+#        python3 cellMapping.py gather <index> [<index> ...]     (reads the rows to expand from stdin)
+# map prints the 1-based mapping on the line after "Mapping:", then the offsets and translations.
+# gather prints row <index> (1-based) of stdin for every index given, e.g. an eigendisplacement
+# of the original cell expanded onto the target cell.
+
+DEFAULT_TOLERANCE = 0.2
+# Images of the original cell searched around a folded target position
+IMAGE_SHIFTS = np.array(np.meshgrid([-1, 0, 1], [-1, 0, 1], [-1, 0, 1], indexing="ij")).reshape(3, -1).T
+
+
+def read_structure(abi_file):
+    """Returns the lattice vectors (rows, bohr), reduced coordinates and typat of an ABINIT input."""
+    cell = read_cell(abi_file)
+    return cell["rprimd"], cell["xred"], cell["typat"]
+
+
+def map_cells(original_lattice, original_xred, target_lattice, target_xred,
+              original_types=None, target_types=None, tolerance=DEFAULT_TOLERANCE):
+    """Maps every target atom onto an atom of the original cell.
+
+    Returns (mapping, offsets, translations): the 0-based index of the original atom matched by each
+    target atom, the cartesian offset target - matched image (bohr) and the integer translation T
+    such that target_xcart ~= (original_xred[mapping] + T) @ original_lattice. Raises a ValueError
+    when an atom has no original atom of its species within tolerance (bohr).
+    """
+    original_lattice = np.asarray(original_lattice, dtype=float)
+    original_xred = np.asarray(original_xred, dtype=float)
+    target_xcart = np.asarray(target_xred, dtype=float) @ np.asarray(target_lattice, dtype=float)
+    original_types = np.ones(len(original_xred), dtype=int) if original_types is None else np.asarray(original_types)
+    target_types = np.ones(len(target_xcart), dtype=int) if target_types is None else np.asarray(target_types)
+
+    # Fold both cells into the unit cell of the original lattice
+    target_frac = target_xcart @ np.linalg.inv(original_lattice)
+    target_cells = np.floor(target_frac)
+    folded_target = (target_frac - target_cells) @ original_lattice
+    original_cells = np.floor(original_xred)
+    folded_original = original_xred - original_cells
+
+    mapping = np.full(len(target_xcart), -1, dtype=int)
+    shifts = np.zeros((len(target_xcart), 3))
+    distances = np.full(len(target_xcart), np.inf)
+    for species in np.unique(target_types):
+        atoms = np.flatnonzero(original_types == species)
+        targets = np.flatnonzero(target_types == species)
+        if len(atoms) == 0:
+            continue
+        # Every image of every original atom of this species, ordered image-major
+        images = (folded_original[atoms][None, :, :] + IMAGE_SHIFTS[:, None, :]).reshape(-1, 3)
+        distances[targets], nearest = cKDTree(images @ original_lattice).query(folded_target[targets])
+        mapping[targets] = atoms[nearest % len(atoms)]
+        shifts[targets] = IMAGE_SHIFTS[nearest // len(atoms)]
+
+    unmatched = np.flatnonzero(distances > tolerance)
+    if len(unmatched):
+        raise ValueError(f"Target atoms {' '.join(str(a + 1) for a in unmatched)} have no original atom "
+                         f"within {tolerance} bohr")
+    translations = (target_cells + shifts - original_cells[mapping]).astype(int)
+    offsets = target_xcart - (original_xred[mapping] + translations) @ original_lattice
+    return mapping, offsets, translations
+
+
+def gather_rows(rows, mapping):
+    """Expands per-atom rows of the original cell onto the target cell in one gather (mapping is 0-based)."""
+    return np.asarray(rows)[np.asarray(mapping)]
+
+
+def map_files(original_abi, target_abi, tolerance=DEFAULT_TOLERANCE):
+    original_lattice, original_xred, original_types = read_structure(original_abi)
+    target_lattice, target_xred, target_types = read_structure(target_abi)
+    return map_cells(original_lattice, original_xred, target_lattice, target_xred,
+                     original_types, target_types, tolerance)
+
+
+def main():
+    args = sys.argv[1:]
+    tolerance = DEFAULT_TOLERANCE
+    if len(args) == 5 and args[0] == "map" and args[1] == "-t":
+        tolerance = float(args[2])
+        args = [args[0]] + args[3:]
+    if len(args) == 3 and args[0] == "map":
+        try:
+            mapping, offsets, translations = map_files(args[1], args[2], tolerance)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print("Mapping:")
+        print(" ".join(str(i + 1) for i in mapping))
+        print("\nOffsets:")
+        for row in offsets:
+            print(" ".join(f"{x:.10f}" for x in row))
+        print("\nTranslations:")
+        for row in translations:
+            print(" ".join(str(n) for n in row))
+    elif len(args) >= 2 and args[0] == "gather":
+        mapping = np.array(args[1:], dtype=int) - 1
+        rows = [line.rstrip("\n") for line in sys.stdin if line.strip()]
+        if mapping.size and (mapping.min() < 0 or mapping.max() >= len(rows)):
+            print(f"Error: mapping refers to rows outside the {len(rows)} rows given")
+            sys.exit(1)
+        for row in gather_rows(rows, mapping):
+            print(row)
+    else:
+        print("Usage: python3 cellMapping.py map [-t <tolerance>] <original_abi> <target_abi>")
+        print("       python3 cellMapping.py gather <index> [<index> ...]")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
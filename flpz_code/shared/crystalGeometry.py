@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+import sys
+import shlex
+import numpy as np
+from abinitInput import AbinitInput
+
+# Crystal geometry in one importable module, replacing the xCartxRed.py, findAngle.py and
+# rprimDiagonalization.py subprocesses of the shell scripts. Every function accepts stacks of
+# structures (leading batch dimensions), so the coordinates of a whole scan are converted at once:
+#   lattice_vectors      acell, rprim -> rprimd (the i-th primitive vector scaled by acell(i))
+#   xred_to_xcart        reduced -> cartesian coordinates
+#   xcart_to_xred        cartesian -> reduced coordinates
+#   lattice_parameters   rprimd -> lengths a, b, c and angles alpha, beta, gamma (degrees)
+#   normalize_rprim      rprim -> acell and unit primitive vectors
+#   diagonalize_rprim    axis aligned rprim -> rows reordered into diagonal form
+# The command line handles any number of files in one process, and "serve" keeps one process alive
+# that answers commands read line by line from stdin, so shell loops pay no interpreter startup.
+
+# Usage: python3 crystalGeometry.py convert <xred/xcart> <abi_file> [<abi_file> ...]
+#        python3 crystalGeometry.py lattice <abi_file> [<abi_file> ...]
+#        python3 crystalGeometry.py findsym-input <abi_file> [<abi_file> ...]
+#        python3 crystalGeometry.py serve
+# convert rewrites the coordinates of each file in place (through the model of abinitInput.py, so
+# comments are not kept), findsym-input writes <name>_findsym.in for each file. serve reads one
+# command per line (e.g. "convert xred cell.abi") and ends the output of every command with a line
+# holding only END.
+
+COORD_FORMAT = "{:.10f}"
+
+
+def lattice_vectors(acell, rprim):
+    """Primitive vectors in rows scaled by acell: rprimd[..., i, :] = acell[..., i] * rprim[..., i, :]."""
+    return np.asarray(rprim, dtype=float) * np.asarray(acell, dtype=float)[..., :, None]
+
+
+def xred_to_xcart(xred, rprimd):
+    return np.einsum("...aj,...jk->...ak", np.asarray(xred, dtype=float), np.asarray(rprimd, dtype=float))
+
+
+def xcart_to_xred(xcart, rprimd):
+    # xcart = xred @ rprimd, so xred^T solves rprimd^T xred^T = xcart^T
+    rprimd = np.asarray(rprimd, dtype=float)
+    return np.swapaxes(np.linalg.solve(np.swapaxes(rprimd, -1, -2), np.swapaxes(xcart, -1, -2)), -1, -2)
+
+
+def angle_between(v1, v2):
+    """Angle in degrees between vectors along the last axis."""
+    v1, v2 = np.asarray(v1, dtype=float), np.asarray(v2, dtype=float)
+    cosine = np.sum(v1 * v2, axis=-1) / (np.linalg.norm(v1, axis=-1) * np.linalg.norm(v2, axis=-1))
+    return np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0)))
+
+
+def lattice_parameters(rprimd):
+    """Returns the lengths (a, b, c) and angles (alpha, beta, gamma) in degrees of the lattice vectors."""
+    rprimd = np.asarray(rprimd, dtype=float)
+    a1, a2, a3 = rprimd[..., 0, :], rprimd[..., 1, :], rprimd[..., 2, :]
+    lengths = np.linalg.norm(rprimd, axis=-1)
+    angles = np.stack((angle_between(a2, a3), angle_between(a1, a3), angle_between(a1, a2)), axis=-1)
+    return lengths, angles
+
+
+def normalize_rprim(rprim):
+    """Splits primitive vectors into their lengths (acell) and unit vectors (rprim)."""
+    rprim = np.asarray(rprim, dtype=float)
+    acell = np.linalg.norm(rprim, axis=-1)
+    return acell, rprim / acell[..., None]
+
+
+def diagonalize_rprim(rprim, tol=1e-8):
+    """Reorders axis aligned primitive vectors (one nonzero entry per row) so the matrix is diagonal.
+
+    Returns the reordered matrix and the row permutation; other matrices are returned unchanged.
+    """
+    rprim = np.asarray(rprim, dtype=float)
+    nonzero = np.abs(rprim) > tol
+    if not (nonzero.sum(axis=1) == 1).all() or not (nonzero.sum(axis=0) == 1).all():
+        return rprim, np.arange(3)
+    permutation = np.argmax(nonzero, axis=0)
+    return rprim[permutation], permutation
+
+
+def cell_from_input(structure):
+    """Returns acell, rprim, typat and the reduced and cartesian coordinates of a parsed ABINIT input."""
+    if "natom" not in structure:
+        raise ValueError("Could not find natom")
+    natom = int(structure.scalar("natom"))
+    acell = structure.array("acell", default=[1.0, 1.0, 1.0])[:3]
+    rprim = structure.array("rprim", shape=(3, 3), default=np.eye(3))
+    rprimd = lattice_vectors(acell, rprim)
+    if "xred" in structure:
+        xred = structure.array("xred", shape=(natom, 3))
+        xcart = xred_to_xcart(xred, rprimd)
+    elif "xcart" in structure:
+        xcart = structure.array("xcart", shape=(natom, 3))
+        xred = xcart_to_xred(xcart, rprimd)
+    else:
+        raise ValueError("Neither xred nor xcart coordinates found")
+    typat = structure.array("typat", default=np.ones(natom))[:natom].astype(int)
+    return {"natom": natom, "acell": acell, "rprim": rprim, "rprimd": rprimd, "typat": typat,
+            "xred": xred, "xcart": xcart, "coord_type": "xred" if "xred" in structure else "xcart"}
+
+
+def read_cell(abi_file):
+    try:
+        return cell_from_input(AbinitInput.read(abi_file))
+    except (KeyError, ValueError) as e:
+        raise ValueError(f"{e} in {abi_file}")
+
+
+def format_rows(values):
+    return [" ".join(COORD_FORMAT.format(v) for v in row) for row in values]
+
+
+def convert_files(abi_files, coord_type):
+    """Rewrites the coordinates of every file in place as xred or xcart. Returns the files changed."""
+    other = "xcart" if coord_type == "xred" else "xred"
+    changed = []
+    for abi_file in abi_files:
+        structure = AbinitInput.read(abi_file)
+        if other not in structure:
+            continue
+        cell = cell_from_input(structure)
+        structure.set(coord_type, cell[coord_type], replace=other)
+        structure.write(abi_file)
+        changed.append(abi_file)
+    return changed
+
+
+def findsym_input(cell):
+    """Text of a FINDSYM input for a cell read by read_cell."""
+    lengths, angles = lattice_parameters(cell["rprimd"])
+    return "\n".join(["!useKeyWords", "!occupationTolerance", "0.01", "!latticeParameters",
+                      ", ".join([COORD_FORMAT.format(v) for v in lengths] + [f"{v:.6f}" for v in angles]),
+                      "!atomCount", str(cell["natom"]), "!atomType", " ".join(str(t) for t in cell["typat"]),
+                      "!atomPosition"] + format_rows(cell["xred"])) + "\n"
+
+
+def findsym_input_file(abi_file):
+    return (abi_file[:-4] if abi_file.endswith(".abi") else abi_file) + "_findsym.in"
+
+
+def run_command(args, out=sys.stdout):
+    """Runs one command line (without the program name). Returns False on a usage error."""
+    if len(args) >= 3 and args[0] == "convert" and args[1] in ("xred", "xcart"):
+        changed = convert_files(args[2:], args[1])
+        for abi_file in args[2:]:
+            if abi_file in changed:
+                print(f"{abi_file}: input file updated successfully.", file=out)
+            else:
+                print(f"{abi_file}: file is already expressed in {args[1]} coordinates", file=out)
+    elif len(args) >= 2 and args[0] == "lattice":
+        for abi_file in args[1:]:
+            lengths, angles = lattice_parameters(read_cell(abi_file)["rprimd"])
+            print(" ".join([COORD_FORMAT.format(v) for v in lengths] + [f"{v:.6f}" for v in angles]), file=out)
+    elif len(args) >= 2 and args[0] == "findsym-input":
+        for abi_file in args[1:]:
+            with open(findsym_input_file(abi_file), "w") as f:
+                f.write(findsym_input(read_cell(abi_file)))
+            print(findsym_input_file(abi_file), file=out)
+    else:
+        return False
+    return True
+
+
+def serve():
+    """Answers commands read from stdin until it closes; every answer ends with a line holding END."""
+    for line in sys.stdin:
+        args = shlex.split(line)
+        if not args:
+            continue
+        try:
+            if not run_command(args):
+                print(f"Error: unknown command {line.strip()}")
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+        print("END", flush=True)
+
+
+def main():
+    args = sys.argv[1:]
+    if args == ["serve"]:
+        serve()
+        return
+    try:
+        valid = run_command(args)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if not valid:
+        print("Usage: python3 crystalGeometry.py convert <xred/xcart> <abi_file> [<abi_file> ...]")
+        print("       python3 crystalGeometry.py lattice <abi_file> [<abi_file> ...]")
+        print("       python3 crystalGeometry.py findsym-input <abi_file> [<abi_file> ...]")
+        print("       python3 crystalGeometry.py serve")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+import os
+import sys
+import numpy as np
+from abinitInput import AbinitInput
+from crystalGeometry import cell_from_input, xcart_to_xred
+from symmetryFinder import analyse
+from gridSymmetry import is_enabled, reduce_grid, symmetry_file, write_symmetry_file
+
+# Generates every datapoint input file of a perturbation or energy scan in a single process.
+# All normalized displacement patterns and displaced cartesian coordinates are computed in one
+# NumPy pass, replacing the per-number python heredocs of datapointCalcofPert.sh and
+# datapointCalcofEnergy.sh. The general structure file is parsed once into the input model of
+# abinitInput.py and each datapoint input is written in one go with its displaced xcart. The space
+# groups of all displaced cells are found in one batch by symmetryFinder.py and listed in
+# spaceGroups_vec<N>.in. adaptiveSampling.py writes its batches through load_scan and write_datapoints.
+# With grid_symmetry 1 only one datapoint per symmetry orbit of the grid gets an input file and the
+# orbits are listed in gridSymmetry_vec<N>.in (see gridSymmetry.py).
+
+# Usage: python3 datapointGen.py [-p] <pert/energy> <input_file> [<input_file> ...]
+
+# Coordinate rows printed with the precision of fmt()
+ROW_FORMAT = "%.10g %.10g %.10g"
+
+PERT_HEADER = """##################################################
+# {structure}: Flexoelectric Tensor Calculation #
+##################################################
+
+ndtset {ndtset}
+
+# Set 1: Ground State Self-Consistency
+#*************************************
+
+getwfk1 0
+kptopt1 1
+tolvrs1 1.0d-18
+
+# Set 2: Reponse function calculation of d/dk wave function
+#**********************************************************
+
+iscf2 -3
+rfelfd2 2
+tolwfr2 1.0d-20
+
+# Set 3: Response function calculation of d2/dkdk wavefunction
+#*************************************************************
+
+getddk3 2
+iscf3 -3
+rf2_dkdk3 3
+tolwfr3 1.0d-16
+rf2_pert1_dir3 1 1 1
+rf2_pert2_dir3 1 1 1
+
+# Set 4: Response function calculation to q=0 phonons, electric field and strain
+#*******************************************************************************
+getddk4 2
+rfelfd4 3
+rfphon4 1
+rfstrs4 3
+rfstrs_ref4 1
+tolvrs4 1.0d-8
+
+{longwave}
+"""
+
+LONGWAVE_DATASET = """prepalw4 1
+# Set 5: Long-wave Calculations
+#******************************
+
+optdriver5 10
+get1wf5 4
+get1den5 4
+getddk5 2
+getdkdk5 3
+lw_flexo5 1
+
+# turn off various file outputs
+prtpot 0
+prteig 0
+"""
+
+ENERGY_HEADER = """##################################################
+# {structure}: Flexoelectric Tensor Calculation #
+##################################################
+
+ndtset 1
+
+# Ground State Self-Consistency
+#******************************
+
+getwfk1 0
+kptopt1 1
+tolvrs1 1.0d-18
+
+# turn off various file outputs
+prtpot 0
+prteig 0
+
+"""
+
+
+def parse_args():
+    args = sys.argv[1:]
+    run_piezo = False
+    if args and args[0] == "-p":
+        run_piezo = True
+        args = args[1:]
+    if len(args) < 2 or args[0] not in ("pert", "energy"):
+        print("Usage: python3 datapointGen.py [-p] <pert/energy> <input_file> [<input_file> ...]")
+        sys.exit(1)
+    return args[0], run_piezo, args[1:]
+
+
+def fmt(value):
+    """Formats a number the way the former bash calculate() helper printed it."""
+    return f"{value:.10g}"
+
+
+def read_input_params(input_file):
+    """Reads the flpz input file into a dictionary of keyword -> list of tokens."""
+    with open(input_file) as f:
+        lines = f.read().splitlines()
+    params = {}
+    for line in lines:
+        words = line.split()
+        if words and words[0] not in params:
+            params[words[0]] = words[1:]
+    return params, lines
+
+
+def read_block(lines, keyword, nrows):
+    """Reads the nrows x 3 numerical block that follows a keyword line (e.g. eigen_disp1)."""
+    for i, line in enumerate(lines):
+        words = line.split()
+        if words and words[0].lower() == keyword:
+            block = np.array([row.split()[:3] for row in lines[i + 1:i + 1 + nrows]], dtype=float)
+            if block.shape != (nrows, 3):
+                raise ValueError(f"Could not extract {nrows} rows of {keyword}")
+            return block
+    raise ValueError(f"Could not find {keyword}")
+
+
+def read_genstruc(general_structure_file):
+    """Returns the parsed general structure file and its cell (see crystalGeometry.cell_from_input)."""
+    structure = AbinitInput.read(general_structure_file)
+    try:
+        cell = cell_from_input(structure)
+    except (KeyError, ValueError) as e:
+        raise ValueError(f"{e} in {general_structure_file}")
+    return structure, cell
+
+
+def normalize(eig_disp):
+    """Normalizes eigendisplacements stacked along the first axis to unit length."""
+    flat = eig_disp.reshape(eig_disp.shape[0], -1)
+    return eig_disp / np.linalg.norm(flat, axis=1)[:, None, None]
+
+
+def amplitude_grid(params):
+    """Returns the amplitude of every datapoint as an (ndatapoints, nvec) array and the datapoint labels."""
+    if params.get("phonon_coupling", ["0"])[0] == "1":
+        grid_dimX, grid_dimY = int(params["grid_dim"][0]), int(params["grid_dim"][1])
+        xmin, xmax, ymin, ymax = (float(v) for v in params["grid_range"][:4])
+        step_sizeX = (xmax - xmin) / grid_dimX
+        step_sizeY = (ymax - ymin) / grid_dimY
+        print(f"Step Size X: {fmt(step_sizeX)}")
+        print(f"Step Size Y: {fmt(step_sizeY)}")
+        iterX, iterY = np.meshgrid(np.arange(1, grid_dimX + 1), np.arange(1, grid_dimY + 1), indexing="ij")
+        amplitudes = np.column_stack((xmin + step_sizeX * iterX.ravel(), ymin + step_sizeY * iterY.ravel()))
+        labels = [f"{x}_{y}" for x, y in zip(iterX.ravel(), iterY.ravel())]
+    else:
+        num_datapoints = int(params["num_datapoints"][0])
+        amp_min, amp_max = float(params["min"][0]), float(params["max"][0])
+        step_size = (amp_max - amp_min) / num_datapoints
+        print(f"Step Size: {fmt(step_size)}")
+        iteration = np.arange(num_datapoints + 1)
+        amplitudes = (amp_min + step_size * iteration)[:, None]
+        labels = [str(i) for i in iteration]
+    return amplitudes, labels
+
+
+def displaced_structures(xcart, eig_disps, amplitudes):
+    """Returns the displacement vectors and displaced xcart of every datapoint in one broadcast."""
+    displacements = np.einsum("pv,vaj->paj", amplitudes, eig_disps)
+    return displacements, xcart[None, :, :] + displacements
+
+
+def header_text(program, structure, run_piezo):
+    if program == "energy":
+        return ENERGY_HEADER.format(structure=structure)
+    if run_piezo:
+        return PERT_HEADER.format(structure=structure, ndtset=4, longwave="\n")
+    return PERT_HEADER.format(structure=structure, ndtset=5, longwave=LONGWAVE_DATASET)
+
+
+def print_rows(title, values):
+    print(title)
+    values = np.asarray(values)
+    print((ROW_FORMAT + "\n") * len(values) % tuple(values.ravel().tolist()))
+
+
+def load_scan(input_file):
+    """Reads a vector input file with its general structure and normalized eigendisplacements."""
+    params, lines = read_input_params(input_file)
+    genstruc, cell = read_genstruc(params["genstruc"][0])
+
+    keywords = ["eigen_disp1"]
+    if params.get("phonon_coupling", ["0"])[0] == "1":
+        keywords.append("eigen_disp2")
+    eig_disps = normalize(np.array([read_block(lines, k, cell["natom"]) for k in keywords]))
+    for k, eig_disp in zip(keywords, eig_disps):
+        print_rows(f"Printing normalized {k}:", eig_disp)
+    return {"params": params, "structure": params["name"][0].lower(), "vecNum": params.get("vecNum", [""])[0],
+            "genstruc": genstruc, "cell": cell, "eig_disps": eig_disps}
+
+
+def write_datapoints(program, run_piezo, scan, amplitudes, labels, new_labels=None):
+    """Writes the inputs of the datapoints in new_labels (every datapoint by default) and the xpoints,
+    datasets and space group listings of all the datapoints given."""
+    structure, vecNum, genstruc, cell = scan["structure"], scan["vecNum"], scan["genstruc"], scan["cell"]
+    displacements, nxcart = displaced_structures(cell["xcart"], scan["eig_disps"], amplitudes)
+
+    xpoints = f"xpoints{structure}_vec{vecNum}.m"
+    datasets_file = f"datasets_file{structure}_vec{vecNum}.in"
+    datasetsAbo_file = f"datasetsAbo_vec{vecNum}.in"
+    space_groups_file = f"spaceGroups_vec{vecNum}.in"
+
+    header = header_text(program, structure, run_piezo)
+    # The first line keeps the num_datapoints (or grid density) convention read by the analysis scripts
+    if len(scan["eig_disps"]) == 2:
+        datasets = [str(len(labels))]
+    else:
+        datasets = [str(len(labels) - 1)]
+    abo_files = []
+    for label, amplitude, displacement, coords in zip(labels, amplitudes, displacements, nxcart):
+        filename = f"{structure}_{label}_vec{vecNum}"
+        datasets.append(f"{filename}o_DS4_DDB")
+        if program == "pert" and not run_piezo:
+            datasets.append(f"{filename}o_DS5_DDB")
+        abo_files.append(f"{filename}.abo")
+        if new_labels is not None and label not in new_labels:
+            continue
+
+        print_rows(f"Displacement vector for {filename} (amplitude {' '.join(fmt(a) for a in amplitude)}):",
+                   displacement)
+        print_rows(f"New cartesian coordinates for {filename}:", coords)
+        genstruc.set("xcart", coords, replace="xred")
+        genstruc.write(f"{filename}.abi", header)
+
+    with open(xpoints, "w") as f:
+        f.write("%x displacement vector magnitude\nx_vec = [\n")
+        f.write("".join(" ".join(fmt(a) for a in amplitude) + "\n" for amplitude in amplitudes))
+        f.write("];\n")
+    with open(datasets_file, "w") as f:
+        f.write("\n".join(datasets) + "\n")
+    with open(datasetsAbo_file, "w") as f:
+        f.write("\n".join(abo_files) + "\n")
+
+    # Space groups of every displaced cell in one batch; cells sharing their symmetry share one lookup
+    xreds = xcart_to_xred(nxcart, cell["rprimd"])
+    groups = analyse([(cell["rprimd"], xred, cell["typat"]) for xred in xreds])
+    with open(space_groups_file, "w") as f:
+        for abo_file, group in zip(abo_files, groups):
+            f.write(f"{abo_file[:-4]}.abi {group['number']} {group['point_group']}\n")
+
+    print("Output files initialized:")
+    print(f"xpoints: {xpoints}")
+    print(f"datasets_file: {datasets_file}")
+    print(f"datasetsAbo_file: {datasetsAbo_file}")
+    print(f"space_groups_file: {space_groups_file}")
+    return abo_files
+
+
+def generate(program, run_piezo, input_file):
+    scan = load_scan(input_file)
+    amplitudes, labels = amplitude_grid(scan["params"])
+    new_labels = None
+    if is_enabled(scan["params"]):
+        representative, rotations = reduce_grid(program, scan, amplitudes)
+        prefixes = [f"{scan['structure']}_{label}_vec{scan['vecNum']}" for label in labels]
+        write_symmetry_file(scan["vecNum"], prefixes, representative, rotations)
+        new_labels = [labels[i] for i in sorted(set(representative.tolist()))]
+    elif os.path.isfile(symmetry_file(scan["vecNum"])):
+        os.remove(symmetry_file(scan["vecNum"]))
+    write_datapoints(program, run_piezo, scan, amplitudes, labels, new_labels)
+
+
+def main():
+    program, run_piezo, input_files = parse_args()
+    for input_file in input_files:
+        generate(program, run_piezo, input_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+import os
+import re
+import sys
+import glob
+import subprocess
+from abinitInput import AbinitInput, split_dataset
+from flpzTrace import span
+
+# Staged DFPT runs of the perturbation datapoints. The five datasets of a datapoint input (ground
+# state, d/dk, d2/dkdk, q=0 response and long-wave) are split into one input per stage,
+# <prefix>_<stage>.abi, each a restartable ABINIT run of its own. A stage reads the ground-state
+# wavefunctions through getwfk_filepath and the first-order files of the stages before it through
+# links named after its indata_prefix (irdddk, irddkdk, ird1wf, ird1den) instead of getddk/get1wf
+# dataset indices. A stage whose output reports a completed calculation and whose input did not
+# change is reused, so a piezoelectric scan (stages gs to rf) becomes a flexoelectric one by running
+# the long-wave stage alone: the response stage always prepares it (prepalw 1) for that reason.
+# Finished stages are linked to the outputs of the single-run layout (<prefix>.abo, o_DS4_DDB,
+# o_DS5_DDB), so the analysis, cache and catalog read them unchanged. Every stage run is a
+# dfpt_<stage> span of the run's trace (flpzTrace.py). The stages of all datapoints run side by side,
+# so they cannot be warm started (warmStart.py): the drivers reject warm_start 1 with dfpt_stages 1.
+#
+# Input file keyword: dfpt_stages 1         turns the staging on (perturbation scans)
+
+# Usage: python3 dfptStages.py plan <task_list>
+#        python3 dfptStages.py run <stage/all> <prefix> <nproc>
+# plan writes the stage inputs of every datapoint of task_list (one datapoint prefix per line), keeps
+# in task_list only the datapoints with stages left to run and prints one "<stage> <stages it reads>"
+# line per stage to submit, in order. run runs one stage of a datapoint (or all its stages left to
+# run, one after the other) and fails when the stage does not complete.
+
+# Stage name, dataset of the datapoint input it runs and the stages whose files it reads
+STAGES = (("gs", 1, ()),
+          ("ddk", 2, ("gs",)),
+          ("dkdk", 3, ("gs", "ddk")),
+          ("rf", 4, ("gs", "ddk")),
+          ("lw", 5, ("gs", "ddk", "dkdk", "rf")))
+# Variables that make a stage read the first-order files of an earlier stage
+READ_VARIABLES = {"ddk": ("irdddk",), "dkdk": ("irddkdk",), "rf": ("ird1wf", "ird1den")}
+# Variables set on every stage (no stage reads the potential or eigenvalue files) or on one stage
+COMMON_VARIABLES = {"prtpot": "0", "prteig": "0"}
+STAGE_VARIABLES = {"rf": {"prepalw": "1"}}
+# Files a completed stage leaves behind (glob patterns after the output prefix)
+PRODUCTS = {"gs": "o_WFK", "ddk": "o_1WF*", "dkdk": "o_1WF*", "rf": "o_DDB", "lw": "o_DDB"}
+# Output of the single-run layout each stage stands in for, and the file it links there
+LEGACY_OUTPUTS = {"gs": (".abo", ".abo"), "rf": ("o_DS4_DDB", "o_DDB"), "lw": ("o_DS5_DDB", "o_DDB")}
+FIRST_ORDER_RE = re.compile(r"o_(1WF|1DEN)(\d+)$")
+COMPLETED = "Calculation completed"
+DATASET_VARIABLES = {"ndtset", "jdtset", "udtset"}
+
+
+def is_enabled(params):
+    return params.get("dfpt_stages", ["0"])[0] == "1"
+
+
+def stage_file(prefix, stage, suffix=".abi"):
+    return f"{prefix}_{stage}{suffix}"
+
+
+def datapoint_stages(model):
+    """Stages of a datapoint input: gs to rf for a piezoelectric input, up to lw with the long-wave dataset."""
+    ndtset = int(model.scalar("ndtset", default=1))
+    if ndtset < 4:
+        raise ValueError(f"an input with {ndtset} datasets is not a perturbation datapoint")
+    return STAGES[:ndtset]
+
+
+def stage_input(model, prefix, stage, dataset, reads):
+    """Input of one stage: the variables shared by all datasets, those of its dataset without the suffix
+    and the variables reading the files of the earlier stages. The get/ird variables of the datapoint
+    input are dropped, they point at datasets (or at a warm-start WFK) that do not exist here."""
+    staged = AbinitInput()
+    # Set last whatever the datapoint input says, so piezoelectric and flexoelectric inputs give the same stages
+    fixed = {**COMMON_VARIABLES, **STAGE_VARIABLES.get(stage, {})}
+    for name, values in model.variables.items():
+        base, suffix = split_dataset(name)
+        if name in DATASET_VARIABLES or base.startswith(("get", "ird")) or suffix not in ("", str(dataset)) \
+                or base in fixed:
+            continue
+        if suffix or base not in staged:
+            staged.set(base, values)
+            staged.columns.pop(base, None)
+            if name in model.columns:
+                staged.columns[base] = model.columns[name]
+    for name, value in fixed.items():
+        staged.set(name, value)
+    if "gs" in reads:
+        staged.set("getwfk_filepath", f'"{stage_file(prefix, "gs", "o_WFK")}"')
+    first_order = [read for read in reads if read in READ_VARIABLES]
+    if first_order:
+        staged.set("indata_prefix", f'"{stage_file(prefix, stage, "i")}"')
+        for read in first_order:
+            for name in READ_VARIABLES[read]:
+                staged.set(name, "1")
+    return staged
+
+
+def is_complete(prefix, stage):
+    """A stage is complete when its output reports so and the files later stages read exist."""
+    abo_file = stage_file(prefix, stage, ".abo")
+    if not os.path.isfile(abo_file) or not glob.glob(glob.escape(stage_file(prefix, stage, "")) + PRODUCTS[stage]):
+        return False
+    with open(abo_file, errors="replace") as f:
+        return any(COMPLETED in line for line in f)
+
+
+def replace_link(source, target):
+    if os.path.lexists(target):
+        os.remove(target)
+    os.symlink(os.path.basename(source), target)
+
+
+def link_outputs(prefix, stage):
+    """Links a completed stage to the output of the single-run layout it stands in for."""
+    if stage in LEGACY_OUTPUTS:
+        legacy, produced = LEGACY_OUTPUTS[stage]
+        replace_link(stage_file(prefix, stage, produced), prefix + legacy)
+
+
+def link_inputs(prefix, stage, reads):
+    """Links the first-order files of the stages read to <prefix>_<stage>i_1WF<n> / _1DEN<n>."""
+    in_prefix = stage_file(prefix, stage, "i")
+    for path in glob.glob(glob.escape(in_prefix) + "_*"):
+        os.remove(path)
+    for read in reads:
+        if read not in READ_VARIABLES:
+            continue
+        for path in glob.glob(glob.escape(stage_file(prefix, read, "")) + "o_1*"):
+            match = FIRST_ORDER_RE.search(path)
+            if match:
+                os.symlink(os.path.basename(path), f"{in_prefix}_{match.group(1)}{match.group(2)}")
+
+
+def write_stages(prefix):
+    """Writes the stage inputs of a datapoint. A stage whose input changed, or that reads such a stage,
+    loses its output so it runs again. Returns the stages left to run."""
+    model = AbinitInput.read(prefix + ".abi")
+    stale = set()
+    header = f"# {prefix}: DFPT stage written by dfptStages.py from {prefix}.abi\n\n"
+    for stage, dataset, reads in datapoint_stages(model):
+        abi_file = stage_file(prefix, stage)
+        text = stage_input(model, prefix, stage, dataset, reads).text(header)
+        previous = None
+        if os.path.isfile(abi_file):
+            with open(abi_file) as f:
+                previous = f.read()
+        if previous != text:
+            with open(abi_file, "w") as f:
+                f.write(text)
+            stale.add(stage)
+        elif stale.intersection(reads):
+            stale.add(stage)
+        if stage in stale and os.path.isfile(stage_file(prefix, stage, ".abo")):
+            os.remove(stage_file(prefix, stage, ".abo"))
+    pending = []
+    for stage, _, _ in datapoint_stages(model):
+        if is_complete(prefix, stage):
+            link_outputs(prefix, stage)
+        else:
+            pending.append(stage)
+    return pending
+
+
+def plan(task_list):
+    """Writes the stage inputs of the task list and returns (stage, stages it reads) for every stage
+    left to run by some datapoint. The task list keeps only the datapoints with stages left to run."""
+    with open(task_list) as f:
+        tasks = [line.strip() for line in f if line.strip()]
+    pending = {task: write_stages(task) for task in tasks}
+    remaining = [task for task in tasks if pending[task]]
+    with open(task_list, "w") as f:
+        f.write("".join(task + "\n" for task in remaining))
+
+    stages = {stage for task in remaining for stage in pending[task]}
+    submitted = [(stage, tuple(read for read in reads if read in stages))
+                 for stage, _, reads in STAGES if stage in stages]
+    print(f"DFPT stages: {sum(len(pending[task]) for task in tasks)} stages of {len(remaining)} of {len(tasks)} "
+          f"datapoints left to run ({' '.join(stage for stage, _ in submitted) or 'none'})", file=sys.stderr)
+    return submitted
+
+
+def run(stage, prefix, nproc):
+    """Runs one stage of a datapoint (all its stages left to run for 'all'), reusing completed stages."""
+    stages = datapoint_stages(AbinitInput.read(prefix + ".abi"))
+    if stage != "all":
+        stages = [entry for entry in stages if entry[0] == stage]
+        if not stages:
+            raise ValueError(f"{prefix}.abi has no {stage} stage")
+    for name, _, reads in stages:
+        if is_complete(prefix, name):
+            print(f"Stage {name} of {prefix} already completed, reusing it")
+            link_outputs(prefix, name)
+            continue
+        missing = [read for read in reads if not is_complete(prefix, read)]
+        if missing:
+            raise ValueError(f"stage {name} of {prefix} reads the unfinished stages {', '.join(missing)}")
+        link_inputs(prefix, name, reads)
+        if os.path.isfile(stage_file(prefix, name, ".abo")):
+            os.remove(stage_file(prefix, name, ".abo"))
+        with span(f"dfpt_{name}", datapoint=prefix) as details:
+            with open(stage_file(prefix, name, ".log"), "w") as log:
+                subprocess.run(["mpirun", "-hosts=localhost", "-np", str(nproc), "abinit", stage_file(prefix, name)],
+                               stdout=log, stderr=subprocess.STDOUT)
+            details["status"] = 0 if is_complete(prefix, name) else 1
+        if not is_complete(prefix, name):
+            raise ValueError(f"stage {name} of {prefix} did not complete, see {stage_file(prefix, name, '.log')}")
+        link_outputs(prefix, name)
+        print(f"Stage {name} of {prefix} completed")
+
+
+def main():
+    args = sys.argv[1:]
+    try:
+        if len(args) == 2 and args[0] == "plan":
+            for stage, reads in plan(args[1]):
+                print(" ".join((stage,) + reads))
+            return
+        if len(args) == 4 and args[0] == "run":
+            run(args[1], args[2], args[3])
+            return
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print("Usage: python3 dfptStages.py plan <task_list>")
+    print("       python3 dfptStages.py run <stage/all> <prefix> <nproc>")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
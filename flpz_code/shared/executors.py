@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+import os
+import re
+import sys
+import json
+import time
+import fcntl
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from jobTracker import SlurmScheduler, merge_task
+
+# Pluggable executors for every job the workflow submits. Each executor submits a batch script
+# (optionally as a job array with a dependency) and answers query() the way jobTracker.py expects,
+# so the drivers, arraySubmit.sh and the trackers do not depend on the backend. FLPZ_EXECUTOR selects
+# it: slurm (default) hands everything to sbatch/squeue/sacct; local runs the jobs on this machine.
+# The local executor keeps its jobs in a spool directory and starts one worker process per machine
+# that runs them on a core-budgeted pool: a job takes the cores of its mpirun -np (or of the
+# --ntasks of its preamble, or --local-cores), and ready jobs are packed onto the free cores in
+# submission order while completion is tracked through futures. Array throttles and the afterok,
+# afterany and aftercorresponding dependencies behave as in SLURM, the jobs see the usual SLURM_*
+# variables and write slurm-<job>[_<task>].out next to where they were submitted, so the working
+# directories look the same either way. The worker exits once the spool has been idle for a minute.
+# The --time, --ntasks and --mem-per-cpu requests (resourceEstimator.py) override the preamble of
+# the script under SLURM; the local executor has no walltime or memory limits and ignores them.
+#
+# Environment: FLPZ_EXECUTOR      slurm or local
+#              FLPZ_LOCAL_CORES   cores of the local pool (default: every core of the machine)
+#              FLPZ_LOCAL_SPOOL   spool of the local jobs (default: $FLPZ_CACHE_DIR/local)
+
+# Usage: python3 executors.py submit [--local-cores=<n>] [--array=<range>] [--dependency=<dependency>]
+#                                     [--kill-on-invalid-dep=yes] [--time=<walltime>] [--ntasks=<n>]
+#                                     [--mem-per-cpu=<memory>] <script> [<arg> ...]
+#        python3 executors.py query <job_id> [<job_id> ...]
+#        python3 executors.py worker
+# submit prints "Submitted batch job <job_id>" like sbatch; --local-cores is only read by the local
+# executor (0 for driver scripts that only wait on other jobs).
+
+FINISHED_STATES = {"COMPLETED", "FAILED", "CANCELLED"}
+# Jobs with no cores (drivers) that may run at once on top of the core budget
+DRIVER_SLOTS = 16
+POLL_INTERVAL = 2.0
+IDLE_TIMEOUT = 60.0
+NP_RE = re.compile(r"\bmpirun\b[^\n]*?\s-np\s+(\d+)")
+NTASKS_RE = re.compile(r"^#SBATCH\s+(?:--ntasks(?:-per-node)?=|-n\s*)(\d+)", re.MULTILINE)
+SUBMITTED_RE = re.compile(r"Submitted batch job (\S+)")
+# sbatch options passed through as the resources of a job
+RESOURCE_OPTIONS = ("time", "ntasks", "mem-per-cpu")
+
+
+def parse_array(text):
+    """Task indices and throttle of a SLURM --array specification (0-9%4, 1,3,5-7)."""
+    text, _, throttle = text.partition("%")
+    indices = []
+    for part in text.split(","):
+        first, _, last = part.partition("-")
+        indices.extend(range(int(first), int(last or first) + 1))
+    return indices, int(throttle) if throttle else None
+
+
+def parse_dependency(text):
+    """[(type, [job_id, ...]), ...] of a SLURM --dependency specification."""
+    dependencies = []
+    for part in filter(None, re.split(r"[,?]", text or "")):
+        kind, *ids = part.split(":")
+        dependencies.append((kind, ids))
+    return dependencies
+
+
+def script_cores(text):
+    """Cores a script asks for: its largest mpirun -np, else the --ntasks of its preamble, else 1."""
+    counts = [int(n) for n in NP_RE.findall(text)]
+    if not counts:
+        counts = [int(n) for n in NTASKS_RE.findall(text)]
+    return max(counts) if counts else 1
+
+
+class SlurmExecutor(SlurmScheduler):
+    """Submits with sbatch; query() is the batched squeue/sacct query of SlurmScheduler."""
+
+    def submit(self, script, args=(), array=None, dependency=None, kill_on_invalid=False, cores=None,
+               resources=None):
+        command = ["sbatch"]
+        if array:
+            command.append(f"--array={array}")
+        if dependency:
+            command.append(f"--dependency={dependency}")
+            if kill_on_invalid:
+                command.append("--kill-on-invalid-dep=yes")
+        command.extend(f"--{name}={value}" for name, value in (resources or {}).items())
+        code, out = self.run(command + [script] + list(args))
+        match = SUBMITTED_RE.search(out)
+        if code != 0 or match is None:
+            raise RuntimeError(f"sbatch did not submit {script}")
+        return match.group(1)
+
+
+class LocalExecutor:
+    """Runs the jobs on this machine through a spool directory shared with a pool worker process."""
+
+    def __init__(self, spool=None, cores=None):
+        cache = os.path.expanduser(os.environ.get("FLPZ_CACHE_DIR", "~/.cache/flpz"))
+        self.spool = os.path.expanduser(spool or os.environ.get("FLPZ_LOCAL_SPOOL", os.path.join(cache, "local")))
+        self.cores = int(cores or os.environ.get("FLPZ_LOCAL_CORES", 0) or os.cpu_count() or 1)
+        os.makedirs(os.path.join(self.spool, "jobs"), exist_ok=True)
+
+    def path(self, *parts):
+        return os.path.join(self.spool, *parts)
+
+    def locked(self):
+        """Exclusive lock of the spool, held for every read-modify-write of the job records."""
+        handle = open(self.path("lock"), "a")
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+
+    def load(self, job_id):
+        try:
+            with open(self.path("jobs", f"{job_id}.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, job):
+        temporary = self.path("jobs", f"{job['job_id']}.json.tmp")
+        with open(temporary, "w") as f:
+            json.dump(job, f)
+        os.replace(temporary, self.path("jobs", f"{job['job_id']}.json"))
+
+    def jobs(self):
+        """Every unfinished job of the spool, oldest first."""
+        jobs = []
+        for name in os.listdir(self.path("jobs")):
+            if name.endswith(".json"):
+                job = self.load(name[:-5])
+                if job is not None and not job.get("finished"):
+                    jobs.append(job)
+        return sorted(jobs, key=lambda job: int(job["job_id"]))
+
+    def next_id(self):
+        try:
+            with open(self.path("last_id")) as f:
+                job_id = int(f.read().strip() or 0) + 1
+        except OSError:
+            job_id = 1
+        with open(self.path("last_id"), "w") as f:
+            f.write(str(job_id))
+        return str(job_id)
+
+    def submit(self, script, args=(), array=None, dependency=None, kill_on_invalid=False, cores=None,
+               resources=None):
+        with open(script) as f:
+            text = f.read()
+        indices, throttle = parse_array(array) if array else ([None], None)
+        with self.locked():
+            job_id = self.next_id()
+            # Like sbatch, the job runs the script as it was at submission
+            copy = self.path("jobs", f"{job_id}.sh")
+            shutil.copyfile(script, copy)
+            job = {"job_id": job_id, "script": copy, "args": list(args), "cwd": os.getcwd(),
+                   "cores": script_cores(text) if cores is None else int(cores), "array": array is not None,
+                   "throttle": throttle, "dependency": parse_dependency(dependency),
+                   "submitted": time.time(), "finished": False,
+                   "tasks": {str(index): ["PENDING", None, None] for index in indices}}
+            self.save(job)
+            self.start_worker()
+        return job_id
+
+    def start_worker(self):
+        """Starts the pool worker unless one holds the worker lock (called with the spool locked)."""
+        with open(self.path("worker.lock"), "a") as handle:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return
+            fcntl.flock(handle, fcntl.LOCK_UN)
+        with open(self.path("worker.log"), "a") as log:
+            subprocess.Popen([sys.executable, os.path.abspath(__file__), "worker"], stdout=log,
+                             stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL, start_new_session=True,
+                             env={**os.environ, "FLPZ_LOCAL_SPOOL": self.spool})
+
+    def query(self, ids):
+        """Returns {job_id: (state, exit_code, elapsed_seconds or None)} for every id."""
+        states = {}
+        for job_id in ids:
+            job = self.load(job_id)
+            if job is None:
+                states[job_id] = ("UNKNOWN", None, None)
+                continue
+            tasks = list(job["tasks"].values())
+            active = [task[0] for task in tasks if task[0] not in FINISHED_STATES]
+            if active:
+                states[job_id] = ("RUNNING" if "RUNNING" in active else "PENDING", None, None)
+                continue
+            record = None
+            for task in tasks:
+                record = merge_task(record, tuple(task))
+            states[job_id] = record
+        return states
+
+    def dependency_state(self, job, index):
+        """'ready', 'waiting' or 'never' for one task of a job, from the records of its dependencies."""
+        for kind, ids in job["dependency"]:
+            for dependency_id in ids:
+                other = self.load(dependency_id)
+                # Jobs this spool does not know (e.g. submitted elsewhere) do not hold anything back
+                if other is None:
+                    continue
+                tasks = other["tasks"]
+                if kind == "aftercorresponding":
+                    tasks = {index: tasks[index]} if index in tasks else {}
+                states = [task[0] for task in tasks.values()]
+                if kind == "after":
+                    if "PENDING" in states:
+                        return "waiting"
+                elif any(state not in FINISHED_STATES for state in states):
+                    return "waiting"
+                elif kind != "afterany" and any(state != "COMPLETED" for state in states):
+                    return "never"
+        return "ready"
+
+    def run_task(self, job, index):
+        """Runs one task of a job to completion and returns (state, exit_code, elapsed)."""
+        output = f"slurm-{job['job_id']}.out" if index == "None" else f"slurm-{job['job_id']}_{index}.out"
+        env = {**os.environ, "SLURM_JOB_ID": job["job_id"], "SLURM_SUBMIT_DIR": job["cwd"],
+               "SLURM_NTASKS": str(max(job["cores"], 1)), "FLPZ_EXECUTOR": "local", "FLPZ_LOCAL_SPOOL": self.spool}
+        if job["array"]:
+            env.update({"SLURM_ARRAY_JOB_ID": job["job_id"], "SLURM_ARRAY_TASK_ID": index})
+        start = time.time()
+        with open(os.path.join(job["cwd"], output), "w") as log:
+            code = subprocess.run(["bash", job["script"]] + job["args"], cwd=job["cwd"], env=env, stdout=log,
+                                  stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL).returncode
+        return ("COMPLETED" if code == 0 else "FAILED", f"{code}:0", time.time() - start)
+
+    def schedule(self, pool, running):
+        """Starts every ready task that fits on the free cores. Returns the number of tasks still waiting."""
+        free = self.cores - sum(cores for _, _, cores in running.values())
+        drivers = sum(1 for _, _, cores in running.values() if cores == 0)
+        waiting = 0
+        with self.locked():
+            for job in self.jobs():
+                changed = False
+                active = sum(1 for task in job["tasks"].values() if task[0] == "RUNNING")
+                for index, task in job["tasks"].items():
+                    if task[0] != "PENDING":
+                        continue
+                    state = self.dependency_state(job, index)
+                    if state == "never":
+                        job["tasks"][index] = ["CANCELLED", None, 0.0]
+                        changed = True
+                        continue
+                    cores = job["cores"]
+                    throttled = job["throttle"] is not None and active >= job["throttle"]
+                    # A job wider than the machine runs alone instead of waiting forever
+                    fits = (drivers < DRIVER_SLOTS) if cores == 0 else \
+                        cores <= free or (free == self.cores and not any(c for _, _, c in running.values()))
+                    if state != "ready" or throttled or not fits:
+                        waiting += 1
+                        continue
+                    job["tasks"][index] = ["RUNNING", None, None]
+                    running[pool.submit(self.run_task, job, index)] = (job["job_id"], index, cores)
+                    free -= cores
+                    drivers += cores == 0
+                    active += 1
+                    changed = True
+                if all(task[0] in FINISHED_STATES for task in job["tasks"].values()):
+                    job["finished"] = True
+                    changed = True
+                if changed:
+                    self.save(job)
+        return waiting
+
+    def finish(self, done, running):
+        with self.locked():
+            for future in done:
+                job_id, index, _ = running.pop(future)
+                job = self.load(job_id)
+                try:
+                    job["tasks"][index] = list(future.result())
+                except OSError as e:
+                    print(f"Job {job_id} task {index} could not run: {e}", flush=True)
+                    job["tasks"][index] = ["FAILED", "1:0", 0.0]
+                job["finished"] = all(task[0] in FINISHED_STATES for task in job["tasks"].values())
+                self.save(job)
+
+    def serve(self):
+        """Worker loop: runs the spooled jobs until the spool has been idle for IDLE_TIMEOUT seconds."""
+        lock = open(self.path("worker.lock"), "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return
+        print(f"Local executor worker {os.getpid()} running jobs on {self.cores} cores", flush=True)
+        running = {}
+        idle_since = None
+        with ThreadPoolExecutor(max_workers=self.cores + DRIVER_SLOTS) as pool:
+            while True:
+                waiting = self.schedule(pool, running)
+                if running or waiting:
+                    idle_since = None
+                elif idle_since is None:
+                    idle_since = time.time()
+                elif time.time() - idle_since > IDLE_TIMEOUT:
+                    # Release the worker lock with the spool locked, so a job submitted meanwhile starts a new worker
+                    with self.locked():
+                        if not self.jobs():
+                            lock.close()
+                            break
+                    idle_since = None
+                if running:
+                    done, _ = wait(list(running), timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                    self.finish(done, running)
+                else:
+                    time.sleep(POLL_INTERVAL)
+        print(f"Local executor worker {os.getpid()} idle, exiting", flush=True)
+
+
+def get_executor():
+    """The executor selected by FLPZ_EXECUTOR."""
+    name = os.environ.get("FLPZ_EXECUTOR", "slurm").lower()
+    if name == "local":
+        return LocalExecutor()
+    if name == "slurm":
+        return SlurmExecutor()
+    raise ValueError(f"unknown executor {name} (FLPZ_EXECUTOR must be slurm or local)")
+
+
+def main():
+    args = sys.argv[1:]
+    try:
+        if args and args[0] == "submit":
+            options = {}
+            args = args[1:]
+            while args and args[0].startswith("--"):
+                name, _, value = args.pop(0)[2:].partition("=")
+                options[name] = value
+            if args:
+                job_id = get_executor().submit(args[0], args[1:], array=options.get("array"),
+                                               dependency=options.get("dependency"),
+                                               kill_on_invalid=options.get("kill-on-invalid-dep") == "yes",
+                                               cores=options.get("local-cores"),
+                                               resources={name: options[name] for name in RESOURCE_OPTIONS
+                                                          if name in options})
+                print(f"Submitted batch job {job_id}")
+                return
+        elif len(args) >= 2 and args[0] == "query":
+            for job_id, (state, exit_code, elapsed) in get_executor().query(args[1:]).items():
+                print(f"{job_id} {state} {exit_code or '-'} {'-' if elapsed is None else f'{elapsed:.0f}'}")
+            return
+        elif args == ["worker"]:
+            LocalExecutor().serve()
+            return
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    print("Usage: python3 executors.py submit [--local-cores=<n>] [--array=<range>] [--dependency=<dependency>]")
+    print("                                    [--kill-on-invalid-dep=yes] [--time=<walltime>] [--ntasks=<n>]")
+    print("                                    [--mem-per-cpu=<memory>] <script> [<arg> ...]")
+    print("       python3 executors.py query <job_id> [<job_id> ...]")
+    print("       python3 executors.py worker")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
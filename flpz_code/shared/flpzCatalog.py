@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import sqlite3
+import subprocess
+from aboParser import parse_abo
+from resultCache import input_key
+from datapointGen import read_input_params
+from adaptiveSampling import planned_datapoints
+from dfptStages import is_enabled as staged_dfpt, replace_link
+from executors import get_executor
+from jobTracker import JobTracker, ACTIVE_STATES, UNREACHABLE
+
+# SQLite catalog of every planned datapoint of a campaign (one working directory). Each datapoint
+# records its structure, irrep, vector, amplitude(s), input hash, job id, status, expected output
+# files and the extracted total energy, so an interrupted or partially failed run can be resumed:
+# only missing or failed datapoints are resubmitted and only vectors with new results re-analysed.
+# Datapoint status: planned -> submitted -> done/failed
+# A datapoint whose input is identical (same result-cache key) to one already submitted or done, e.g.
+# the zero-amplitude datapoint of every vector, or to an earlier one of the same submission, is not
+# run again: its outputs are linked to those of the other datapoint and it shares its job.
+
+# Usage: python3 flpzCatalog.py campaign <pert/energy> <irrep> [-p]
+#        python3 flpzCatalog.py register <vec_input_file>
+#        python3 flpzCatalog.py submitted          (reads "<job_id> <abi_file>" lines from stdin)
+#        python3 flpzCatalog.py restored <abi_file> [<abi_file> ...]
+#        python3 flpzCatalog.py duplicates <abi_file> [<abi_file> ...]
+#        python3 flpzCatalog.py status
+#        python3 flpzCatalog.py resume
+
+CATALOG_FILE = "flpz_catalog.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS campaign (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS vectors (
+    vec_num TEXT PRIMARY KEY, input_file TEXT, nproc TEXT, preamble TEXT, array_throttle TEXT,
+    datasets_file TEXT, xpoints TEXT, datasets_abo_file TEXT
+);
+CREATE TABLE IF NOT EXISTS datapoints (
+    input_file TEXT PRIMARY KEY, structure TEXT, irrep TEXT, vec_num TEXT, label TEXT, amplitudes TEXT,
+    input_hash TEXT, job_id TEXT, status TEXT, outputs TEXT, etotal REAL, updated REAL,
+    analyzed INTEGER DEFAULT 0
+);
+"""
+
+
+def connect(path=CATALOG_FILE):
+    db = sqlite3.connect(path, timeout=60)
+    db.row_factory = sqlite3.Row
+    db.executescript(SCHEMA)
+    return db
+
+
+def campaign_settings(db):
+    return {row["key"]: row["value"] for row in db.execute("SELECT key, value FROM campaign")}
+
+
+def set_campaign(db, program, irrep, run_piezo):
+    with db:
+        db.executemany("INSERT OR REPLACE INTO campaign (key, value) VALUES (?, ?)",
+                       [("program", program), ("irrep", irrep), ("piezo", "1" if run_piezo else "0")])
+
+
+def expected_outputs(prefix, program, run_piezo):
+    """Files a finished datapoint leaves behind: the .abo and the DDBs read by the analysis."""
+    outputs = [prefix + ".abo"]
+    if program == "pert":
+        outputs.append(prefix + "o_DS4_DDB")
+        if not run_piezo:
+            outputs.append(prefix + "o_DS5_DDB")
+    return outputs
+
+
+def register(db, vec_input_file):
+    """Records every datapoint that datapointGen.py planned for one vector input file."""
+    settings = campaign_settings(db)
+    program = settings.get("program", "pert")
+    run_piezo = settings.get("piezo") == "1"
+    params, _ = read_input_params(vec_input_file)
+    structure = params["name"][0].lower()
+    vecNum = params.get("vecNum", [""])[0]
+    amplitudes, labels = planned_datapoints(params)
+
+    with db:
+        db.execute("INSERT OR REPLACE INTO vectors VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                   (vecNum, os.path.abspath(vec_input_file), params["nproc"][0], params["sbatch_preamble"][0],
+                    params.get("array_throttle", [""])[0], f"datasets_file{structure}_vec{vecNum}.in",
+                    f"xpoints{structure}_vec{vecNum}.m", f"datasetsAbo_vec{vecNum}.in"))
+        for label, amplitude in zip(labels, amplitudes):
+            prefix = f"{structure}_{label}_vec{vecNum}"
+            # A datapoint whose input did not change keeps its status and results
+            db.execute("""INSERT INTO datapoints (input_file, structure, irrep, vec_num, label, amplitudes,
+                              input_hash, status, outputs, updated)
+                          VALUES (?, ?, ?, ?, ?, ?, ?, 'planned', ?, ?)
+                          ON CONFLICT(input_file) DO UPDATE SET
+                              status = CASE WHEN input_hash = excluded.input_hash THEN status ELSE 'planned' END,
+                              analyzed = CASE WHEN input_hash = excluded.input_hash THEN analyzed ELSE 0 END,
+                              input_hash = excluded.input_hash, amplitudes = excluded.amplitudes,
+                              outputs = excluded.outputs, updated = excluded.updated""",
+                       (prefix + ".abi", structure, settings.get("irrep", ""), vecNum, label,
+                        " ".join(repr(float(a)) for a in amplitude), input_key(prefix + ".abi"),
+                        " ".join(expected_outputs(prefix, program, run_piezo)), time.time()))
+    print(f"Catalog: registered {len(labels)} datapoints of vector {vecNum}")
+
+
+def mark_submitted(db, pairs):
+    with db:
+        db.executemany("UPDATE datapoints SET job_id = ?, status = 'submitted', updated = ? WHERE input_file = ?",
+                       [(job_id, time.time(), abi_file) for job_id, abi_file in pairs])
+
+
+def mark_restored(db, abi_files):
+    """Marks the datapoints restored from the result cache as done."""
+    updates = []
+    for abi_file in abi_files:
+        row = db.execute("SELECT * FROM datapoints WHERE input_file = ?", (abi_file,)).fetchone()
+        etotal = finished_etotal(row) if row is not None else None
+        if etotal is not None:
+            updates.append((etotal, time.time(), abi_file))
+    with db:
+        db.executemany("UPDATE datapoints SET status = 'done', etotal = ?, updated = ? WHERE input_file = ?", updates)
+
+
+def link_duplicates(db, abi_files):
+    """Links the outputs of every datapoint of abi_files whose input hash matches a datapoint already
+    submitted or done, or an earlier datapoint of abi_files, to the outputs of that datapoint.
+    A datapoint linked to a finished one is done at once. Returns (abi_file, original abi_file, job id
+    or None when the original was not submitted by a job yet)."""
+    linked = []
+    first = {}
+    for abi_file in abi_files:
+        row = db.execute("SELECT * FROM datapoints WHERE input_file = ?", (abi_file,)).fetchone()
+        if row is None:
+            continue
+        original = db.execute("""SELECT * FROM datapoints WHERE input_hash = ? AND input_file != ?
+                                 AND status IN ('submitted', 'done') ORDER BY status = 'done' DESC, updated DESC""",
+                              (row["input_hash"], abi_file)).fetchone()
+        if original is None:
+            original = first.setdefault(row["input_hash"], row)
+            if original is row:
+                continue
+        for source, target in zip(original["outputs"].split(), row["outputs"].split()):
+            replace_link(source, target)
+        if original["status"] == "done":
+            mark_restored(db, [abi_file])
+        linked.append((abi_file, original["input_file"], original["job_id"] if original["status"] == "submitted" else None))
+    return linked
+
+
+def finished_etotal(row):
+    """Returns the total energy of a datapoint whose outputs are all present, otherwise None."""
+    if not all(os.path.isfile(path) for path in row["outputs"].split()):
+        return None
+    try:
+        etotal = parse_abo(row["outputs"].split()[0])["etotal"]
+    except (OSError, ValueError):
+        return None
+    return etotal[min(etotal)] if etotal else None
+
+
+def refresh(db, scheduler=None):
+    """Updates the status of every unfinished datapoint with one batched scheduler query."""
+    rows = db.execute("SELECT * FROM datapoints WHERE status != 'done'").fetchall()
+    job_ids = sorted({row["job_id"] for row in rows if row["status"] == "submitted" and row["job_id"]})
+    states = (scheduler or get_executor()).query(job_ids) if job_ids else {}
+    updates = []
+    for row in rows:
+        etotal = finished_etotal(row)
+        state = states.get(row["job_id"], ("UNKNOWN",))[0]
+        if etotal is not None:
+            updates.append(("done", etotal, row["input_file"]))
+        elif row["status"] == "submitted" and state not in ACTIVE_STATES and state != UNREACHABLE:
+            updates.append(("failed", None, row["input_file"]))
+    with db:
+        db.executemany("UPDATE datapoints SET status = ?, etotal = ?, updated = ? WHERE input_file = ?",
+                       [(status, etotal, time.time(), abi_file) for status, etotal, abi_file in updates])
+
+
+def print_status(db):
+    rows = db.execute("""SELECT vec_num, status, COUNT(*) AS n FROM datapoints
+                         GROUP BY vec_num, status ORDER BY vec_num, status""").fetchall()
+    for row in rows:
+        print(f"vector {row['vec_num']}: {row['n']} {row['status']}")
+
+
+def submit_missing(db):
+    """Submits every planned or failed datapoint as one job array per vector. Returns the job ids."""
+    job_ids = []
+    settings = campaign_settings(db)
+    for vector in db.execute("SELECT * FROM vectors ORDER BY vec_num").fetchall():
+        rows = db.execute("""SELECT input_file FROM datapoints WHERE vec_num = ? AND status IN ('planned', 'failed')
+                             ORDER BY input_file""", (vector["vec_num"],)).fetchall()
+        if not rows:
+            continue
+        task_list = f"resumeTasks_vec{vector['vec_num']}.in"
+        # Outputs linked to an identical datapoint are written by this run instead
+        for row in rows:
+            for path in expected_outputs(row["input_file"][:-4], settings.get("program", "pert"),
+                                         settings.get("piezo") == "1"):
+                if os.path.islink(path):
+                    os.remove(path)
+        with open(task_list, "w") as f:
+            f.write("".join(row["input_file"][:-4] + "\n" for row in rows))
+        throttle = ["-t", vector["array_throttle"]] if vector["array_throttle"] else []
+        # A warm-started datapoint whose predecessor left no wavefunctions starts from scratch
+        command = (f'python3 warmStart.py check "${{task}}.abi"; '
+                   f'mpirun -hosts=localhost -np  {vector["nproc"]}  abinit  "${{task}}.abi" >& "${{task}}.log"')
+        params = read_input_params(vector["input_file"])[0] if os.path.isfile(vector["input_file"]) else {}
+        if settings.get("program") == "pert" and staged_dfpt(params):
+            # A staged datapoint runs its stages left to run one after the other, reusing the completed ones
+            command = f'python3 dfptStages.py run all "${{task}}" {vector["nproc"]}'
+        proc = subprocess.run(["bash", "arraySubmit.sh"] + throttle +
+                              [task_list, f"b-script-resume_vec{vector['vec_num']}_array", vector["preamble"], command],
+                              capture_output=True, text=True)
+        job_id = proc.stdout.strip()
+        if proc.returncode != 0 or not job_id:
+            print(f"Error: could not resubmit vector {vector['vec_num']}: {proc.stderr.strip()}")
+            continue
+        mark_submitted(db, [(job_id, row["input_file"]) for row in rows])
+        job_ids.append(job_id)
+        print(f"Resubmitted {len(rows)} datapoints of vector {vector['vec_num']} as array job {job_id}")
+    return job_ids
+
+
+def analyze_new_results(db):
+    """Re-runs the data analysis of every vector that gained finished datapoints."""
+    settings = campaign_settings(db)
+    program = settings.get("program", "pert")
+    vectors = db.execute("""SELECT DISTINCT v.* FROM vectors v JOIN datapoints d ON d.vec_num = v.vec_num
+                            WHERE d.status = 'done' AND d.analyzed = 0""").fetchall()
+    for vector in vectors:
+        if program == "energy":
+            command = ["bash", "dataAnalysisEnergy.sh"]
+        else:
+            command = ["bash", "dataAnalysisPert.sh"] + (["-p"] if settings.get("piezo") == "1" else [])
+        command += [vector["datasets_file"], vector["xpoints"], vector["datasets_abo_file"], vector["vec_num"]]
+        print(f"Analysing vector {vector['vec_num']}")
+        if subprocess.run(command).returncode == 0:
+            with db:
+                db.execute("UPDATE datapoints SET analyzed = 1 WHERE vec_num = ? AND status = 'done'",
+                           (vector["vec_num"],))
+
+
+def resume(db):
+    refresh(db)
+    print_status(db)
+    job_ids = submit_missing(db)
+    if job_ids:
+        JobTracker(get_executor()).wait(job_ids)
+        refresh(db)
+        print_status(db)
+    analyze_new_results(db)
+
+
+def main():
+    args = sys.argv[1:]
+    if len(args) in (3, 4) and args[0] == "campaign" and args[1] in ("pert", "energy"):
+        set_campaign(connect(), args[1], args[2], args[3:] == ["-p"])
+    elif len(args) == 2 and args[0] == "register":
+        register(connect(), args[1])
+    elif args == ["submitted"]:
+        mark_submitted(connect(), [line.split()[:2] for line in sys.stdin if len(line.split()) >= 2])
+    elif args and args[0] == "restored":
+        mark_restored(connect(), args[1:])
+    elif args and args[0] == "duplicates":
+        for abi_file, original, job_id in link_duplicates(connect(), args[1:]):
+            print(f"{abi_file} {original} {job_id or '-'}")
+    elif args == ["status"]:
+        db = connect()
+        refresh(db)
+        print_status(db)
+    elif args == ["resume"]:
+        resume(connect())
+    else:
+        print("Usage: python3 flpzCatalog.py campaign <pert/energy> <irrep> [-p]")
+        print("       python3 flpzCatalog.py register <vec_input_file>")
+        print("       python3 flpzCatalog.py submitted")
+        print("       python3 flpzCatalog.py restored <abi_file> [<abi_file> ...]")
+        print("       python3 flpzCatalog.py duplicates <abi_file> [<abi_file> ...]")
+        print("       python3 flpzCatalog.py status")
+        print("       python3 flpzCatalog.py resume")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+import os
+import re
+import sys
+import glob
+import json
+import time
+import uuid
+import fcntl
+import socket
+import subprocess
+import threading
+import contextlib
+import numpy as np
+
+# Structured timing of a run. Every stage of the drivers, the jobs they submit and the Python helpers
+# append one JSON line per span to flpz_trace.jsonl in the working directory of the run:
+#   {"span", "parent", "stage", "irrep", "vector", "datapoint", "start", "end", "seconds", "status",
+#    "host", "job_id", "pid"} (+ "jobs" for the spans that wait on jobs)
+# Spans nest through the environment: a span started with run (or span() in Python) is the parent of
+# every span recorded by the processes it starts, which also inherit its irrep, vector and datapoint.
+# Jobs find the trace of their run by looking for flpz_trace.jsonl in their directory and the ones
+# above it, so a distortion job in SMODES_<irrep>/dist_<m> writes to the trace of the run as well.
+# summarize breaks a run down: the critical path of the driver (its top-level spans and the time
+# between them, with every wait on jobs split into queue wait, running and polling delay), percentiles
+# of every stage and the wall/cpu timing ABINIT reports in every .abo file below the run directory.
+#
+# Environment: FLPZ_TRACE_FILE    trace file (default: flpz_trace.jsonl, see above)
+#              FLPZ_TRACE=0       turns the tracing off
+
+# Usage: python3 flpzTrace.py run [-i <irrep>] [-v <vector>] [-d <datapoint>] <stage> <command> [<arg> ...]
+#        python3 flpzTrace.py record [-i <irrep>] [-v <vector>] [-d <datapoint>] [-s <status>] <stage> <start> [<end>]
+#        python3 flpzTrace.py summarize [<run_dir>]
+# run runs a command as a span and exits with its status. record writes a span of a stage that started
+# at <start> (seconds since the epoch, as date +%s.%N prints them) and ends now or at <end>.
+
+TRACE_FILE = "flpz_trace.jsonl"
+# Directories above the working directory searched for the trace of the run (SMODES_<irrep>/dist_<m>)
+SEARCH_DEPTH = 2
+ATTRIBUTES = ("irrep", "vector", "datapoint")
+PARENT_VARIABLE = "FLPZ_TRACE_PARENT"
+PERCENTILES = (50, 90, 99)
+# Spans shorter than this are left out of the critical path listing (they still count in its total)
+MIN_LISTED_SECONDS = 1.0
+
+FLOAT = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+DATASET_RE = re.compile(r"^\s*==\s*DATASET\s+(\d+)")
+# Cumulative cpu and wall seconds stamped by ABINIT (within the datasets and at the end of the run)
+TIMING_RE = re.compile(r"cpu=\s*(" + FLOAT + r")\s+wall=\s*(" + FLOAT + r")")
+OVERALL_RE = re.compile(r"Overall time at end \(sec\)\s*:\s*cpu=\s*(" + FLOAT + r")\s+wall=\s*(" + FLOAT + r")")
+
+
+def attribute_variable(name):
+    return f"FLPZ_TRACE_{name.upper()}"
+
+
+def is_enabled():
+    return os.environ.get("FLPZ_TRACE", "1") != "0"
+
+
+def trace_file():
+    """The trace of the run this process belongs to: FLPZ_TRACE_FILE, else the nearest flpz_trace.jsonl
+    in the working directory or the SEARCH_DEPTH directories above it, else one in the working directory."""
+    if os.environ.get("FLPZ_TRACE_FILE"):
+        return os.environ["FLPZ_TRACE_FILE"]
+    directory = os.getcwd()
+    for _ in range(SEARCH_DEPTH + 1):
+        if os.path.isfile(os.path.join(directory, TRACE_FILE)):
+            return os.path.join(directory, TRACE_FILE)
+        directory = os.path.dirname(directory)
+    return TRACE_FILE
+
+
+def job_id():
+    """SLURM (or local executor) job id of this process, <array_id>_<index> for array tasks."""
+    if os.environ.get("SLURM_ARRAY_JOB_ID") and os.environ.get("SLURM_ARRAY_TASK_ID"):
+        return f"{os.environ['SLURM_ARRAY_JOB_ID']}_{os.environ['SLURM_ARRAY_TASK_ID']}"
+    return os.environ.get("SLURM_JOB_ID", "")
+
+
+def context(**attributes):
+    """The attributes of a new span: the ones given, else those inherited from the enclosing span."""
+    return {name: str(attributes[name]) if attributes.get(name) not in (None, "") else
+            os.environ.get(attribute_variable(name), "") for name in ATTRIBUTES}
+
+
+def write_span(record, filename=None):
+    """Appends a span to the trace. Tracing never fails a stage: errors are only reported."""
+    if not is_enabled():
+        return
+    try:
+        with open(filename or trace_file(), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        print(f"Warning: could not write the trace span of {record['stage']}: {e}", file=sys.stderr)
+
+
+def record_span(stage, start, end=None, status=0, span_id=None, **attributes):
+    """Writes the span of a stage that ran from start to end (now by default). Extra keyword arguments
+    other than irrep, vector and datapoint are stored as they are (e.g. jobs)."""
+    end = time.time() if end is None else end
+    record = {"span": span_id or uuid.uuid4().hex[:12], "parent": os.environ.get(PARENT_VARIABLE) or None,
+              "stage": stage, **context(**attributes), "start": start, "end": end, "seconds": end - start,
+              "status": status, "host": socket.gethostname(), "job_id": job_id(), "pid": os.getpid()}
+    record.update({key: value for key, value in attributes.items() if key not in ATTRIBUTES})
+    write_span(record)
+    return record
+
+
+@contextlib.contextmanager
+def child_environment(span_id, attributes):
+    """Makes span_id the parent, and its attributes the defaults, of the spans started meanwhile.
+    Only the main thread does so: the environment is shared by every thread of the process."""
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+    names = [PARENT_VARIABLE] + [attribute_variable(name) for name in ATTRIBUTES]
+    saved = {name: os.environ.get(name) for name in names}
+    os.environ[PARENT_VARIABLE] = span_id
+    for name, value in attributes.items():
+        os.environ[attribute_variable(name)] = value
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+@contextlib.contextmanager
+def span(stage, **attributes):
+    """Records the block it encloses as a span of stage. The block may set the status of the span in the
+    dictionary it is given (0 by default); a block that raises fails the span with status 1."""
+    span_id = uuid.uuid4().hex[:12]
+    start = time.time()
+    details = {"status": 0}
+    try:
+        with child_environment(span_id, context(**attributes)):
+            yield details
+    except BaseException:
+        details["status"] = 1
+        raise
+    finally:
+        record_span(stage, start, status=details["status"], span_id=span_id, **attributes)
+
+
+def run_command(stage, command, attributes):
+    """Runs a command as a span. Returns its exit status."""
+    span_id = uuid.uuid4().hex[:12]
+    start = time.time()
+    with child_environment(span_id, context(**attributes)):
+        try:
+            status = subprocess.run(command).returncode
+        except OSError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            status = 127
+    record_span(stage, start, status=status, span_id=span_id, **attributes)
+    return status
+
+
+def read_spans(filename):
+    """Spans of a trace in file order. Lines cut short by a killed writer are skipped."""
+    spans = []
+    with open(filename) as f:
+        for line in f:
+            try:
+                spans.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return spans
+
+
+def abinit_timings(abo_file):
+    """Wall and cpu seconds of every dataset of an ABINIT output, as {dataset: (cpu, wall)}.
+
+    ABINIT stamps cumulative timings; a dataset takes the difference between the last stamp before its
+    end and the one before it started. A run without stamps inside its datasets (a single dataset, e.g.
+    a staged DFPT run) gets its overall time as dataset 0.
+    """
+    stamps = []
+    dataset = 0
+    overall = None
+    with open(abo_file, errors="replace") as f:
+        for line in f:
+            match = DATASET_RE.match(line)
+            if match:
+                dataset = int(match.group(1))
+                continue
+            match = OVERALL_RE.search(line)
+            if match:
+                overall = (float(match.group(1)), float(match.group(2)))
+                continue
+            match = TIMING_RE.search(line)
+            if match and dataset:
+                stamps.append((dataset, float(match.group(1)), float(match.group(2))))
+    timings = {}
+    starts = {}
+    previous = (0.0, 0.0)
+    for dataset, cpu, wall in stamps:
+        # With several stamps in a dataset its time ends with the last one
+        start = starts.setdefault(dataset, previous)
+        timings[dataset] = (cpu - start[0], wall - start[1])
+        previous = (cpu, wall)
+    if not timings and overall is not None:
+        timings[0] = overall
+    return timings
+
+
+def percentile_row(label, values):
+    values = np.asarray(values, dtype=float)
+    quantiles = " ".join(f"{np.percentile(values, q):10.1f}" for q in PERCENTILES)
+    return f"{label:28s} {len(values):6d} {values.sum():12.1f} {quantiles} {values.max():10.1f}"
+
+
+def describe(record):
+    labels = [f"{name} {record[name]}" for name in ATTRIBUTES if record.get(name)]
+    return record["stage"] + (f" ({', '.join(labels)})" if labels else "")
+
+
+def wait_breakdown(record, jobs):
+    """Splits a wait on jobs into queue wait (until the first job started), running (until the last one
+    ended) and polling delay (until the wait noticed), from the spans the jobs recorded."""
+    waited = {str(job_id).split("_")[0] for job_id in record.get("jobs", [])}
+    ran = [job for job in jobs if job["job_id"].split("_")[0] in waited and record["start"] <= job["end"] <= record["end"]]
+    if not ran:
+        return []
+    first_start = max(record["start"], min(job["start"] for job in ran))
+    last_end = max(job["end"] for job in ran)
+    return [("queue wait", first_start - record["start"]), (f"running ({len(ran)} jobs)", last_end - first_start),
+            ("polling delay", record["end"] - last_end)]
+
+
+def critical_path(spans):
+    """The driver's top-level spans in time order with the untraced time between them. The driver is the
+    process of the earliest top-level span; every other process (the jobs) runs off its path."""
+    top = [record for record in spans if not record.get("parent")]
+    if not top:
+        return None, []
+    first = min(top, key=lambda record: record["start"])
+    driver = [record for record in top if (record["host"], record["job_id"]) == (first["host"], first["job_id"])]
+    driver.sort(key=lambda record: record["start"])
+    path = []
+    cursor = driver[0]["start"]
+    for record in driver:
+        if record["start"] > cursor:
+            path.append((None, record["start"] - cursor))
+        if record["end"] > cursor:
+            path.append((record, record["end"] - max(cursor, record["start"])))
+            cursor = record["end"]
+    return first, path
+
+
+def summarize(run_dir):
+    """Prints the critical path, stage percentiles and ABINIT timings of a run directory."""
+    filename = os.path.join(run_dir, TRACE_FILE)
+    spans = read_spans(filename)
+    if not spans:
+        raise ValueError(f"{filename} holds no spans")
+    children = {}
+    for record in spans:
+        children.setdefault(record.get("parent"), []).append(record)
+    jobs = [record for record in spans if record["stage"] == "job"]
+
+    driver, path = critical_path(spans)
+    total = sum(seconds for _, seconds in path)
+    print(f"Critical path of {run_dir}: {total:.0f} s ({total / 3600:.2f} h) in driver job "
+          f"{driver['job_id'] or '-'} on {driver['host']}")
+    for record, seconds in path:
+        share = 100 * seconds / total if total > 0 else 0.0
+        if record is None:
+            if seconds >= MIN_LISTED_SECONDS:
+                print(f"  {'(untraced)':52s} {seconds:10.1f} s {share:5.1f}%")
+            continue
+        print(f"  {describe(record):52s} {seconds:10.1f} s {share:5.1f}%" + ("  FAILED" if record["status"] else ""))
+        for nested in sorted(children.get(record["span"], []), key=lambda child: child["start"]):
+            if nested["seconds"] >= MIN_LISTED_SECONDS and nested["stage"] != "job":
+                print(f"    {describe(nested):50s} {nested['seconds']:10.1f} s")
+                for part, part_seconds in wait_breakdown(nested, jobs):
+                    print(f"      {part:48s} {part_seconds:10.1f} s")
+        for part, part_seconds in wait_breakdown(record, jobs):
+            print(f"    {part:50s} {part_seconds:10.1f} s")
+
+    stages = {}
+    for record in spans:
+        stages.setdefault(record["stage"], []).append(record["seconds"])
+    quantiles = " ".join(f"{'p' + str(q):>10s}" for q in PERCENTILES)
+    print(f"\n{'Stage':28s} {'count':>6s} {'total (s)':>12s} {quantiles} {'max':>10s}")
+    for stage, seconds in sorted(stages.items(), key=lambda item: -sum(item[1])):
+        print(percentile_row(stage, seconds))
+    failed = [record for record in spans if record["status"]]
+    if failed:
+        print(f"\n{len(failed)} spans failed: {', '.join(describe(record) for record in failed[:10])}"
+              + (" ..." if len(failed) > 10 else ""))
+
+    # The links of the staged DFPT runs point at outputs that are already counted
+    abo_files = [path for path in glob.glob(os.path.join(run_dir, "**", "*.abo"), recursive=True)
+                 if not os.path.islink(path)]
+    timings = {}
+    for abo_file in abo_files:
+        for dataset, (cpu, wall) in abinit_timings(abo_file).items():
+            timings.setdefault(dataset, []).append((cpu, wall))
+    if timings:
+        print(f"\nABINIT timing of {len(abo_files)} outputs (wall seconds, cpu total)")
+        print(f"{'Dataset':28s} {'count':>6s} {'total (s)':>12s} {quantiles} {'max':>10s} {'cpu (s)':>12s}")
+        for dataset, values in sorted(timings.items()):
+            label = f"dataset {dataset}" if dataset else "whole run"
+            print(percentile_row(label, [wall for _, wall in values]) + f" {sum(cpu for cpu, _ in values):12.1f}")
+
+
+def parse_options(args, names):
+    """Leading -i/-v/-d/-s options of run and record. Returns (attributes, status, remaining args)."""
+    keys = {"-i": "irrep", "-v": "vector", "-d": "datapoint", "-s": "status"}
+    options = {}
+    while len(args) > 1 and args[0] in keys and keys[args[0]] in names:
+        options[keys[args[0]]] = args[1]
+        args = args[2:]
+    status = int(options.pop("status", 0))
+    return options, status, args
+
+
+def main():
+    args = sys.argv[1:]
+    try:
+        if len(args) >= 3 and args[0] == "run":
+            attributes, _, rest = parse_options(args[1:], ATTRIBUTES)
+            if len(rest) >= 2:
+                sys.exit(run_command(rest[0], rest[1:], attributes))
+        if len(args) >= 3 and args[0] == "record":
+            attributes, status, rest = parse_options(args[1:], ATTRIBUTES + ("status",))
+            if len(rest) in (2, 3):
+                end = float(rest[2]) if len(rest) == 3 else None
+                record_span(rest[0], float(rest[1]), end, status, **attributes)
+                return
+        if len(args) in (1, 2) and args[0] == "summarize":
+            summarize(args[1] if len(args) == 2 else ".")
+            return
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print("Usage: python3 flpzTrace.py run [-i <irrep>] [-v <vector>] [-d <datapoint>] <stage> <command> [<arg> ...]")
+    print("       python3 flpzTrace.py record [-i <irrep>] [-v <vector>] [-d <datapoint>] [-s <status>] <stage> <start> [<end>]")
+    print("       python3 flpzTrace.py summarize [<run_dir>]")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+import os
+import sys
+import numpy as np
+from scipy.spatial import cKDTree
+from polyFit import compile_terms
+from aboParser import parse_anaddb, matlab_vector, FLEXO_SHAPE, PIEZO_SHAPE
+from cellMapping import map_cells
+from symmetryFinder import find_operations
+
+# Symmetry reduction of amplitude scans and coupling grids. Every space-group operation of the
+# undistorted cell that carries the scanned eigendisplacements into their own span acts on the
+# amplitudes as a matrix D, and the cells at amplitudes a and D a are the same crystal rotated by
+# the cartesian part R of the operation: they share their total energy and their tensors are
+# related by R. The grid points are split into orbits under these matrices and only one
+# representative per orbit is calculated. Only grid points whose images are grid points themselves
+# share an orbit: a coupling grid runs over indices 1..grid_dim, so grid_range -0.5 0.5 -0.5 0.5
+# with grid_dim 10 10 gives -0.4 ... 0.5 on each axis and the +-x/+-y flips keep 36 of the 100
+# points; a range shifted half a step lower (-0.55 0.45 -0.55 0.45) is symmetric and keeps 25.
+# When the invariant polynomial of the order parameters is given (invariants keyword, as printed by
+# isoInvariant.sh), a sign flip of the amplitudes is only kept if every invariant term is even
+# under it, and for energy scans the sign flips allowed by the invariants are added even when no
+# operation of the cell was found for them.
+# Before the analysis, unfold links the outputs of every other grid point to its representative
+# and tensors prints the piezoelectric and flexoelectric tensors of every grid point, rotated from
+# the anaddb output of its representative.
+#
+# Input file keyword: grid_symmetry 1      turns the reduction on (uniform scans only)
+
+# Usage: python3 gridSymmetry.py unfold <symmetry_file>
+#        python3 gridSymmetry.py tensors [-p] <symmetry_file> <anaddb_output_N> [<anaddb_output_M> ...]
+# The symmetry file (gridSymmetry_vec<N>.in, written by datapointGen.py) has one line per datapoint:
+# "<abi_file> <representative_abi_file> <R11> ... <R33>", or "-" instead of R for the sign flips
+# that only the invariants allow.
+
+# Largest residual of a transformed (normalized) eigendisplacement outside the scanned span
+SPAN_TOLERANCE = 1e-4
+# Grid points closer than this fraction of the smallest grid step are the same point
+GRID_TOLERANCE = 1e-6
+OUTPUT_SUFFIXES = (".abo", "o_DS4_DDB", "o_DS5_DDB")
+# Voigt indices of anaddb (xx, yy, zz, yz, xz, xy) and the row pairs of its flexoelectric blocks
+VOIGT = ((0, 0), (1, 1), (2, 2), (1, 2), (0, 2), (0, 1))
+FLEXO_ROWS = ((0, 0), (1, 1), (2, 2), (1, 2), (0, 2), (0, 1), (2, 1), (2, 0), (1, 0))
+
+
+def symmetry_file(vecNum):
+    return f"gridSymmetry_vec{vecNum}.in"
+
+
+def is_enabled(params):
+    return params.get("grid_symmetry", ["0"])[0] == "1"
+
+
+def invariant_signs(terms, nvec):
+    """Sign flips of the amplitudes that leave every invariant term unchanged, as diagonal matrices."""
+    exponents = compile_terms(terms, "xy"[:nvec])
+    flips = []
+    for signs in np.array(np.meshgrid(*[[1, -1]] * nvec, indexing="ij")).reshape(nvec, -1).T:
+        if np.all(np.prod(signs[None, :] ** exponents, axis=1) == 1):
+            flips.append(np.diag(signs).astype(float))
+    return flips
+
+
+def amplitude_operations(cell, eig_disps, tolerance=SPAN_TOLERANCE):
+    """Matrices D acting on the amplitudes and cartesian rotations R of the operations of the cell that
+    map the span of the eigendisplacements onto itself. Operations with the same D are given once."""
+    rotations, translations = find_operations(cell["rprimd"], cell["xred"], cell["typat"])
+    A = cell["rprimd"]
+    # Columns of E are the eigendisplacements flattened over atoms and directions
+    E = eig_disps.reshape(len(eig_disps), -1).T
+    matrices, cartesian = [], []
+    for W, t in zip(rotations, translations):
+        R = A.T @ W @ np.linalg.inv(A.T)
+        moved = cell["xred"] @ W.T + t
+        mapping, _, _ = map_cells(A, cell["xred"], A, moved, cell["typat"], cell["typat"])
+        transformed = np.zeros_like(eig_disps)
+        transformed[:, mapping] = eig_disps @ R.T
+        G = transformed.reshape(len(eig_disps), -1).T
+        D = np.linalg.lstsq(E, G, rcond=None)[0]
+        if np.abs(E @ D - G).max() > tolerance:
+            continue
+        D = np.round(D, 8)
+        if not any(np.allclose(D, other) for other in matrices):
+            matrices.append(D)
+            cartesian.append(R)
+    return matrices, cartesian
+
+
+def consistent_with_invariants(D, flips):
+    """A diagonal D must be one of the sign flips allowed by the invariants; other matrices are kept."""
+    if not np.allclose(D, np.diag(np.diag(D))):
+        return True
+    return any(np.allclose(D, flip) for flip in flips)
+
+
+def orbits(amplitudes, matrices):
+    """Splits the grid into orbits. Returns for every point the index of its representative and the index
+    of the matrix carrying the representative onto it (-1 for the representatives themselves)."""
+    steps = np.ptp(amplitudes, axis=0) / max(len(amplitudes) - 1, 1)
+    tolerance = GRID_TOLERANCE * max(steps.min(), 1e-12) if len(amplitudes) > 1 else GRID_TOLERANCE
+    tree = cKDTree(amplitudes)
+    representative = np.full(len(amplitudes), -1)
+    operation = np.full(len(amplitudes), -1)
+    for point in range(len(amplitudes)):
+        if representative[point] >= 0:
+            continue
+        representative[point] = point
+        if not matrices:
+            continue
+        images = np.einsum("nij,j->ni", np.array(matrices), amplitudes[point])
+        distances, matched = tree.query(images, distance_upper_bound=tolerance)
+        for k, (distance, image) in enumerate(zip(distances, matched)):
+            if np.isfinite(distance) and representative[image] < 0:
+                representative[image] = point
+                operation[image] = k
+    return representative, operation
+
+
+def reduce_grid(program, scan, amplitudes):
+    """Representative of every grid point and the cartesian rotation (None when only the invariants
+    justify it) carrying the representative onto the point."""
+    params, eig_disps = scan["params"], scan["eig_disps"]
+    matrices, cartesian = amplitude_operations(scan["cell"], eig_disps)
+    terms = params.get("invariants", [])
+    if terms:
+        flips = invariant_signs(terms, len(eig_disps))
+        keep = [k for k, D in enumerate(matrices) if consistent_with_invariants(D, flips)]
+        matrices, cartesian = [matrices[k] for k in keep], [cartesian[k] for k in keep]
+        if program == "energy":
+            for flip in flips:
+                if not any(np.allclose(flip, D) for D in matrices):
+                    matrices.append(flip)
+                    cartesian.append(None)
+    representative, operation = orbits(amplitudes, matrices)
+    rotations = [np.eye(3) if k < 0 else cartesian[k] for k in operation]
+    return representative, rotations
+
+
+def write_symmetry_file(vecNum, prefixes, representative, rotations):
+    with open(symmetry_file(vecNum), "w") as f:
+        for prefix, rep, R in zip(prefixes, representative, rotations):
+            matrix = " ".join(f"{v:.10f}" for v in R.ravel()) if R is not None else "-"
+            f.write(f"{prefix}.abi {prefixes[rep]}.abi {matrix}\n")
+    print(f"Grid symmetry: {len(set(representative.tolist()))} of {len(prefixes)} datapoints to calculate")
+
+
+def read_symmetry_file(path):
+    """Returns a list of (abi_file, representative_abi_file, rotation or None) in datapoint order."""
+    entries = []
+    with open(path) as f:
+        for line in f:
+            words = line.split()
+            if not words:
+                continue
+            rotation = None if words[2] == "-" else np.array(words[2:11], dtype=float).reshape(3, 3)
+            entries.append((words[0], words[1], rotation))
+    return entries
+
+
+def representative_labels(params, labels):
+    """Labels of the datapoints that are calculated (every label when the grid is not reduced)."""
+    path = symmetry_file(params.get("vecNum", [""])[0])
+    if not is_enabled(params) or not os.path.isfile(path):
+        return labels
+    representatives = {abi_file for abi_file, rep, _ in read_symmetry_file(path) if abi_file == rep}
+    structure = params["name"][0].lower()
+    vecNum = params.get("vecNum", [""])[0]
+    return [label for label in labels if f"{structure}_{label}_vec{vecNum}.abi" in representatives]
+
+
+def unfold(path):
+    """Links the outputs of every datapoint that was not calculated to those of its representative."""
+    linked = 0
+    for abi_file, rep, _ in read_symmetry_file(path):
+        if abi_file == rep:
+            continue
+        for suffix in OUTPUT_SUFFIXES:
+            source, target = rep[:-4] + suffix, abi_file[:-4] + suffix
+            if os.path.isfile(source) and not os.path.exists(target):
+                os.symlink(os.path.basename(source), target)
+                linked += 1
+    print(f"Grid symmetry: linked {linked} outputs to their representatives")
+
+
+def rotate_piezo(tensor, R):
+    """Rotates a (6, 3) Voigt piezoelectric tensor e[jk, i]."""
+    full = np.zeros((3, 3, 3))
+    for row, (j, k) in enumerate(VOIGT):
+        full[:, j, k] = full[:, k, j] = tensor[row]
+    full = np.einsum("ia,jb,kc,abc->ijk", R, R, R, full)
+    return np.array([full[:, j, k] for j, k in VOIGT])
+
+
+def rotate_flexo(tensor, R):
+    """Rotates a (9, 6) flexoelectric tensor whose rows are the FLEXO_ROWS pairs and columns Voigt pairs."""
+    full = np.zeros((3, 3, 3, 3))
+    for row, (i, j) in enumerate(FLEXO_ROWS):
+        for column, (k, l) in enumerate(VOIGT):
+            full[i, j, k, l] = full[i, j, l, k] = tensor[row, column]
+    full = np.einsum("ia,jb,kc,ld,abcd->ijkl", R, R, R, R, full)
+    return np.array([[full[i, j, k, l] for k, l in VOIGT] for i, j in FLEXO_ROWS])
+
+
+def print_tensors(path, anaddb_files, run_piezo):
+    """Prints the tensors of every listed anaddb output (anaddbElec_N, N the 1-based datapoint) the way
+    aboParser.py tensors does, rotated from the representative onto the datapoint."""
+    entries = read_symmetry_file(path)
+    for anaddb_file in anaddb_files:
+        dataset = anaddb_file.rsplit("_", 1)[-1]
+        R = entries[int(dataset) - 1][2]
+        if R is None:
+            raise ValueError(f"datapoint {dataset} is only related to its representative by the invariants, "
+                             f"its tensors cannot be rotated")
+        results = parse_anaddb(anaddb_file)
+        if not run_piezo:
+            flexo = rotate_flexo(results["flexo"]["TOTAL"].reshape(FLEXO_SHAPE), R)
+            print(f"%Flexoelectric Tensor: Dataset {dataset}\n")
+            print(matlab_vector(f"mu{dataset}", flexo))
+            print("\n\n\n")
+        piezo = rotate_piezo(results["piezo_relaxed"].reshape(PIEZO_SHAPE), R)
+        print(f"%Piezoelectric Tensor: Dataset {dataset}\n")
+        print(matlab_vector(f"chi{dataset}", piezo))
+        print("\n\n\n")
+
+
+def main():
+    args = sys.argv[1:]
+    try:
+        if len(args) == 2 and args[0] == "unfold":
+            unfold(args[1])
+            return
+        if len(args) >= 3 and args[0] == "tensors":
+            run_piezo = args[1] == "-p"
+            args = args[2:] if run_piezo else args[1:]
+            if len(args) >= 2:
+                print_tensors(args[0], args[1:], run_piezo)
+                return
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print("Usage: python3 gridSymmetry.py unfold <symmetry_file>")
+    print("       python3 gridSymmetry.py tensors [-p] <symmetry_file> <anaddb_output_N> [<anaddb_output_M> ...]")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
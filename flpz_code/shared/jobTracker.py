@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import subprocess
+from flpzTrace import span
+
+# Tracks SLURM jobs with one scheduler query per tick for all outstanding ids, instead of one
+# squeue call per job per minute. A job array counts as one job that finishes with its last task.
+# The polling interval backs off while nothing changes and resets as soon as a job finishes.
+# Final states, exit codes and elapsed times are recorded. A failed squeue or sacct call says
+# nothing about the jobs (UNREACHABLE), so they stay pending and the query is retried; a job is only
+# given up as UNKNOWN once a successful accounting query has had no record of it for unknown_ticks
+# ticks in a row (a job that just finished may take a moment to reach the accounting database).
+# FakeScheduler is a local stand-in with the same query() interface for running without SLURM.
+# The command line waits through the executor selected by FLPZ_EXECUTOR (executors.py) and records
+# the wait as a span of the run's trace (flpzTrace.py) listing the jobs waited for.
+
+# Usage: python3 jobTracker.py wait [-t <timeout_seconds>] <job_id> [<job_id> ...]
+
+RECORD_FILE = "flpz_jobs.jsonl"
+ACTIVE_STATES = {"PENDING", "RUNNING", "CONFIGURING", "COMPLETING", "REQUEUED", "RESIZING",
+                 "SUSPENDED", "STAGE_OUT", "SIGNALING", "REQUEUE_HOLD", "REQUEUE_FED"}
+# State of the jobs of a tick whose scheduler query failed
+UNREACHABLE = "UNREACHABLE"
+UNKNOWN_TICKS = 3
+
+
+def parse_elapsed(text):
+    """Converts a SLURM [DD-]HH:MM:SS elapsed time to seconds."""
+    days = 0
+    if "-" in text:
+        day_text, text = text.split("-", 1)
+        days = int(day_text)
+    seconds = 0.0
+    for part in text.split(":"):
+        seconds = seconds * 60 + float(part)
+    return days * 86400 + seconds
+
+
+def base_id(job_id):
+    """Strips the array task suffix from a SLURM job id (123_4 -> 123)."""
+    return job_id.split("_")[0]
+
+
+def merge_task(record, task):
+    """Combines the sacct records of an array job's tasks: the first failure wins the state."""
+    if record is None:
+        return task
+    state, exit_code, elapsed = record if record[0] != "COMPLETED" or task[0] == "COMPLETED" else task
+    return state, exit_code, max(record[2], task[2])
+
+
+class SlurmScheduler:
+    """Queries squeue/sacct for a whole set of job ids at once."""
+
+    def run(self, args):
+        proc = subprocess.run(args, capture_output=True, text=True)
+        return proc.returncode, proc.stdout
+
+    def active(self, ids):
+        """Returns {job_id: state} for the ids still known to squeue, or None when squeue failed."""
+        code, out = self.run(["squeue", "-h", "-o", "%i %T", "-j", ",".join(ids)])
+        if code != 0 and not out.strip():
+            # Older SLURM versions reject the whole list if one id already left the queue
+            code, out = self.run(["squeue", "-h", "-o", "%i %T", "-u", os.environ.get("USER", "")])
+            if code != 0:
+                return None
+        states = {}
+        for line in out.splitlines():
+            words = line.split()
+            # Array tasks are listed as <array_id>_<index> or <array_id>_[<range>]
+            if len(words) >= 2 and base_id(words[0]) in ids:
+                states[base_id(words[0])] = words[1]
+        return states
+
+    def finished(self, ids):
+        """Returns {job_id: (state, exit_code, elapsed_seconds)} from the accounting database, or None
+        when sacct failed."""
+        code, out = self.run(["sacct", "-n", "-P", "-X", "-j", ",".join(ids),
+                              "-o", "JobID,State,ExitCode,Elapsed"])
+        records = {}
+        if code != 0:
+            return None
+        for line in out.splitlines():
+            words = line.split("|")
+            if len(words) == 4 and base_id(words[0]) in ids:
+                record = (words[1].split()[0], words[2], parse_elapsed(words[3]))
+                records[base_id(words[0])] = merge_task(records.get(base_id(words[0])), record)
+        return records
+
+    def query(self, ids):
+        """Returns {job_id: (state, exit_code, elapsed_seconds or None)} for every id."""
+        ids = list(ids)
+        active = self.active(ids)
+        if active is None:
+            return {job_id: (UNREACHABLE, None, None) for job_id in ids}
+        states = {job_id: (state, None, None) for job_id, state in active.items()}
+        done = [job_id for job_id in ids if job_id not in states]
+        if done:
+            records = self.finished(done)
+            for job_id in done:
+                if records is None:
+                    states[job_id] = (UNREACHABLE, None, None)
+                else:
+                    states[job_id] = records.get(job_id, ("UNKNOWN", None, None))
+        return states
+
+
+class FakeScheduler:
+    """In-process stand-in for SLURM: jobs finish a fixed time after submission. The next failures
+    queries fail as a whole, like an unreachable slurmctld."""
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.jobs = {}
+        self.failures = 0
+
+    def submit(self, duration, state="COMPLETED", exit_code="0:0"):
+        job_id = str(1000 + len(self.jobs))
+        self.jobs[job_id] = (self.clock(), duration, state, exit_code)
+        return job_id
+
+    def query(self, ids):
+        if self.failures > 0:
+            self.failures -= 1
+            return {job_id: (UNREACHABLE, None, None) for job_id in ids}
+        now = self.clock()
+        states = {}
+        for job_id in ids:
+            if job_id not in self.jobs:
+                states[job_id] = ("UNKNOWN", None, None)
+                continue
+            start, duration, state, exit_code = self.jobs[job_id]
+            if now - start < duration:
+                states[job_id] = ("RUNNING", None, None)
+            else:
+                states[job_id] = (state, exit_code, duration)
+        return states
+
+
+class JobTracker:
+    """Waits on a set of jobs with one scheduler query per tick and adaptive backoff."""
+
+    def __init__(self, scheduler=None, min_interval=10.0, max_interval=300.0, backoff=1.5,
+                 sleep=time.sleep, clock=time.time, log=print, unknown_ticks=UNKNOWN_TICKS):
+        self.scheduler = scheduler or SlurmScheduler()
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.unknown_ticks = unknown_ticks
+        self.sleep = sleep
+        self.clock = clock
+        self.log = log
+        self.records = {}
+
+    def wait(self, ids, timeout=None):
+        """Blocks until every job has left the queue and returns {job_id: record}.
+
+        Each record holds the final state, exit code and elapsed seconds. Returns early with the
+        jobs finished so far when the timeout (in seconds) is reached.
+        """
+        pending = [str(job_id) for job_id in ids if str(job_id) not in self.records]
+        start = self.clock()
+        interval = None
+        unknown = {}
+        while pending:
+            states = self.scheduler.query(pending)
+            still_pending = []
+            unreachable = 0
+            for job_id in pending:
+                state, exit_code, elapsed = states.get(job_id, ("UNKNOWN", None, None))
+                if state == UNREACHABLE:
+                    unreachable += 1
+                    still_pending.append(job_id)
+                    continue
+                unknown[job_id] = unknown.get(job_id, 0) + 1 if state == "UNKNOWN" else 0
+                if state in ACTIVE_STATES or 0 < unknown[job_id] < self.unknown_ticks:
+                    still_pending.append(job_id)
+                    continue
+                if elapsed is None:
+                    elapsed = self.clock() - start
+                self.records[job_id] = {"job_id": job_id, "state": state, "exit_code": exit_code,
+                                        "elapsed": elapsed, "finished": self.clock()}
+                self.log(f"Job {job_id} completed: {state} (exit {exit_code}, {elapsed:.0f} s)")
+
+            if unreachable:
+                self.log(f"Scheduler query failed, {unreachable} jobs kept pending")
+            # Poll quickly again after any change, otherwise back off towards max_interval
+            if interval is None or len(still_pending) < len(pending):
+                interval = self.min_interval
+            else:
+                interval = min(interval * self.backoff, self.max_interval)
+            pending = still_pending
+            if not pending:
+                break
+            if timeout is not None and self.clock() - start >= timeout:
+                self.log(f"Timeout reached with {len(pending)} jobs still in the queue")
+                break
+            self.sleep(interval)
+        return {str(job_id): self.records[str(job_id)] for job_id in ids if str(job_id) in self.records}
+
+    def failed(self):
+        return [job_id for job_id, record in self.records.items() if record["state"] != "COMPLETED"]
+
+
+def write_records(records, filename=RECORD_FILE):
+    with open(filename, "a") as f:
+        for record in records.values():
+            f.write(json.dumps(record) + "\n")
+
+
+def main():
+    args = sys.argv[1:]
+    timeout = None
+    if len(args) >= 3 and args[0] == "wait" and args[1] == "-t":
+        timeout = float(args[2])
+        args = [args[0]] + args[3:]
+    if not args or args[0] != "wait":
+        print("Usage: python3 jobTracker.py wait [-t <timeout_seconds>] <job_id> [<job_id> ...]")
+        sys.exit(1)
+
+    # executors.py builds on this module, so it is only imported when run as a script
+    from executors import get_executor
+    ids = [job_id for job_id in args[1:] if job_id]
+    tracker = JobTracker(get_executor())
+    with span("wait", jobs=ids) as details:
+        records = tracker.wait(ids, timeout=timeout)
+        details["status"] = 0 if len(records) == len(ids) and not tracker.failed() else 1
+    write_records(records)
+    if len(records) < len(ids):
+        sys.exit(1)
+    if tracker.failed():
+        print(f"Jobs that did not complete successfully: {' '.join(tracker.failed())}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+import os
+import re
+import sys
+import json
+import math
+import numpy as np
+from abinitInput import AbinitInput
+from crystalGeometry import cell_from_input
+from datapointGen import read_input_params
+from jobTracker import parse_elapsed
+from resultCache import cache_dir
+from symmetryFinder import (DEFAULT_TOLERANCE, cell_key, find_operations, operations_key, point_group,
+                            read_cached, write_cached)
+
+# Resource estimates of the datapoint jobs, learned from the runs that already finished. Instead of
+# requesting nproc ranks and time_limit for every job, each datapoint gets a rank count, a walltime
+# and a memory request predicted from its input: the number of atoms, ecut, nband, the number of
+# k-points left after the symmetry of the (displaced) cell reduces the ground-state mesh and the
+# dataset mix (ground state only, piezoelectric response or with the long-wave dataset). The cost
+# model is a log-linear fit of the measured wall times (and of ABINIT's memory estimate per rank) on
+# these features, pulled towards textbook scaling exponents so a handful of runs already give
+# sensible estimates. The walltime requested is the prediction times a safety margin taken from the scatter
+# of the fit, never more than time_limit. Shorter, tighter requests let the backfill scheduler start
+# the jobs sooner. Every finished datapoint (and SMODES run) is learned after the analysis; the
+# history lives in $FLPZ_CACHE_DIR/resources (default ~/.cache/flpz/resources).
+#
+# Input file keyword: estimate_resources 1     turns the estimates on (nproc becomes the rank limit)
+
+# Usage: python3 resourceEstimator.py learn <abi_file> [<abi_file> ...]
+#        python3 resourceEstimator.py estimate <vec_input_file> <abi_file> [<abi_file> ...]
+#        python3 resourceEstimator.py plan <vec_input_file> [<abi_file> ...]
+# learn adds the finished runs of the inputs (their .abo next to them) to the history. estimate
+# prints "<nproc> <walltime> <memory per cpu in MB or ->" covering all the inputs (one job array).
+# plan prints the estimate of every input (default: the datapoints of datasetsAbo_vec<N>.in) and the
+# total core-hours requested.
+
+FEATURES = ("natom", "ecut", "nband", "nkpt", "nproc", "dfpt", "longwave")
+# Scaling exponents the fit is pulled towards (dfpt and longwave are multiplicative factors of e^x):
+# plane waves ~ ecut^1.5, orthogonalisation ~ nband^2, k-points run in parallel over the ranks
+PRIORS = {"wall": {"natom": 1.0, "ecut": 1.5, "nband": 2.0, "nkpt": 1.0, "nproc": -0.85, "dfpt": 2.0, "longwave": 0.5},
+          "memory": {"natom": 1.0, "ecut": 1.5, "nband": 1.0, "nkpt": 1.0, "nproc": -0.7, "dfpt": 0.5, "longwave": 0.3}}
+# Weight of the priors against the measured runs (ridge penalty on the distance to the priors)
+PRIOR_WEIGHT = 4.0
+# Log-scatter of the fit assumed when too few runs are known, and its floor
+DEFAULT_SIGMA = 0.5
+MIN_SIGMA = 0.2
+MIN_SAMPLES = 3
+# Walltime requested: prediction x max(e^(2 sigma), MIN_MARGIN), at least MIN_WALLTIME seconds
+MIN_MARGIN = 1.25
+MIN_WALLTIME = 600
+MEMORY_STEP = 100
+# Bands per atom when the input leaves nband to ABINIT (about half the valence electrons, plus some)
+NBAND_PER_ATOM = 4.5
+KPOINT_RESOLUTION = 100000
+
+WALL_RE = re.compile(r"Overall time at end \(sec\)\s*:\s*cpu=\s*([\d.Ee+-]+)\s+wall=\s*([\d.Ee+-]+)")
+MEMORY_RE = re.compile(r"This job should need less than\s+([\d.Ee+-]+)\s+Mbytes")
+NPROC_RE = re.compile(r"mpi_nproc:\s*(\d+)|nproc\s*=\s*(\d+)")
+COMPLETED = "Calculation completed"
+
+
+def is_enabled(params):
+    return params.get("estimate_resources", ["0"])[0] == "1"
+
+
+def history_file():
+    return os.path.join(cache_dir(), "resources", "history.jsonl")
+
+
+def format_walltime(seconds):
+    """Formats seconds as a SLURM [D-]HH:MM:SS time."""
+    seconds = int(math.ceil(seconds))
+    days, seconds = divmod(seconds, 86400)
+    text = f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{days}-{text}" if days else text
+
+
+def cell_rotations(cell):
+    """Point-group rotations of a cell (reduced coordinates, duplicates removed), through the symmetry cache."""
+    lattice, xred, types = cell["rprimd"], cell["xred"], cell["typat"]
+    key = cell_key(lattice, xred, types, DEFAULT_TOLERANCE)
+    entry = read_cached("cell", key)
+    if entry is None:
+        rotations, translations = find_operations(lattice, xred, types, DEFAULT_TOLERANCE)
+        entry = {"operations_key": operations_key(rotations, translations, DEFAULT_TOLERANCE),
+                 "point_group": point_group(rotations), "rotations": rotations.tolist(),
+                 "translations": translations.tolist()}
+        write_cached("cell", key, entry)
+    return np.unique(np.array(entry["rotations"], dtype=int).reshape(-1, 9), axis=0).reshape(-1, 3, 3)
+
+
+def kpoint_mesh(model):
+    """Reduced coordinates of the ground-state k-point mesh (ngkpt or a diagonal kptrlatt, with shiftk),
+    or None with the number of points for a non-diagonal kptrlatt."""
+    if "kptrlatt" in model or "kptrlatt1" in model:
+        kptrlatt = np.rint(model.array("kptrlatt", dataset=1, shape=(3, 3))).astype(int)
+        if np.count_nonzero(kptrlatt - np.diag(np.diag(kptrlatt))):
+            return None, abs(int(round(np.linalg.det(kptrlatt))))
+        divisions = np.abs(np.diag(kptrlatt))
+    else:
+        divisions = np.rint(model.array("ngkpt", dataset=1, default=[1, 1, 1])[:3]).astype(int)
+    shifts = model.array("shiftk", dataset=1, default=[0.5, 0.5, 0.5])
+    nshiftk = int(model.scalar("nshiftk", dataset=1, default=len(shifts) // 3))
+    shifts = shifts[:3 * nshiftk].reshape(-1, 3)
+    divisions = np.maximum(divisions, 1)
+    grid = np.stack(np.meshgrid(*[np.arange(n) for n in divisions], indexing="ij"), axis=-1).reshape(-1, 3)
+    points = ((grid[None, :, :] + shifts[:, None, :]) / divisions).reshape(-1, 3)
+    return points, len(points)
+
+
+def irreducible_kpoints(points, rotations, kptopt):
+    """Number of k-points left once the mesh is folded by the symmetry ABINIT uses for kptopt: the point
+    group and time reversal (1), time reversal only (2), nothing (3) or the point group only (4)."""
+    if kptopt == 3 or len(points) == 1:
+        return len(points)
+    # A real-space rotation R of reduced coordinates maps k onto (R^-1)^T k
+    operations = [np.eye(3)] if kptopt == 2 else [np.rint(np.linalg.inv(R).T) for R in rotations]
+    if kptopt in (1, 2):
+        operations += [-op for op in operations]
+    images = np.einsum("nij,kj->nki", np.array(operations), points)
+    keys = np.rint(images * KPOINT_RESOLUTION).astype(np.int64) % KPOINT_RESOLUTION
+    keys = (keys[..., 0] * KPOINT_RESOLUTION + keys[..., 1]) * KPOINT_RESOLUTION + keys[..., 2]
+    # The orbit of a point is named after its smallest image; points of one orbit share the name
+    return len(np.unique(keys.min(axis=0)))
+
+
+def input_features(abi_file, nproc):
+    """Features of the cost model for an ABINIT input run on nproc ranks."""
+    model = AbinitInput.read(abi_file)
+    cell = cell_from_input(model)
+    natom = cell["natom"]
+    points, nkpt = kpoint_mesh(model)
+    kptopt = int(model.scalar("kptopt", dataset=1, default=1))
+    if points is not None and kptopt in (1, 4):
+        nkpt = irreducible_kpoints(points, cell_rotations(cell), kptopt)
+    elif points is not None:
+        nkpt = irreducible_kpoints(points, None, kptopt)
+    names = model.names()
+    ndtset = int(model.scalar("ndtset", default=1))
+    dfpt = ndtset >= 4 or any(name.startswith(("rfelfd", "rfphon", "rfstrs")) for name in names)
+    longwave = ndtset >= 5 or any(name.startswith("lw_") or name.startswith("optdriver") and model.get(name)[0] == "10"
+                                  for name in names)
+    return {"natom": natom,
+            "ecut": float(model.array("ecut", dataset=1)[0]),
+            "nband": float(model.scalar("nband", dataset=1, default=math.ceil(NBAND_PER_ATOM * natom))),
+            "nkpt": nkpt, "nproc": int(nproc), "dfpt": int(dfpt), "longwave": int(longwave)}
+
+
+def read_run(abo_file):
+    """nproc, wall time (s) and memory estimate per rank (MB, or None) of a completed ABINIT output, else None."""
+    with open(abo_file, errors="replace") as f:
+        text = f.read()
+    wall = WALL_RE.search(text)
+    if COMPLETED not in text or wall is None:
+        return None
+    nproc = NPROC_RE.search(text)
+    memory = [float(value) for value in MEMORY_RE.findall(text)]
+    return {"nproc": int(next(group for group in nproc.groups() if group)) if nproc else 1,
+            "wall": float(wall.group(2)), "memory": max(memory) if memory else None}
+
+
+def read_history():
+    if not os.path.isfile(history_file()):
+        return []
+    with open(history_file()) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def learn(abi_files):
+    """Adds the finished runs of the inputs to the history. Returns the number of runs added; a run
+    already known (e.g. an output restored from the result cache) is not added twice."""
+    history = read_history()
+    known = {json.dumps(sample, sort_keys=True) for sample in history}
+    added = []
+    for abi_file in abi_files:
+        abo_file = re.sub(r"\.abi$", "", abi_file) + ".abo"
+        # The output of a staged DFPT datapoint links to its ground-state stage alone (dfptStages.py)
+        if not os.path.isfile(abo_file) or os.path.islink(abo_file):
+            continue
+        run = read_run(abo_file)
+        if run is None:
+            continue
+        sample = dict(input_features(abi_file, run["nproc"]), wall=run["wall"], memory=run["memory"])
+        if json.dumps(sample, sort_keys=True) not in known:
+            known.add(json.dumps(sample, sort_keys=True))
+            added.append(sample)
+    if added:
+        os.makedirs(os.path.dirname(history_file()), exist_ok=True)
+        with open(history_file(), "a") as f:
+            f.write("".join(json.dumps(sample) + "\n" for sample in added))
+    return len(added), len(history) + len(added)
+
+
+def design_row(features):
+    return [1.0] + [math.log(max(features[name], 1)) if name not in ("dfpt", "longwave") else float(features[name])
+                    for name in FEATURES]
+
+
+def fit(samples, target):
+    """Log-linear model of a target ('wall' or 'memory'): the coefficients of the features minimise the
+    squared log error plus PRIOR_WEIGHT times their squared distance to the priors, the intercept is
+    free. Returns (coefficients, sigma) or None without samples."""
+    samples = [sample for sample in samples if sample.get(target)]
+    if not samples:
+        return None
+    X = np.array([design_row(sample) for sample in samples])
+    y = np.log([sample[target] for sample in samples])
+    prior = np.array([0.0] + [PRIORS[target][name] for name in FEATURES])
+    penalty = PRIOR_WEIGHT * np.eye(len(prior))
+    penalty[0, 0] = 0.0
+    coefficients = prior + np.linalg.solve(X.T @ X + penalty, X.T @ (y - X @ prior))
+    residuals = y - X @ coefficients
+    if len(samples) < MIN_SAMPLES:
+        sigma = DEFAULT_SIGMA
+    else:
+        sigma = max(MIN_SIGMA, float(np.sqrt(np.sum(residuals ** 2) / max(1, len(samples) - 1))))
+    return coefficients, sigma
+
+
+def predict(model, features):
+    coefficients, sigma = model
+    return math.exp(float(np.dot(design_row(features), coefficients))), sigma
+
+
+def rank_count(nkpt, max_nproc):
+    """Ranks that spread the k-points evenly: the fewest ranks giving the same k-points per rank as max_nproc."""
+    return max(1, min(max_nproc, math.ceil(nkpt / math.ceil(nkpt / max_nproc))))
+
+
+class Estimator:
+    """Estimates of the inputs of one vector input file (its nproc is the rank limit, its time_limit the
+    walltime limit)."""
+
+    def __init__(self, input_file):
+        params, _ = read_input_params(input_file)
+        self.max_nproc = int(params.get("nproc", ["1"])[0])
+        self.time_limit = parse_elapsed(params["time_limit"][0]) if "time_limit" in params else None
+        history = read_history()
+        self.models = {target: fit(history, target) for target in PRIORS}
+
+    def estimate(self, abi_file):
+        """(nproc, walltime in s or None, memory per cpu in MB or None) of one input."""
+        features = input_features(abi_file, self.max_nproc)
+        features["nproc"] = rank_count(features["nkpt"], self.max_nproc)
+        walltime = memory = None
+        if self.models["wall"] is not None:
+            wall, sigma = predict(self.models["wall"], features)
+            walltime = max(MIN_WALLTIME, wall * max(math.exp(2 * sigma), MIN_MARGIN))
+            if self.time_limit is not None and walltime > self.time_limit:
+                print(f"Warning: {abi_file} is estimated to need {format_walltime(walltime)}, "
+                      f"more than the time_limit", file=sys.stderr)
+                walltime = self.time_limit
+        if self.models["memory"] is not None:
+            per_rank, sigma = predict(self.models["memory"], features)
+            memory = math.ceil(per_rank * math.exp(sigma) / MEMORY_STEP) * MEMORY_STEP
+        return features["nproc"], walltime, memory
+
+    def fallback(self, walltime):
+        return walltime if walltime is not None else self.time_limit
+
+    def combined(self, abi_files):
+        """One estimate covering all the inputs (the largest of each resource), as a job array needs."""
+        estimates = [self.estimate(abi_file) for abi_file in abi_files]
+        walltimes = [walltime for _, walltime, _ in estimates if walltime is not None]
+        memories = [memory for _, _, memory in estimates if memory is not None]
+        return (max(nproc for nproc, _, _ in estimates), self.fallback(max(walltimes) if walltimes else None),
+                max(memories) if memories else None)
+
+
+def format_estimate(nproc, walltime, memory):
+    return f"{nproc} {format_walltime(walltime) if walltime is not None else '-'} {memory if memory else '-'}"
+
+
+def plan(input_file, abi_files):
+    """Prints the estimate of every input and the total core-hours requested."""
+    if not abi_files:
+        params, _ = read_input_params(input_file)
+        with open(f"datasetsAbo_vec{params.get('vecNum', [''])[0]}.in") as f:
+            abi_files = [re.sub(r"\.abo$", ".abi", line.strip()) for line in f if line.strip()]
+    estimator = Estimator(input_file)
+    if estimator.models["wall"] is None:
+        print(f"Resource plan: no finished runs learned yet, every job requests {estimator.max_nproc} ranks"
+              + (f" and {format_walltime(estimator.time_limit)}" if estimator.time_limit else ""))
+    total = 0.0
+    for abi_file in abi_files:
+        nproc, walltime, memory = estimator.estimate(abi_file)
+        walltime = estimator.fallback(walltime)
+        if estimator.models["wall"] is None:
+            nproc = estimator.max_nproc
+        if walltime is not None:
+            total += nproc * walltime / 3600
+        print(f"{abi_file:40s} {format_estimate(nproc, walltime, memory)}")
+    print(f"Resource plan: {len(abi_files)} jobs, {total:.1f} core-hours requested")
+
+
+def main():
+    args = sys.argv[1:]
+    try:
+        if len(args) >= 2 and args[0] == "learn":
+            added, total = learn(args[1:])
+            print(f"Resource history: {added} runs added, {total} known")
+            return
+        if len(args) >= 3 and args[0] == "estimate":
+            estimator = Estimator(args[1])
+            if estimator.models["wall"] is None:
+                raise ValueError("no finished runs learned yet")
+            print(format_estimate(*estimator.combined(args[2:])))
+            return
+        if len(args) >= 2 and args[0] == "plan":
+            plan(args[1], args[2:])
+            return
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print("Usage: python3 resourceEstimator.py learn <abi_file> [<abi_file> ...]")
+    print("       python3 resourceEstimator.py estimate <vec_input_file> <abi_file> [<abi_file> ...]")
+    print("       python3 resourceEstimator.py plan <vec_input_file> [<abi_file> ...]")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
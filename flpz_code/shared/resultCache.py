@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+import os
+import sys
+import glob
+import json
+import shutil
+import hashlib
+import tempfile
+import functools
+from aboParser import parse_abo
+from abinitInput import AbinitInput, to_number, split_dataset
+
+# Content-addressed cache of ABINIT results. An input is keyed by the sha256 of its canonical form:
+# variables sorted by name, n*value repeats expanded, numbers rounded to DECIMALS places and the
+# pseudopotential names replaced by checksums of their contents. Comments, layout and the input
+# file name therefore never change the key, while any change to the physics does.
+# Each entry holds the extracted results (results.json), the .abo file and, when stored with -a,
+# the DDB/WFK/DEN artifacts. Entries live under $FLPZ_CACHE_DIR (default ~/.cache/flpz) and the
+# least recently used ones are evicted once the store exceeds $FLPZ_CACHE_MAX_GB (default 50).
+
+# Usage: python3 resultCache.py key <abi_file> [<abi_file> ...]
+#        python3 resultCache.py fetch <abi_file> [<abi_file> ...]
+#        python3 resultCache.py store [-a] <abi_file> [<abi_file> ...]
+# fetch restores the outputs of every cached input next to it and prints the inputs it restored.
+
+CACHE_VERSION = "1"
+DECIMALS = 8
+DEFAULT_MAX_GB = 50.0
+IGNORED_VARIABLES = {"pp_dirpath"}
+# Restart files only change where the SCF starts, not the converged results (in any dataset)
+RESTART_VARIABLES = {"getwfk_filepath", "getden_filepath"}
+ARTIFACT_SUFFIXES = ("_DDB", "_WFK", "_DEN", "_1WF", "_1DEN")
+
+
+def cache_dir():
+    return os.path.expanduser(os.environ.get("FLPZ_CACHE_DIR", "~/.cache/flpz"))
+
+
+def max_cache_bytes():
+    return float(os.environ.get("FLPZ_CACHE_MAX_GB", DEFAULT_MAX_GB)) * 1024 ** 3
+
+
+def canonical_value(token):
+    number = to_number(token)
+    if number is None:
+        return token.lower() if not token.startswith('"') else token
+    # Adding 0.0 turns -0.0 into 0.0 so that signed zeros share a key
+    return f"{round(number, DECIMALS) + 0.0:.{DECIMALS}f}"
+
+
+def read_variables(abi_file):
+    """Parses an ABINIT input into {variable: [value tokens]} with repeats expanded."""
+    return AbinitInput.read(abi_file).variables
+
+
+def find_pseudo(name, pp_dirpath, abi_dir):
+    """Locates a pseudopotential the way ABINIT would, relative to the input or the current directory."""
+    for base in (abi_dir, os.getcwd()):
+        path = os.path.join(base, pp_dirpath, name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def canonical_input(abi_file):
+    """Returns the canonical text of an ABINIT input used as the cache key."""
+    variables = read_variables(abi_file)
+    pp_dirpath = variables.get("pp_dirpath", ['""'])[0].strip('"')
+    abi_dir = os.path.dirname(os.path.abspath(abi_file))
+    lines = []
+    for name in sorted(variables):
+        if name in IGNORED_VARIABLES or split_dataset(name)[0] in RESTART_VARIABLES:
+            continue
+        if name == "pseudos":
+            pseudos = [p.strip() for p in " ".join(variables[name]).strip('"').split(",") if p.strip()]
+            checksums = []
+            for pseudo in pseudos:
+                path = find_pseudo(pseudo, pp_dirpath, abi_dir)
+                if path is None:
+                    print(f"Warning: pseudopotential {pseudo} not found, keying {abi_file} on its name",
+                          file=sys.stderr)
+                    checksums.append(pseudo)
+                else:
+                    checksums.append(file_checksum(path))
+            lines.append("pseudos " + " ".join(checksums))
+        else:
+            lines.append(" ".join([name] + [canonical_value(v) for v in variables[name]]))
+    return "\n".join(lines) + "\n"
+
+
+def input_key(abi_file):
+    return hashlib.sha256((CACHE_VERSION + "\n" + canonical_input(abi_file)).encode()).hexdigest()
+
+
+def entry_dir(key):
+    return os.path.join(cache_dir(), key[:2], key)
+
+
+def output_prefix(abi_file):
+    """ABINIT names its outputs after the input file: name.abi -> name.abo, nameo_DS4_DDB."""
+    return abi_file[:-4] if abi_file.endswith(".abi") else abi_file
+
+
+def to_json(results):
+    return {quantity: {str(ds): value.tolist() if hasattr(value, "tolist") else value
+                       for ds, value in values.items()}
+            for quantity, values in results.items()}
+
+
+def fetch(abi_file):
+    """Restores the cached outputs of abi_file next to it. Returns True on a cache hit."""
+    entry = entry_dir(input_key(abi_file))
+    if not os.path.isfile(os.path.join(entry, "results.json")):
+        return False
+    prefix = output_prefix(abi_file)
+    for stored in os.listdir(os.path.join(entry, "outputs")):
+        shutil.copy2(os.path.join(entry, "outputs", stored), prefix + stored)
+    # The entry's modification time is its last use for the LRU eviction
+    os.utime(entry)
+    return True
+
+
+def store(abi_file, with_artifacts=False):
+    """Copies the outputs of a finished run into the cache. Returns the key, or None if nothing ran."""
+    prefix = output_prefix(abi_file)
+    abo_file = prefix + ".abo"
+    if not os.path.isfile(abo_file):
+        print(f"Warning: {abo_file} not found, {abi_file} was not cached", file=sys.stderr)
+        return None
+    results = parse_abo(abo_file)
+    if not results["etotal"]:
+        print(f"Warning: {abo_file} has no total energy, {abi_file} was not cached", file=sys.stderr)
+        return None
+
+    key = input_key(abi_file)
+    entry = entry_dir(key)
+    if os.path.isdir(entry):
+        os.utime(entry)
+        return key
+
+    outputs = [abo_file]
+    if with_artifacts:
+        outputs += [path for path in glob.glob(glob.escape(prefix) + "o_*") if path.endswith(ARTIFACT_SUFFIXES)]
+
+    # Build the entry in a temporary directory and rename it so concurrent readers never see half an entry
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=os.path.dirname(entry))
+    os.makedirs(os.path.join(tmp, "outputs"))
+    for path in outputs:
+        shutil.copy2(path, os.path.join(tmp, "outputs", path[len(prefix):]))
+    with open(os.path.join(tmp, "results.json"), "w") as f:
+        json.dump(to_json(results), f)
+    with open(os.path.join(tmp, "input.canonical"), "w") as f:
+        f.write(canonical_input(abi_file))
+    try:
+        os.rename(tmp, entry)
+    except OSError:
+        # Another run stored the same input first
+        shutil.rmtree(tmp, ignore_errors=True)
+    return key
+
+
+def entry_size(entry):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(entry) for name in names)
+
+
+def evict(limit=None):
+    """Removes the least recently used entries until the store fits in limit bytes."""
+    limit = max_cache_bytes() if limit is None else limit
+    entries = glob.glob(os.path.join(cache_dir(), "??", "*"))
+    sizes = {entry: entry_size(entry) for entry in entries}
+    total = sum(sizes.values())
+    for entry in sorted(entries, key=os.path.getmtime):
+        if total <= limit:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= sizes[entry]
+    return total
+
+
+def main():
+    args = sys.argv[1:]
+    with_artifacts = len(args) > 1 and args[0] == "store" and args[1] == "-a"
+    files = args[2 if with_artifacts else 1:]
+    if not files or args[0] not in ("key", "fetch", "store"):
+        print("Usage: python3 resultCache.py key <abi_file> [<abi_file> ...]")
+        print("       python3 resultCache.py fetch <abi_file> [<abi_file> ...]")
+        print("       python3 resultCache.py store [-a] <abi_file> [<abi_file> ...]")
+        sys.exit(1)
+
+    if args[0] == "key":
+        for abi_file in files:
+            print(f"{input_key(abi_file)} {abi_file}")
+    elif args[0] == "fetch":
+        for abi_file in files:
+            if os.path.isfile(abi_file) and fetch(abi_file):
+                print(abi_file)
+    else:
+        stored = [abi_file for abi_file in files if os.path.isfile(abi_file) and store(abi_file, with_artifacts)]
+        print(f"Cached {len(stored)} of {len(files)} calculations in {cache_dir()}")
+        evict()
+
+
+if __name__ == "__main__":
+    main()
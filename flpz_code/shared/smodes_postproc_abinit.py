@@ -5,6 +5,8 @@ import os
 import xml.etree.ElementTree as ET
 import time
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from aboParser import parse_abo
 np.set_printoptions(precision=10)
 #takes as input an smodes input file and irrep name and creates the distortions needed to do a symmetry adapted modes calculation
 #we expect a POSCAR file in this directory to get the header from
@@ -65,70 +67,43 @@ for lineNum in range(5+NumAtomTypes,len(headerLines)):
 
 #now get the forces from the runs
 
+def read_forces(SAM):
+	"""Returns the forces of the first dataset of dist_SAM, or an error message."""
+	thisOUTCAR="SMODES_"+targetIrrep+"/dist_"+str(SAM)+"/dist_"+str(SAM)+".abo"
+	forces=parse_abo(thisOUTCAR)["forces"]
+	if not forces:
+		return None,"No cartesian forces (eV/Angstrom) found in "+thisOUTCAR+". Quitting..."
+	#the first dataset holds the forces of the distorted cell
+	thisForces=forces[min(forces)]
+	if thisForces.shape!=(NumAtoms,3):
+		return None,"Expected "+str(NumAtoms)+" atoms of forces in "+thisOUTCAR+" but found "+str(thisForces.shape[0])+". Quitting..."
+	return thisForces,None
+
 #its one bigger because we have the initial forces we're going to subtract off
+#the .abo files are independent, so they are read concurrently
 forceMat_raw=np.zeros((NumAtoms,3,NumSAM+1))
-for SAM in range(NumSAM+1):
-	thisOUTCAR="SMODES_"+targetIrrep+"/dist_"+str(SAM)+"/dist_"+str(SAM)+".abo"
-	f=open(thisOUTCAR)
-	OUTCARLines=f.readlines()
-	f.close()	
-	lineStart=0
-	atomInd=0
-	for lineNum in range(len(OUTCARLines)):
-		words = OUTCARLines[lineNum].split()
-		if len(words)>=1:
-			if (words[0]=="cartesian") and (words[1]=="forces" ) and (words[2]=="(eV/Angstrom)" ):
-				lineStart=lineNum+1
-				break
-	for lineNum in range(lineStart,lineStart+NumAtoms):
-		words = OUTCARLines[lineNum].split()
-		forceMat_raw[atomInd,0,SAM]=float(words[1])
-		forceMat_raw[atomInd,1,SAM]=float(words[2])
-		forceMat_raw[atomInd,2,SAM]=float(words[3])
-		atomInd=atomInd+1
+with ThreadPoolExecutor(max_workers=min(32,NumSAM+1)) as pool:
+	for SAM,(thisForces,error) in enumerate(pool.map(read_forces,range(NumSAM+1))):
+		if error:
+			print(error)
+			quit()
+		forceMat_raw[:,:,SAM]=thisForces
 
 #subtract off initial forces and now fix the indexing to go from zero again
-forceList=np.zeros((NumAtoms,3,NumSAM))
-for SAM in range(NumSAM):
-	for i in range(NumAtoms):
-		for j in range(3):
-			forceList[i,j,SAM]=forceMat_raw[i,j,SAM+1]-forceMat_raw[i,j,0]			
-#build force matrix
-forceMat=np.zeros((NumSAM,NumSAM))
+forceList=forceMat_raw[:,:,1:]-forceMat_raw[:,:,[0]]
+#build force matrix, the projection of every force set onto every SAM
 SAMmat=SAMmat[:,:,1:]
-for f in range(NumSAM):
-	for s in range(NumSAM):
-		forceVal=np.multiply(forceList[:,:,f],SAMmat[:,:,s])
-		forceMat[f,s]=forceVal.sum()
-#build mass matrix
-#for m in range(NumSAM):
-#	thisMass=0
-#	for n in range(len(typeList)):
-#		if SAMatomLabel[m]==typeList[n]:
-#			thisMass=massList[n]
-#	if thisMass==0:
-#		print("Problem with building mass matrix. Quitting...")
-#		quit()
-#	else:
-#		M[m,m]=np.sqrt(thisMass)
+forceMat=np.einsum('ijf,ijs->fs',forceList,SAMmat)
 
 #make a vector thats the list of masses in order of the typelist
 massVec=np.zeros((NumSAM))
 for m in range(NumSAM):
-	thisMass=0
-	for n in range(len(typeList)):
-		if SAMatomLabel[m]==typeList[n]:
-			thisMass=massList[n]
-			massVec[m]=thisMass
-	if thisMass==0:
+	if SAMatomLabel[m] not in typeList:
 		print("Problem with building mass matrix. Quitting...")
 		quit()
+	massVec[m]=massList[typeList.index(SAMatomLabel[m])]
 
-MM=np.zeros((NumSAM,NumSAM))
-for m in range(NumSAM):
-	for n in range(NumSAM):
-		MM[m,n]=np.sqrt(massVec[m])*np.sqrt(massVec[n])
-#MM=np.matmul(M,npM)
+MM=np.outer(np.sqrt(massVec),np.sqrt(massVec))
 #divide by disp mag to get fc matrix
 
 FC_mat=-forceMat/DispMag
@@ -137,9 +112,10 @@ FC_mat=-forceMat/DispMag
 
 FC_mat=(FC_mat+np.transpose(FC_mat))/2.0
 Dyn_mat=np.divide(FC_mat,MM)
-#solve for the eigensystem, evals are still in SAM basis	
-FCevals, FCevecs_SAM = np.linalg.eig(FC_mat)
-Dynevals, Dynevecs_SAM = np.linalg.eig(Dyn_mat)
+#solve for the eigensystem, evals are still in SAM basis
+#both matrices are symmetric, so eigh gives real eigenvalues and orthonormal eigenvectors
+FCevals, FCevecs_SAM = np.linalg.eigh(FC_mat)
+Dynevals, Dynevecs_SAM = np.linalg.eigh(Dyn_mat)
 #convert Dyn evals to frequency in THz
 eV_to_J=1.602177E-19
 ang_to_m=1.0E-10
@@ -155,7 +131,6 @@ idx_Dyn = np.flip(Freq_THz.argsort()[::-1] )
 Freq_THz = Freq_THz[idx_Dyn]/(2*np.pi) #convert from 2piTHz
 Dynevecs_SAM = Dynevecs_SAM[:,idx_Dyn]
 
-#Freq_THz = Freq_THz/(2*np.pi) #convert from 2piTHz (did this above)
 #convert to cm^-1 
 Freq_cm=Freq_THz*1.0E12/(c)
 
@@ -164,31 +139,12 @@ idx_FC = np.flip(FC_eval.argsort()[::-1] )
 FC_eval = FC_eval[idx_FC]
 FCevecs_SAM = FCevecs_SAM[:,idx_FC]
 
-#print(Dyn_mat)
-#print(Dynevecs_SAM[:,0]) #this one is the eigenvector, with second index corresponding to eig index
-#print(Dynevecs_SAM[0,:])
-
-#now convert evecs to real space basis
-Dynevecs=np.zeros((NumAtoms,3,NumSAM))
-Fcevecs=np.zeros((NumAtoms,3,NumSAM))
-for evec in range(NumSAM):
-	realDynEvec=np.zeros((NumAtoms,3))
-	realFCEvec=np.zeros((NumAtoms,3))
-	for s in range(NumSAM):
-		#realDynEvec=realDynEvec+Dynevecs_SAM[evec,s]*SAMmat[:,:,s]#wrong bc you used 1st index as eig ind	
-		#realFCEvec=realFCEvec+FCevecs_SAM[evec,s]*SAMmat[:,:,s]	#wrong bc you used 1st index as eig ind
-		realDynEvec=realDynEvec+Dynevecs_SAM[s,evec]*SAMmat[:,:,s]	
-		realFCEvec=realFCEvec+FCevecs_SAM[s,evec]*SAMmat[:,:,s]	
-	Dynevecs[:,:,evec]=realDynEvec
-	Fcevecs[:,:,evec]=realFCEvec
+#now convert evecs to real space basis, the second index of the SAM-basis evecs is the eig index
+Dynevecs=np.tensordot(SAMmat,Dynevecs_SAM,axes=([2],[0]))
+Fcevecs=np.tensordot(SAMmat,FCevecs_SAM,axes=([2],[0]))
 
 #make mass matrix for defining reduced mass and phonon displacement eigenvectors
-MassCol=np.zeros((NumAtoms,3))
-atomind=0
-for atype in range(NumAtomTypes):
-	for j in range(typeCount[atype]):
-		MassCol[atomind,:]=np.sqrt(massList[atype])
-		atomind=atomind+1
+MassCol=np.repeat(np.sqrt(massList),typeCount)[:,None]*np.ones((1,3))
 
 #define phonon displacement eigenvectors, u
 #these are solutions to the generalized eigenvalue problem with
@@ -201,14 +157,11 @@ for atype in range(NumAtomTypes):
 #frequency=sqrt(deriv2/(redmass*AMU_to_kg)); %in 2piTHz
 #frequency=frequency/(2*pi*3e10); %in cm^-1
 
-PhonDispEigs=np.zeros((NumAtoms,3,NumSAM))
-redmassvec=np.zeros((NumAtoms,1)) #the reduced mass associated with the phonon mode
-for mode in range(NumSAM):
-	PhonDispEigs[:,:,mode]=np.divide(Dynevecs[:,:,mode],MassCol)
-	magSquared=np.sum(np.sum(np.multiply(PhonDispEigs[:,:,mode],PhonDispEigs[:,:,mode])))
-	redmassvec[mode]=1.0/magSquared
-	#normalize the new eigenvector
-	PhonDispEigs[:,:,mode]=PhonDispEigs[:,:,mode]/np.sqrt(magSquared)
+PhonDispEigs=np.divide(Dynevecs,MassCol[:,:,None])
+magSquared=np.sum(np.multiply(PhonDispEigs,PhonDispEigs),axis=(0,1))
+redmassvec=1.0/magSquared #the reduced mass associated with the phonon mode
+#normalize the new eigenvectors
+PhonDispEigs=PhonDispEigs/np.sqrt(magSquared)
 
 #now write these to files and put them in the original directory
 
@@ -219,55 +172,24 @@ FCevecFileName="SMODES_"+targetIrrep+"/FCEvecs.dat"
 PhonDispFileName="SMODES_"+targetIrrep+"/PhonDispVecs.dat"
 RedMassFileName="SMODES_"+targetIrrep+"/RedMass.dat"
 
+def vector_lines(vecs):
+	"""One line per mode with the flattened real space vector, as in the *Evecs.dat files."""
+	return "".join("".join("%.5f \t"%(v) for v in vecs[:,:,mode].ravel())+"\n" for mode in range(vecs.shape[2]))
+
 #write the Dynmat files
-Dval=open(DynFreqsFileName,'w')
-Dvec=open(DynevecFileName,'w')
-Dval.write("THz \t cm^-1 \n")
-#Dv.write("Irrep: "+str(targetIrrep)+"\n")
-for mode in range(NumSAM):
-	valstring="%.2f \t %.2f \n" % (Freq_THz[mode], Freq_cm[mode])
-	Dval.write(valstring)
-	for atom in range(NumAtoms):
-		for j in range(3):
-			Dvec.write("%.5f \t"%(Dynevecs[atom,j,mode]))
-#			print("Dynevecs["+str(atom)+","+str(j)+","+str(mode)+"] = "+str(Dynevecs[atom,j,mode]))
-	Dvec.write("\n")
-Dval.close()
-Dvec.close()
+with open(DynFreqsFileName,'w') as Dval:
+	Dval.write("THz \t cm^-1 \n"+"".join("%.2f \t %.2f \n" % (Freq_THz[mode], Freq_cm[mode]) for mode in range(NumSAM)))
+with open(DynevecFileName,'w') as Dvec:
+	Dvec.write(vector_lines(Dynevecs))
 
 #write the FC files
-FCval=open(FCevalFileName,'w')
-FCvec=open(FCevecFileName,'w')
-FCval.write("eV/A^2 \n")
-#Dv.write("Irrep: "+str(targetIrrep)+"\n")
-for mode in range(NumSAM):
-	valstring="%.2f \n" % (FC_eval[mode])
-	FCval.write(valstring)
-	for atom in range(NumAtoms):
-		for j in range(3):
-			FCvec.write("%.5f \t"%(Fcevecs[atom,j,mode]))
-	
-	FCvec.write("\n")
-
-FCval.close()
-FCvec.close()
+with open(FCevalFileName,'w') as FCval:
+	FCval.write("eV/A^2 \n"+"".join("%.2f \n" % (FC_eval[mode]) for mode in range(NumSAM)))
+with open(FCevecFileName,'w') as FCvec:
+	FCvec.write(vector_lines(Fcevecs))
 
 #write the phonon dist amplitude files and reduced masses
-Phonvec=open(PhonDispFileName,'w')
-Redmass=open(RedMassFileName,'w')
-Redmass.write("AMU \n")
-for mode in range(NumSAM):
-	valstring="%.4f \n" % (redmassvec[mode])
-	Redmass.write(valstring)
-
-	for atom in range(NumAtoms):
-		for j in range(3):
-			Phonvec.write("%.5f \t"%(PhonDispEigs[atom,j,mode]))
-	
-	Phonvec.write("\n")
-
-Phonvec.close()
-Redmass.close()
-
-
-
+with open(PhonDispFileName,'w') as Phonvec:
+	Phonvec.write(vector_lines(PhonDispEigs))
+with open(RedMassFileName,'w') as Redmass:
+	Redmass.write("AMU \n"+"".join("%.4f \n" % (redmassvec[mode]) for mode in range(NumSAM)))
@@ -1,13 +1,17 @@
 #!/usr/bin/env python3
 import numpy as np
 import subprocess
+import hashlib
 import os
-import xml.etree.ElementTree as ET
-import time
 import sys
+from resultCache import cache_dir
 np.set_printoptions(precision=10)
-#takes as input an smodes input file and irrep name and creates the distortions needed to do a symmetry adapted modes calculation
-#we expect a POSCAR file in this directory to get the header from
+#takes as input an smodes input file and one or more irrep names (or "all") and creates the distortions needed to do a symmetry adapted modes calculation
+#smodes is run once per smodes input: its raw output is cached under $FLPZ_CACHE_DIR/smodes keyed by the sha256 of the input,
+#split into one record per irrep, and headerFile_<irrep>.dat plus dist_<irrep>_<m> are written for every requested irrep
+#the smodes binary is taken from $SMODES_PATH
+#Usage: python3 smodes_symmadapt_abinit.py <smodes_input> <irrep> [<irrep> ...]
+#       python3 smodes_symmadapt_abinit.py <smodes_input> all
 
 
 #old version set this to your acell, as if you had normalized rprim. Ignore for now
@@ -20,257 +24,293 @@ atomList=[('1',   'H',    '1.008'), ('2',   'He'   ,'4.002'),('3',  'Li',   '6.9
 
 dispMag=0.001 #In angstroms!!
 symmPrec=1e-5 #this is the best smodes can do
-smodesFile=sys.argv[1]
-targetIrrep=sys.argv[2]
-
-#get acell from smodes file
-s=open(smodesFile)
-sLines=s.readlines()
-s.close()
-sWords=sLines[0].split()
-precLatParam = [float(sWords[0]), float(sWords[1]), float(sWords[2])]
-print("!!!!!")
-print("REMEMBER TO SET ACELL IN 1st LINE OF SMODES FILE, right now is:")
-print(precLatParam)
-print("!!!!!")
-
-
-smodes_path = '/home/iperez/isobyu/smodes'  # Replace with the actual path you found
-args = f'{smodes_path} <{smodesFile}'
-proc = subprocess.Popen(args, shell=True, stdout=subprocess.PIPE)
-output = proc.stdout.read()
-parsedOutput=output.decode('ascii')
-
-targetOutput=[]
-startTarget=999
-endTarget=0
-#endPositionis=0
-outList=parsedOutput.split("\n")
-for l in range(len(outList)):
-    thisLine=outList[l].split()
-    #print([l,thisLine])
-    if len(thisLine)>1:
-        if (    thisLine[0]=="Irrep") and (thisLine[1]==targetIrrep):
-            startTarget=l
-        
-    if (len(thisLine)>0) and (startTarget<999):
-        if thisLine[0]=="***********************************************":
-            endTarget=l
+smodes_path=os.environ.get("SMODES_PATH", "/home/iperez/isobyu/smodes")
+separatorLine="***********************************************"
+
+
+def read_lattice_params(smodesFile):
+    """Reads acell from the first line of the smodes input."""
+    s=open(smodesFile)
+    sLines=s.readlines()
+    s.close()
+    sWords=sLines[0].split()
+    precLatParam = [float(sWords[0]), float(sWords[1]), float(sWords[2])]
+    print("!!!!!")
+    print("REMEMBER TO SET ACELL IN 1st LINE OF SMODES FILE, right now is:")
+    print(precLatParam)
+    print("!!!!!")
+    return precLatParam
+
+
+def run_smodes(smodesFile):
+    """Returns the smodes output for an input file, running smodes only if it is not cached yet."""
+    with open(smodesFile,'rb') as f:
+        key=hashlib.sha256(smodes_path.encode()+b"\n"+f.read()).hexdigest()
+    cacheFile=os.path.join(cache_dir(),"smodes",key+".out")
+    if os.path.isfile(cacheFile):
+        print("Using cached smodes output "+cacheFile)
+        with open(cacheFile) as f:
+            return f.read()
+
+    with open(smodesFile) as stdin:
+        proc=subprocess.run([smodes_path],stdin=stdin,stdout=subprocess.PIPE)
+    if proc.returncode!=0:
+        print("smodes ("+smodes_path+") failed on "+smodesFile+". Quitting...")
+        sys.exit(1)
+    parsedOutput=proc.stdout.decode('ascii')
+
+    #write to a temporary file first so a concurrent run never reads half an output
+    os.makedirs(os.path.dirname(cacheFile),exist_ok=True)
+    tmpFile=cacheFile+"."+str(os.getpid())
+    with open(tmpFile,'w') as f:
+        f.write(parsedOutput)
+    os.replace(tmpFile,cacheFile)
+    return parsedOutput
+
+
+def split_irreps(parsedOutput):
+    """Splits the smodes output into the block of lines of every irrep, in output order."""
+    blocks={}
+    targetOutput=None
+    for line in parsedOutput.split("\n"):
+        thisLine=line.split()
+        if len(thisLine)>1 and thisLine[0]=="Irrep":
+            targetOutput=[]
+            blocks[thisLine[1]]=targetOutput
+        if targetOutput is not None:
+            if len(thisLine)>0 and thisLine[0]==separatorLine:
+                targetOutput=None
+            else:
+                targetOutput.append(line)
+    return blocks
+
+
+def parse_irrep(targetOutput):
+    """Parses the block of one irrep into the cell shape, atoms and symmetry adapted modes."""
+    targetOutput=list(targetOutput)
+    #check if it's raman or IR active, because we'll need to remove that line
+    if (targetOutput[3].split()[0]=='These'):
+        print('Includes translational modes')
+        del targetOutput[3] 
+
+    if (targetOutput[3].split()[0]=='IR'):
+        print('IR Active')
+        del targetOutput[3] 
+    if (targetOutput[3].split()[0]=='Raman'):
+        print('Raman Active')
+        del targetOutput[3] 
+
+    degeneracy=int(targetOutput[1].split()[-1])
+    print("Degeneracy: ", degeneracy)
+
+    numModes_withoutDegen=int(targetOutput[2].split()[-1])
+    print("Number of Modes: ", numModes_withoutDegen)
+
+    numModes=int(numModes_withoutDegen/degeneracy)
+
+    print("(Meaning ", numModes,"modes to find)")
+
+    v1=[float(i) for i in targetOutput[4].split()]
+    v2=[float(i) for i in targetOutput[5].split()]
+    v3=[float(i) for i in targetOutput[6].split()]
+    shapeCell=np.array([v1,v2,v3])
+    atom_list=[]
+    atom_pos_raw=[]
+
+    for l in range(8,len(targetOutput)):
+        thisLine=targetOutput[l].split()
+        if (targetOutput[l]=="Symmetry modes:"):
             break
-targetOutput=outList[startTarget:endTarget]
-#check if it's raman or IR active, because we'll need to remove that line
-if (targetOutput[3].split()[0]=='These'):
-    print('Includes translational modes')
-    del targetOutput[3] 
-
-if (targetOutput[3].split()[0]=='IR'):
-    print('IR Active')
-    del targetOutput[3] 
-if (targetOutput[3].split()[0]=='Raman'):
-    print('Raman Active')
-    del targetOutput[3] 
-
-
-
-degeneracy=int(targetOutput[1].split()[-1])
-print("Degeneracy: ", degeneracy)
-
-numModes_withoutDegen=int(targetOutput[2].split()[-1])
-print("Number of Modes: ", numModes_withoutDegen)
-
-numModes=int(numModes_withoutDegen/degeneracy)
-
-print("(Meaning ", numModes,"modes to find)")
-
-v1=[float(i) for i in targetOutput[4].split()]
-v2=[float(i) for i in targetOutput[5].split()]
-v3=[float(i) for i in targetOutput[6].split()]
-shapeCell=np.matrix([v1,v2,v3])
-atom_list=[]
-atom_pos_raw=[]
-
-for l in range(8,len(targetOutput)):
-    thisLine=targetOutput[l].split()
-    if (targetOutput[l]=="Symmetry modes:"):
-        break
-    if(len(thisLine)>=4):
-        atom_list.append(thisLine[1])
-#atom_pos.append([float(thisLine[2])*precLatParam[0],float(thisLine[3])*precLatParam[1],float(thisLine[4])*precLatParam[2]])
-        atom_pos_raw.append([float(thisLine[2]),float(thisLine[3]),float(thisLine[4])])
-
-numAtoms=len(atom_list)
-print("Number of Atoms: ",numAtoms)
-
-
-#find number of atom types and count them
-typeList=[]
-for a in range(numAtoms):
-    if (atom_list[a] in typeList) == False:
-        typeList.append(atom_list[a])
-
-typeCount=np.zeros((len(typeList)))
-for a in range(numAtoms):
+        if(len(thisLine)>=4):
+            atom_list.append(thisLine[1])
+            atom_pos_raw.append([float(thisLine[2]),float(thisLine[3]),float(thisLine[4])])
+
+    numAtoms=len(atom_list)
+    print("Number of Atoms: ",numAtoms)
+
+    startLine=8+numAtoms+3
+    if(targetOutput[startLine-2].split()[0]=="The"): #"The following include N translational modes"
+        startLine=startLine+1 #we want to skip this line if it exists
+
+    return {"numModes":numModes,"shapeCell":shapeCell,"atom_list":atom_list,"atom_pos_raw":atom_pos_raw,
+            "modeLines":targetOutput[startLine:]}
+
+
+def clean_list():
+    """Irrational numbers and even fractions that smodes prints with limited precision."""
+    cleanList=[float(1.0/3.0), float(2.0/3.0)]
+
+    for i in range(1,10):
+        cleanList.append(np.sqrt(3)/float(i))
+        cleanList.append(2*np.sqrt(3)/float(i))
+        cleanList.append(3*np.sqrt(3)/float(i))
+        cleanList.append(4*np.sqrt(3)/float(i))
+        cleanList.append(5*np.sqrt(3)/float(i))
+        cleanList.append(np.sqrt(2)/float(i))
+        cleanList.append(2*np.sqrt(2)/float(i))
+        cleanList.append(3*np.sqrt(2)/float(i))
+        cleanList.append(4*np.sqrt(2)/float(i))
+        cleanList.append(5*np.sqrt(2)/float(i))
+        cleanList.append(float(i)/6.0)
+        cleanList.append(float(i)/8.0)
+    return np.array(cleanList)
+
+
+def snap(values):
+    """Snaps every value within symmPrec of a cleanList entry onto it, keeping its sign."""
+    values=np.array(values,dtype=float)
+    cleanList=clean_list()
+    match=np.absolute(np.absolute(values)[...,None]-np.absolute(cleanList))<symmPrec
+    #the former loop over cleanList ended on the last matching entry, so pick that one
+    last=len(cleanList)-1-np.argmax(match[...,::-1],axis=-1)
+    return np.where(match.any(axis=-1),np.sign(values)*cleanList[last],values)
+
+
+def orthonormalize(SAMs):
+    """Orthonormalizes the (numAtoms*3, numModes) SAM matrix the way smodes_symmadapt always has.
+
+    Every SAM loses, in order, its projection onto each of the later normalized SAMs as read from smodes
+    (not onto their orthogonalized versions) and is then re-normalized. This is not a true Gram-Schmidt
+    when three or more SAMs overlap, but it is what headerFile and the dist files have always held.
+    The loop runs over the later SAM and updates all the earlier ones at once.
+    """
+    SAMs=SAMs/np.sqrt(np.sum(np.multiply(SAMs,SAMs),axis=0))
+    orth=SAMs.copy()
+    for n in range(1,SAMs.shape[1]):
+        #subtract off the projection onto SAM n from every SAM before it
+        orth[:,:n]=orth[:,:n]-np.outer(SAMs[:,n],np.sum(np.multiply(SAMs[:,n,None],orth[:,:n]),axis=0))
+    return orth/np.sqrt(np.sum(np.multiply(orth,orth),axis=0))
+
+
+def format_rows(rows):
+    """Formats a coordinate block the way the dist and header files expect it."""
+    return "".join(" ".join('{:.10f}'.format(v) for v in row)+" \n" for row in rows)
+
+
+def write_irrep(targetIrrep,record,precLatParam):
+    """Writes headerFile_<irrep>.dat and the dist_<irrep>_<m> distortions of one irrep."""
+    numModes=record["numModes"]
+    shapeCell=record["shapeCell"]
+    atom_list=record["atom_list"]
+    atom_pos_raw=record["atom_pos_raw"]
+    numAtoms=len(atom_list)
+
+    #find number of atom types and count them
+    typeList=[]
+    for a in range(numAtoms):
+        if (atom_list[a] in typeList) == False:
+            typeList.append(atom_list[a])
+
+    typeCount=np.zeros((len(typeList)))
+    for a in range(numAtoms):
+        for type in range(len(typeList)):
+            if (atom_list[a] == typeList[type]):
+                typeCount[type]=typeCount[type]+1
+    typeString=' '
     for type in range(len(typeList)):
-        if (atom_list[a] == typeList[type]):
-            typeCount[type]=typeCount[type]+1
-typeString=' '
-for type in range(len(typeList)):
-    typeString=typeString+str(int(typeCount[type]))+' '+typeList[type]+'\t '
-print('We use '+typeString)
-#clean the cell and convert it, searching for irrational numbers and even fractions
-cleanList=[float(1.0/3.0), float(2.0/3.0)]
-
-for i in range(1,10):
-    cleanList.append(np.sqrt(3)/float(i))
-    cleanList.append(2*np.sqrt(3)/float(i))
-    cleanList.append(3*np.sqrt(3)/float(i))
-    cleanList.append(4*np.sqrt(3)/float(i))
-    cleanList.append(5*np.sqrt(3)/float(i))
-    cleanList.append(np.sqrt(2)/float(i))
-    cleanList.append(2*np.sqrt(2)/float(i))
-    cleanList.append(3*np.sqrt(2)/float(i))
-    cleanList.append(4*np.sqrt(2)/float(i))
-    cleanList.append(5*np.sqrt(2)/float(i))
-    cleanList.append(float(i)/6.0)
-    cleanList.append(float(i)/8.0)
-
-for n in range(3):
-    for i in range(3):
-        for c in range(len(cleanList)):
-            if (np.absolute(np.absolute(shapeCell[n,i])-np.absolute(cleanList[c])))<symmPrec:
-                shapeCell[n,i]=np.sign(shapeCell[n,i])*cleanList[c] 
-Cell=np.multiply(shapeCell,np.matrix([precLatParam,precLatParam,precLatParam]))
-#Cell=np.vstack((shapeCell[0,:]*precLatParam[0],shapeCell[1,:]*precLatParam[1],shapeCell[2,:]*precLatParam[2]))
-print("Cell:")
-print(Cell)
-
-#also clean the atom positions
-
-atom_pos=atom_pos_raw
-for n in range(numAtoms):
-    for i in range(3):
-        for c in range(len(cleanList)):
-            if (np.absolute(np.absolute(atom_pos[n][i])-np.absolute(cleanList[c])))<symmPrec:
-#                print(str(n)+" "+str(i)+" "+str(atom_pos[n][i])+" to: ")
-                atom_pos[n][i]=np.sign(atom_pos[n][i])*cleanList[c] 
-#                print(str(atom_pos[n][i]))
-#convert to cartesian
-#print(precLatParam)
-for n in range(numAtoms):
-    for i in range(3):
-        atom_pos[n][i]=atom_pos[n][i]*precLatParam[i]
-posMatCart=np.matrix(atom_pos)
-#print(posMatCart)
-
-#fine all the maxses
-atomicNumList=[]
-atomicMassList=[]
-for i in range(len(typeList)):
-        foundAtom=0
-        for k in range(len(atomList)):
-            if atomList[k][1]==typeList[i]:
-                atomicNumList.append(atomList[k][0])
-                atomicMassList.append(atomList[k][2])
-                foundAtom=foundAtom+1
-                break
-        if foundAtom==0:
-            print("Could not recognize atom "+str(typeList[i])+", you'll have to manually enter mass and atomic number")
-            atomicNumList.append(0)
-            atomicMassList.append(0)
-
-
-#write header file and displacements
-headerName="headerFile_"+str(targetIrrep)+".dat"
-h=open(headerName,'w')
-h.write("Irrep: "+str(targetIrrep)+"\n")
-h.close()
-h=open(headerName,'a')
-h.write("NumSAM: "+str(numModes)+"\n")
-h.write("NumAtomTypes: "+str(len(typeList))+"\n")
-h.write("NumAtoms: "+str(numAtoms)+"\n")
-h.write("DispMag(angstrom): "+str(dispMag)+"\n")
-for i in range(len(typeList)):
-      h.write(f"{typeList[i]} {int(typeCount[i])} {atomicMassList[i]}\n")
-
-distMat=np.zeros((numAtoms,3,numModes+1))
-modeInd=1
-modeTypeList=[" "]*(numModes+1)
-
-startLine=8+numAtoms+3
-if(targetOutput[startLine-2].split()[0]=="The"): #"The following include N translational modes"
-    startLine=startLine+1 #we want to skip this line if it exists
-
-for l in range(startLine,len(targetOutput)):
-    thisLine=targetOutput[l].split()
-    if (targetOutput[l]=='------------------------------------------'):
-        modeInd=modeInd+1
-    else:    
-        atom=int(thisLine[0])-1
-        modeTypeList[modeInd]=thisLine[1]
-        disp1=float(thisLine[2])
-        disp2=float(thisLine[3])
-        disp3=float(thisLine[4])
-        distMat[atom,0,modeInd]=disp1        
-        distMat[atom,1,modeInd]=disp2        
-        distMat[atom,2,modeInd]=disp3        
-
-#now normalize the SAMs:
-for m in range(1,numModes+1):
-    distMat[:,:,m]=distMat[:,:,m]/np.sqrt(np.sum(np.multiply(distMat[:,:,m],distMat[:,:,m])))
-
-#now orthogonalize them
-orthMat=np.zeros((numAtoms,3,numModes+1))
-for m in range(1,numModes+1):
-    SAM=distMat[:,:,m]
-    for n in range(m+1,numModes+1):
-        #subtract off projection for every other mode we haven't orthogonalized yet:
-        SAM=SAM-distMat[:,:,n]*np.sum(np.multiply(distMat[:,:,n],SAM))
-    #re-normalize
-    orthMat[:,:,m]=SAM/np.sqrt(np.sum(np.multiply(SAM,SAM)))
-distMat=orthMat
-
-#abinit needs cross(R1,R2)*R3 to be positive
-crossDot=np.dot(np.cross(Cell[0,:],Cell[1,:]),np.transpose(Cell[2,:]))
-print("cross(R1,R2)*R3 is: ", crossDot, ", must be positive or Abinit will freak out")
-for m in range(numModes+1):
-    filename="dist_"+str(targetIrrep)+"_"+str(m)
-    thisDispCart=posMatCart+1.88973*dispMag*distMat[:,:,m] #the 1.88973 converts from angstrom to bohr
-    thisDispFrac=np.matmul(thisDispCart,np.linalg.inv(Cell))
-    f=open(filename,'w')
-#    f.write("Automatically generated with SMODES for irrep "+str(targetIrrep)+"\n")
-    f.close()
-    f=open(filename,'a')
-    f.write("natom "+str(numAtoms)+"\n")
-    f.write("ntypat "+str(len(typeCount))+"\n")
-    f.write("typat ")
-    for i in range(len(typeCount)):
-        for j in range(int(typeCount[i])):
-            f.write(str(int(i)+1)+'  ')
-    f.write("\n")
-    f.write("znucl ")
-    for i in range(len(atomicNumList)):
-        f.write(str(atomicNumList[i])+" ")
-
-    f.write("\n")
-    f.write("xred \n")
-    #we're also going to use this loop to write displacements to the header file
-    if m>0:
-        h.write("SAM_"+str(m)+": "+modeTypeList[m]+"\n")
-    for i in range(numAtoms):
-        for j in range(3):
-            f.write('{:.10f}'.format(thisDispFrac[i,j])+" ")
-            if m>0:
-                h.write('{:.10f}'.format(distMat[i,j,m])+" ")
-        f.write("\n")
+        typeString=typeString+str(int(typeCount[type]))+' '+typeList[type]+'\t '
+    print('We use '+typeString)
+
+    #clean the cell and atom positions, snapping irrational numbers and even fractions onto cleanList
+    shapeCell=snap(shapeCell)
+    Cell=shapeCell*np.array(precLatParam)
+    print("Cell:")
+    print(Cell)
+
+    #convert to cartesian
+    posMatCart=snap(atom_pos_raw)*np.array(precLatParam)
+
+    #fine all the maxses
+    atomicNumList=[]
+    atomicMassList=[]
+    for i in range(len(typeList)):
+            foundAtom=0
+            for k in range(len(atomList)):
+                if atomList[k][1]==typeList[i]:
+                    atomicNumList.append(atomList[k][0])
+                    atomicMassList.append(atomList[k][2])
+                    foundAtom=foundAtom+1
+                    break
+            if foundAtom==0:
+                print("Could not recognize atom "+str(typeList[i])+", you'll have to manually enter mass and atomic number")
+                atomicNumList.append(0)
+                atomicMassList.append(0)
+
+
+    #write header file and displacements
+    headerName="headerFile_"+str(targetIrrep)+".dat"
+    header=["Irrep: "+str(targetIrrep)+"\n",
+            "NumSAM: "+str(numModes)+"\n",
+            "NumAtomTypes: "+str(len(typeList))+"\n",
+            "NumAtoms: "+str(numAtoms)+"\n",
+            "DispMag(angstrom): "+str(dispMag)+"\n"]
+    for i in range(len(typeList)):
+        header.append(f"{typeList[i]} {int(typeCount[i])} {atomicMassList[i]}\n")
+
+    distMat=np.zeros((numAtoms,3,numModes+1))
+    modeInd=1
+    modeTypeList=[" "]*(numModes+1)
+
+    for line in record["modeLines"]:
+        thisLine=line.split()
+        if (line=='------------------------------------------'):
+            modeInd=modeInd+1
+        else:    
+            atom=int(thisLine[0])-1
+            modeTypeList[modeInd]=thisLine[1]
+            distMat[atom,:,modeInd]=[float(thisLine[2]),float(thisLine[3]),float(thisLine[4])]
+
+    distMat[:,:,1:]=orthonormalize(distMat[:,:,1:].reshape(numAtoms*3,numModes)).reshape(numAtoms,3,numModes)
+
+    #abinit needs cross(R1,R2)*R3 to be positive
+    crossDot=np.dot(np.cross(Cell[0,:],Cell[1,:]),Cell[2,:])
+    print("cross(R1,R2)*R3 is: ", crossDot, ", must be positive or Abinit will freak out")
+
+    #displaced cartesian and reduced coordinates of every distortion at once
+    dispCart=posMatCart[None,:,:]+1.88973*dispMag*np.moveaxis(distMat,2,0) #the 1.88973 converts from angstrom to bohr
+    dispFrac=np.matmul(dispCart,np.linalg.inv(Cell))
+
+    typat="".join(str(i+1)+'  ' for i in range(len(typeCount)) for j in range(int(typeCount[i])))
+    znucl="".join(str(atomicNum)+" " for atomicNum in atomicNumList)
+    cellText=format_rows(Cell)
+    for m in range(numModes+1):
+        filename="dist_"+str(targetIrrep)+"_"+str(m)
+        #the dist files keep the row layout of the original writer, loop_smodes.tcsh and smodes_postproc read them as is
+        with open(filename,'w') as f:
+            f.write("natom "+str(numAtoms)+"\n"
+                    +"ntypat "+str(len(typeCount))+"\n"
+                    +"typat "+typat+"\n"
+                    +"znucl "+znucl+"\n"
+                    +"xred \n"
+                    +format_rows(dispFrac[m])
+                    +"acell 3*1.0\nrprim\n"
+                    +cellText)
         if m>0:
-            h.write("\n")
-    f.write("acell 3*1.0\nrprim\n") 
-    for i in range(3):
-        for j in range(3):
-            f.write('{:.10f}'.format(Cell[i,j])+" ")
-        f.write("\n")
-
-    f.close()
-h.close()
-
-
+            header.append("SAM_"+str(m)+": "+modeTypeList[m]+"\n")
+            header.append(format_rows(distMat[:,:,m]))
+
+    with open(headerName,'w') as h:
+        h.write("".join(header))
+
+
+def main():
+    if len(sys.argv)<3:
+        print("Usage: python3 smodes_symmadapt_abinit.py <smodes_input> <irrep> [<irrep> ...]")
+        print("       python3 smodes_symmadapt_abinit.py <smodes_input> all")
+        sys.exit(1)
+    smodesFile=sys.argv[1]
+    precLatParam=read_lattice_params(smodesFile)
+    blocks=split_irreps(run_smodes(smodesFile))
+
+    targetIrreps=list(blocks) if sys.argv[2:]==["all"] else sys.argv[2:]
+    missing=[irrep for irrep in targetIrreps if irrep not in blocks]
+    if missing:
+        print("Irrep(s) "+" ".join(missing)+" not found in the smodes output of "+smodesFile+", available: "+" ".join(blocks))
+        sys.exit(1)
+    for targetIrrep in targetIrreps:
+        print("Irrep "+targetIrrep)
+        write_irrep(targetIrrep,parse_irrep(blocks[targetIrrep]),precLatParam)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+import os
+import re
+import sys
+import json
+import hashlib
+import tempfile
+import functools
+import itertools
+import subprocess
+import numpy as np
+from scipy.spatial import cKDTree
+from resultCache import cache_dir
+from crystalGeometry import read_cell, findsym_input
+
+# Space-group symmetry of a cell found in process with NumPy, replacing a findsym run per datapoint.
+# The lattice is Minkowski reduced, the candidate rotations are the integer matrices with entries
+# -1, 0, 1 that preserve its metric, and a rotation is kept when some translation maps every atom
+# onto an atom of its species within the tolerance (bohr), matched through a periodic KD-tree.
+# The operations give the point group directly. The space-group number of an operation set is
+# looked up in process with spglib, a required dependency (flpz installs it): a cell whose number
+# cannot be found is an error, never a blank. Cells with the same operations (e.g. every nonzero
+# amplitude along one mode, or the +Q/-Q pairs) share one lookup.
+# Results are cached under $FLPZ_CACHE_DIR/symmetry by a hash of the cell and of the operation set,
+# so identical cells are never analysed twice. With -c (or FLPZ_FINDSYM_CHECK=1) the external
+# findsym, when installed, cross-checks every number found by spglib.
+
+# Usage: python3 symmetryFinder.py [-t <tolerance>] [-c] number <abi_file>
+#        python3 symmetryFinder.py [-t <tolerance>] [-c] report <abi_file> [<abi_file> ...]
+#        python3 symmetryFinder.py [-t <tolerance>] operations <abi_file>
+# report prints "<abi_file> <number> <point group> <operations>" for every file; operations prints
+# every operation as its rotation and translation.
+
+DEFAULT_TOLERANCE = 1e-3
+DECIMALS = 6
+# Atoms screened on every candidate translation before it is tested on the whole cell
+QUICK_CHECK = 8
+# Every integer matrix with entries -1, 0, 1 and determinant +-1
+CANDIDATES = np.array([m for m in itertools.product((-1, 0, 1), repeat=9)], dtype=int).reshape(-1, 3, 3)
+CANDIDATES = CANDIDATES[np.abs(np.round(np.linalg.det(CANDIDATES))) == 1]
+# Rotation types (1, 2, 3, 4, 6 proper; -1, -2 = m, -3, -4, -6 improper) from the determinant and trace
+ROTATION_TYPES = {(1, 3): 1, (1, -1): 2, (1, 0): 3, (1, 1): 4, (1, 2): 6,
+                  (-1, -3): -1, (-1, 1): -2, (-1, 0): -3, (-1, -1): -4, (-1, -2): -6}
+TYPE_ORDER = (-6, -4, -3, -2, -1, 1, 2, 3, 4, 6)
+# Crystal classes by the number of rotations of every type in TYPE_ORDER
+POINT_GROUPS = {
+    (0, 0, 0, 0, 0, 1, 0, 0, 0, 0): "1", (0, 0, 0, 0, 1, 1, 0, 0, 0, 0): "-1",
+    (0, 0, 0, 0, 0, 1, 1, 0, 0, 0): "2", (0, 0, 0, 1, 0, 1, 0, 0, 0, 0): "m",
+    (0, 0, 0, 1, 1, 1, 1, 0, 0, 0): "2/m", (0, 0, 0, 0, 0, 1, 3, 0, 0, 0): "222",
+    (0, 0, 0, 2, 0, 1, 1, 0, 0, 0): "mm2", (0, 0, 0, 3, 1, 1, 3, 0, 0, 0): "mmm",
+    (0, 0, 0, 0, 0, 1, 1, 0, 2, 0): "4", (0, 2, 0, 0, 0, 1, 1, 0, 0, 0): "-4",
+    (0, 2, 0, 1, 1, 1, 1, 0, 2, 0): "4/m", (0, 0, 0, 0, 0, 1, 5, 0, 2, 0): "422",
+    (0, 0, 0, 4, 0, 1, 1, 0, 2, 0): "4mm", (0, 2, 0, 2, 0, 1, 3, 0, 0, 0): "-42m",
+    (0, 2, 0, 5, 1, 1, 5, 0, 2, 0): "4/mmm", (0, 0, 0, 0, 0, 1, 0, 2, 0, 0): "3",
+    (0, 0, 2, 0, 1, 1, 0, 2, 0, 0): "-3", (0, 0, 0, 0, 0, 1, 3, 2, 0, 0): "32",
+    (0, 0, 0, 3, 0, 1, 0, 2, 0, 0): "3m", (0, 0, 2, 3, 1, 1, 3, 2, 0, 0): "-3m",
+    (0, 0, 0, 0, 0, 1, 1, 2, 0, 2): "6", (2, 0, 0, 1, 0, 1, 0, 2, 0, 0): "-6",
+    (2, 0, 2, 1, 1, 1, 1, 2, 0, 2): "6/m", (0, 0, 0, 0, 0, 1, 7, 2, 0, 2): "622",
+    (0, 0, 0, 6, 0, 1, 1, 2, 0, 2): "6mm", (2, 0, 0, 4, 0, 1, 3, 2, 0, 0): "-6m2",
+    (2, 0, 2, 7, 1, 1, 7, 2, 0, 2): "6/mmm", (0, 0, 0, 0, 0, 1, 3, 8, 0, 0): "23",
+    (0, 0, 8, 3, 1, 1, 3, 8, 0, 0): "m-3", (0, 0, 0, 0, 0, 1, 9, 8, 6, 0): "432",
+    (0, 6, 0, 6, 0, 1, 3, 8, 0, 0): "-43m", (0, 6, 8, 9, 1, 1, 9, 8, 6, 0): "m-3m",
+}
+
+
+def symmetry_cache_dir():
+    return os.path.join(cache_dir(), "symmetry")
+
+
+def reduce_lattice(lattice):
+    """Minkowski reduction of the lattice vectors (rows).
+
+    Returns the reduced vectors and the unimodular integer matrix M with reduced = M @ lattice.
+    """
+    basis = np.array(lattice, dtype=float)
+    M = np.eye(3, dtype=int)
+    shortened = True
+    while shortened:
+        shortened = False
+        for i in range(3):
+            j, k = [n for n in range(3) if n != i]
+            # Gauss step against each other vector, then the +-1 combinations of both
+            for n in (j, k):
+                factor = int(np.round(basis[i] @ basis[n] / (basis[n] @ basis[n])))
+                if factor:
+                    basis[i] -= factor * basis[n]
+                    M[i] -= factor * M[n]
+                    shortened = True
+            for cj, ck in itertools.product((-1, 0, 1), repeat=2):
+                candidate = basis[i] + cj * basis[j] + ck * basis[k]
+                if candidate @ candidate < basis[i] @ basis[i] * (1 - 1e-10):
+                    basis[i] = candidate
+                    M[i] += cj * M[j] + ck * M[k]
+                    shortened = True
+    order = np.argsort(np.linalg.norm(basis, axis=1), kind="stable")
+    return basis[order], M[order]
+
+
+@functools.lru_cache(maxsize=16)
+def metric_rotations(metric, tolerance):
+    """Candidate rotations that preserve a metric (the Gram matrix of the lattice as a flat tuple)."""
+    G = np.array(metric).reshape(3, 3)
+    rotated = np.einsum("nji,jk,nkl->nil", CANDIDATES, G, CANDIDATES)
+    lengths = np.sqrt(np.diag(G))
+    allowed = tolerance * (lengths[:, None] + lengths[None, :]) + tolerance ** 2
+    return CANDIDATES[np.all(np.abs(rotated - G) <= allowed, axis=(1, 2))]
+
+
+def lattice_rotations(reduced, tolerance=DEFAULT_TOLERANCE):
+    """Integer rotations W (acting on column reduced coordinates) that preserve the metric of the lattice.
+
+    The scan of the candidates is shared by every cell of the same lattice, e.g. all datapoints of a scan.
+    """
+    return metric_rotations(tuple(np.round(reduced @ reduced.T, 8).ravel().tolist()), tolerance)
+
+
+def fold(xred):
+    folded = np.mod(xred, 1.0)
+    return np.where(folded >= 1.0, folded - 1.0, folded)
+
+
+class AtomMatcher:
+    """Matches moved atoms of a cell onto its atoms of the same species, one periodic KD-tree per species."""
+
+    def __init__(self, reduced, xred, types, tolerance):
+        self.reduced = reduced
+        self.xred = fold(xred)
+        self.types = np.asarray(types)
+        self.tolerance = tolerance
+        self.species = {t: np.flatnonzero(self.types == t) for t in np.unique(self.types)}
+        self.trees = {t: cKDTree(self.xred[atoms], boxsize=1.0) for t, atoms in self.species.items()}
+        # No reduced-coordinate step longer than this moves an atom by less than the tolerance
+        self.bound = tolerance / np.linalg.svd(reduced, compute_uv=False)[-1] * (1 + 1e-9)
+
+    def nearest(self, t, points):
+        """Atoms of species t nearest to the points, or None when one of them is beyond the tolerance."""
+        _, nearest = self.trees[t].query(points, distance_upper_bound=self.bound)
+        missing = nearest == len(self.species[t])
+        return nearest, missing
+
+    def screen(self, moved, translations, atoms):
+        """Mask of the candidate translations that carry each of the listed moved atoms onto an atom of its
+        species. The atoms are tested one at a time on the surviving candidates only."""
+        keep = np.ones(len(translations), dtype=bool)
+        for atom in atoms:
+            members = self.species[self.types[atom]]
+            survivors = np.flatnonzero(keep)
+            points = fold(moved[atom] + translations[survivors])
+            nearest, missing = self.nearest(self.types[atom], points)
+            keep[survivors[missing]] = False
+            survivors, points, nearest = survivors[~missing], points[~missing], nearest[~missing]
+            difference = points - self.xred[members[nearest]]
+            difference -= np.round(difference)
+            keep[survivors[np.linalg.norm(difference @ self.reduced, axis=1) > self.tolerance]] = False
+            if not keep.any():
+                break
+        return keep
+
+    def matches(self, moved):
+        """True when the moved atoms are a permutation of the atoms of the cell within tolerance."""
+        for t, members in self.species.items():
+            points = fold(moved[members])
+            nearest, missing = self.nearest(t, points)
+            if missing.any():
+                return False
+            difference = points - self.xred[members[nearest]]
+            difference -= np.round(difference)
+            if np.any(np.linalg.norm(difference @ self.reduced, axis=1) > self.tolerance):
+                return False
+            if len(np.unique(nearest)) != len(members):
+                return False
+        return True
+
+
+def find_operations(lattice, xred, types, tolerance=DEFAULT_TOLERANCE):
+    """Space-group operations of a cell as integer rotations and translations in its own lattice basis.
+
+    An operation maps reduced coordinates x (columns) onto rotation @ x + translation. Returns the
+    rotations (n, 3, 3) and translations (n, 3) in [0, 1); pure translations of supercells are included.
+    """
+    reduced, M = reduce_lattice(lattice)
+    # Reduced coordinates in the reduced basis: x_reduced = P x with P = inv(M)^T
+    P = np.round(np.linalg.inv(M).T).astype(int)
+    x = fold(np.asarray(xred, dtype=float) @ P.T)
+    types = np.asarray(types)
+    matcher = AtomMatcher(reduced, x, types, tolerance)
+
+    # Candidate translations carry one atom of the rarest species onto every atom of that species
+    counts = {t: len(atoms) for t, atoms in matcher.species.items()}
+    anchor_atoms = matcher.species[min(counts, key=counts.get)]
+    anchor = anchor_atoms[0]
+    # Atoms screened on every candidate before the survivors are tested on the whole cell, taken
+    # from every species in turn
+    quick = [atom for group in itertools.zip_longest(*matcher.species.values()) for atom in group
+             if atom is not None and atom != anchor][:QUICK_CHECK]
+
+    def translations(W, first_only):
+        moved = x @ W.T
+        candidates = x[anchor_atoms] - moved[anchor]
+        found = []
+        for t in candidates[matcher.screen(moved, candidates, quick)]:
+            if matcher.matches(moved + t):
+                found.append(fold(t))
+                if first_only:
+                    break
+        return found
+
+    lattice_translations = translations(np.eye(3, dtype=int), False)
+    rotations, shifts = [], []
+    for W in lattice_rotations(reduced, tolerance):
+        found = translations(W, True)
+        if not found:
+            continue
+        for pure in lattice_translations:
+            rotations.append(W)
+            shifts.append(fold(found[0] + pure))
+
+    # Back to the basis of the input cell: x' = M^T W P x + M^T t
+    rotations = np.einsum("ij,njk,kl->nil", M.T, np.array(rotations), P)
+    shifts = fold(np.array(shifts) @ M)
+    shifts[np.isclose(shifts, 1.0, atol=10 ** -DECIMALS)] = 0.0
+    return rotations, shifts
+
+
+def point_group(rotations):
+    """Hermann-Mauguin symbol of the crystal class of a set of rotations (duplicates are ignored)."""
+    unique = np.unique(np.asarray(rotations).reshape(-1, 9), axis=0).reshape(-1, 3, 3)
+    counts = dict.fromkeys(TYPE_ORDER, 0)
+    for W in unique:
+        counts[ROTATION_TYPES[(int(round(np.linalg.det(W))), int(np.trace(W)))]] += 1
+    return POINT_GROUPS.get(tuple(counts[t] for t in TYPE_ORDER), "?")
+
+
+def cell_key(lattice, xred, types, tolerance):
+    """Hash of a cell that ignores the atom order and coordinates differing by a lattice vector."""
+    xred = np.round(np.asarray(xred, dtype=float), DECIMALS) % 1.0
+    atoms = sorted(zip(np.asarray(types).tolist(), np.round(xred, DECIMALS).tolist()))
+    text = json.dumps([tolerance, np.round(lattice, DECIMALS).tolist(), atoms])
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def operations_key(rotations, translations, tolerance):
+    """Hash of an operation set in reduced coordinates: cells with the same operations in the same basis
+    share a space group."""
+    operations = sorted(zip(np.asarray(rotations).reshape(-1, 9).tolist(),
+                            np.round(translations, 4).tolist()))
+    return hashlib.sha256(json.dumps([tolerance, operations]).encode()).hexdigest()
+
+
+def read_cached(kind, key):
+    path = os.path.join(symmetry_cache_dir(), f"{kind}-{key}.json")
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_cached(kind, key, value):
+    os.makedirs(symmetry_cache_dir(), exist_ok=True)
+    path = os.path.join(symmetry_cache_dir(), f"{kind}-{key}.json")
+    # Written to a temporary file and renamed so concurrent readers never see half an entry
+    handle, tmp = tempfile.mkstemp(dir=symmetry_cache_dir())
+    with os.fdopen(handle, "w") as f:
+        json.dump(value, f)
+    os.replace(tmp, path)
+
+
+def spglib_number(lattice, xred, types, tolerance):
+    try:
+        import spglib
+    except ImportError:
+        raise ValueError("spglib is not installed (pip install spglib), space groups cannot be numbered")
+    dataset = spglib.get_symmetry_dataset((np.asarray(lattice), np.asarray(xred), np.asarray(types)),
+                                          symprec=tolerance)
+    if dataset is None:
+        raise ValueError(f"spglib found no space group within the tolerance {tolerance}")
+    return int(dataset["number"] if isinstance(dataset, dict) else dataset.number)
+
+
+def findsym_number(lattice, xred, types):
+    cell = {"natom": len(xred), "rprimd": np.asarray(lattice), "typat": np.asarray(types), "xred": np.asarray(xred)}
+    with tempfile.TemporaryDirectory() as scratch:
+        with open(os.path.join(scratch, "cell_findsym.in"), "w") as f:
+            f.write(findsym_input(cell))
+        try:
+            output = subprocess.run(["findsym", "cell_findsym.in"], cwd=scratch, capture_output=True,
+                                    text=True).stdout
+        except FileNotFoundError:
+            return None
+    match = re.search(r"_symmetry_Int_Tables_number\s+(\d+)", output)
+    return int(match.group(1)) if match else None
+
+
+def space_group_number(lattice, xred, types, tolerance, check=False):
+    number = spglib_number(lattice, xred, types, tolerance)
+    if check:
+        reference = findsym_number(lattice, xred, types)
+        if reference is not None and reference != number:
+            print(f"Warning: spglib finds space group {number}, findsym finds {reference}", file=sys.stderr)
+    return number
+
+
+def analyse(cells, tolerance=DEFAULT_TOLERANCE, check=False):
+    """Symmetry of every (lattice, xred, types) cell.
+
+    Returns one dictionary per cell with 'number', 'point_group', 'rotations' and 'translations';
+    raises ValueError when a number cannot be found. Each distinct cell is analysed and
+    each distinct operation set is looked up only once, across calls through the cache.
+    """
+    results = []
+    analysed = {}
+    numbers = {}
+    for lattice, xred, types in cells:
+        key = cell_key(lattice, xred, types, tolerance)
+        if key not in analysed:
+            analysed[key] = read_cached("cell", key)
+        if analysed[key] is None:
+            rotations, translations = find_operations(lattice, xred, types, tolerance)
+            analysed[key] = {"operations_key": operations_key(rotations, translations, tolerance),
+                             "point_group": point_group(rotations), "rotations": rotations.tolist(),
+                             "translations": translations.tolist()}
+            write_cached("cell", key, analysed[key])
+        entry = analysed[key]
+
+        group_key = entry["operations_key"]
+        if group_key not in numbers:
+            group = read_cached("ops", group_key)
+            if group is None:
+                group = {"number": space_group_number(lattice, xred, types, tolerance, check)}
+                write_cached("ops", group_key, group)
+            numbers[group_key] = group["number"]
+        results.append(dict(entry, number=numbers[group_key]))
+    return results
+
+
+def analyse_files(abi_files, tolerance=DEFAULT_TOLERANCE, check=False):
+    cells = [read_cell(abi_file) for abi_file in abi_files]
+    return analyse([(cell["rprimd"], cell["xred"], cell["typat"]) for cell in cells], tolerance, check)
+
+
+def main():
+    args = sys.argv[1:]
+    tolerance = DEFAULT_TOLERANCE
+    check = os.environ.get("FLPZ_FINDSYM_CHECK") == "1"
+    while args and args[0] in ("-t", "-c"):
+        if args[0] == "-c":
+            check = True
+            args = args[1:]
+        elif len(args) > 1:
+            tolerance = float(args[1])
+            args = args[2:]
+        else:
+            break
+    commands = {"number": 1, "report": None, "operations": 1}
+    if len(args) < 2 or args[0] not in commands or (commands[args[0]] and len(args) != 2):
+        print("Usage: python3 symmetryFinder.py [-t <tolerance>] [-c] number <abi_file>")
+        print("       python3 symmetryFinder.py [-t <tolerance>] [-c] report <abi_file> [<abi_file> ...]")
+        print("       python3 symmetryFinder.py [-t <tolerance>] operations <abi_file>")
+        sys.exit(1)
+
+    try:
+        results = analyse_files(args[1:], tolerance, check)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if args[0] == "number":
+        print(results[0]["number"])
+    elif args[0] == "report":
+        for abi_file, result in zip(args[1:], results):
+            print(f"{abi_file} {result['number']} {result['point_group']} {len(result['rotations'])}")
+    else:
+        for rotation, translation in zip(results[0]["rotations"], results[0]["translations"]):
+            print(" ".join(str(v) for row in rotation for v in row) + "   "
+                  + " ".join(f"{v:.6f}" for v in translation))
+
+
+if __name__ == "__main__":
+    main()
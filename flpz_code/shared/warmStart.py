@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+import io
+import os
+import re
+import sys
+import contextlib
+import numpy as np
+from datapointGen import read_input_params, amplitude_grid
+
+# Warm-start chaining of the datapoints of a scan. Neighbouring amplitudes differ by small
+# displacements, so instead of starting every ground-state SCF from scratch the datapoints are
+# ordered along a nearest-neighbour path through the amplitudes (a chain along a 1D scan, a
+# serpentine through a coupling grid), the path is cut into warm_start_width chains run side by side
+# and every datapoint reads the ground-state wavefunctions of the previous one of its chain through
+# getwfk_filepath1. The first datapoint of a chain starts from the nearest datapoint that has
+# already finished, when there is one (e.g. an earlier batch of an adaptive scan). Each step of the
+# chains is one job array whose task i waits for task i of the previous step, so the width trades
+# parallelism for fewer SCF iterations. A step is released whatever its tasks' exit status (the
+# status is kept in the trace), so a failed datapoint does not cancel the rest of its chain. The
+# response-function datasets of a perturbation run start from the converged ground state of the same
+# run as before.
+#
+# Input file keywords: warm_start 1             turns the chaining on
+#                      warm_start_width <n>     chains run at once (default array_throttle, else 4)
+
+# Usage: python3 warmStart.py plan <vec_input_file> <task_list>
+#        python3 warmStart.py check <abi_file> [<abi_file> ...]
+# plan chains the datapoints of task_list (one datapoint prefix per line), writes the task list of
+# every step to warmStartTasks_vec<N>_<step>.in and prints their names in order. check is run by
+# every job before abinit: it points the input at the WFK file its predecessor actually wrote, or
+# drops the warm start when there is none (e.g. the predecessor failed), so the datapoint starts cold.
+
+DEFAULT_WIDTH = 4
+WFK_VARIABLE = "getwfk_filepath1"
+# Ground-state wavefunctions written by a datapoint, depending on how ABINIT suffixes its datasets
+WFK_SUFFIXES = ("o_DS1_WFK", "o_WFK")
+WFK_LINE_RE = re.compile(r"^\s*" + WFK_VARIABLE + r"\s.*\n?", re.MULTILINE)
+
+
+def is_enabled(params):
+    return params.get("warm_start", ["0"])[0] == "1"
+
+
+def chain_width(params):
+    throttle = params.get("array_throttle", [str(DEFAULT_WIDTH)])[0]
+    return max(1, int(params.get("warm_start_width", [throttle])[0]))
+
+
+def nearest_neighbour_path(points):
+    """Orders the points by always moving to the nearest unvisited one, starting from the point closest
+    to zero amplitude. Coordinates are scaled to the unit box so both amplitudes weigh the same."""
+    scale = np.where(np.ptp(points, axis=0) > 0, np.ptp(points, axis=0), 1.0)
+    scaled = points / scale
+    current = int(np.argmin(np.linalg.norm(scaled, axis=1)))
+    path = [current]
+    unvisited = np.ones(len(points), dtype=bool)
+    unvisited[current] = False
+    while unvisited.any():
+        candidates = np.flatnonzero(unvisited)
+        current = int(candidates[np.argmin(np.linalg.norm(scaled[candidates] - scaled[current], axis=1))])
+        path.append(current)
+        unvisited[current] = False
+    return path
+
+
+def split_path(path, width):
+    """Cuts a path into at most width contiguous chains of near equal length, longest first."""
+    chains = [list(chain) for chain in np.array_split(np.array(path, dtype=int), min(width, len(path)))]
+    return sorted(chains, key=len, reverse=True)
+
+
+def written_wfk(prefix):
+    """The WFK file a finished datapoint left behind, or None."""
+    for suffix in WFK_SUFFIXES:
+        if os.path.isfile(prefix + suffix):
+            return prefix + suffix
+    return None
+
+
+def set_warm_start(abi_file, wfk_file):
+    """Points an input at a WFK file (None removes the warm start). The input is edited as text so its
+    comments are kept; getwfk1 0 stays in place, getwfk_filepath1 takes precedence over it."""
+    with open(abi_file) as f:
+        text = WFK_LINE_RE.sub("", f.read())
+    if wfk_file is not None:
+        line = f'{WFK_VARIABLE} "{wfk_file}"\n'
+        match = re.search(r"^\s*getwfk1\s.*\n", text, re.MULTILINE)
+        text = text[:match.end()] + line + text[match.end():] if match else text + line
+    with open(abi_file, "w") as f:
+        f.write(text)
+
+
+def plan(input_file, task_list):
+    """Chains the datapoints of the task list and returns the task lists of the steps."""
+    params, _ = read_input_params(input_file)
+    structure = params["name"][0].lower()
+    vecNum = params.get("vecNum", [""])[0]
+    with contextlib.redirect_stdout(io.StringIO()):
+        amplitudes, labels = amplitude_grid(params)
+    prefixes = [f"{structure}_{label}_vec{vecNum}" for label in labels]
+    index = {prefix: i for i, prefix in enumerate(prefixes)}
+    with open(task_list) as f:
+        tasks = [line.strip() for line in f if line.strip()]
+    unknown = [task for task in tasks if task not in index]
+    if unknown:
+        raise ValueError(f"{', '.join(unknown)} are not datapoints of {input_file}")
+
+    points = amplitudes[[index[task] for task in tasks]]
+    chains = split_path(nearest_neighbour_path(points), chain_width(params))
+    pending = set(tasks)
+    finished = [(i, wfk) for i, wfk in ((i, written_wfk(prefix)) for i, prefix in enumerate(prefixes)
+                                         if prefix not in pending) if wfk is not None]
+    scale = np.where(np.ptp(amplitudes, axis=0) > 0, np.ptp(amplitudes, axis=0), 1.0)
+
+    for chain in chains:
+        start = None
+        if finished:
+            distances = np.linalg.norm((amplitudes[[i for i, _ in finished]] - points[chain[0]]) / scale, axis=1)
+            start = finished[int(np.argmin(distances))][1]
+        set_warm_start(f"{tasks[chain[0]]}.abi", start)
+        for previous, task in zip(chain, chain[1:]):
+            set_warm_start(f"{tasks[task]}.abi", tasks[previous] + WFK_SUFFIXES[0])
+
+    step_lists = []
+    for step in range(len(chains[0]) if chains else 0):
+        step_list = f"warmStartTasks_vec{vecNum}_{step}.in"
+        with open(step_list, "w") as f:
+            f.write("".join(tasks[chain[step]] + "\n" for chain in chains if len(chain) > step))
+        step_lists.append(step_list)
+    print(f"Warm start: {len(tasks)} datapoints in {len(chains)} chains of up to {len(step_lists)} steps",
+          file=sys.stderr)
+    return step_lists
+
+
+def check(abi_file):
+    """Repoints or drops the warm start of an input whose WFK file is missing."""
+    with open(abi_file) as f:
+        match = re.search(r"^\s*" + WFK_VARIABLE + r'\s+"?([^"\s]+)"?', f.read(), re.MULTILINE)
+    if match is None or os.path.isfile(match.group(1)):
+        return
+    prefix = match.group(1)[:-len(WFK_SUFFIXES[0])] if match.group(1).endswith(WFK_SUFFIXES[0]) else None
+    wfk_file = written_wfk(prefix) if prefix else None
+    set_warm_start(abi_file, wfk_file)
+    if wfk_file is None:
+        print(f"Warm start: {match.group(1)} not found, {abi_file} starts from scratch")
+
+
+def main():
+    args = sys.argv[1:]
+    try:
+        if len(args) == 3 and args[0] == "plan":
+            for step_list in plan(args[1], args[2]):
+                print(step_list)
+            return
+        if len(args) >= 2 and args[0] == "check":
+            for abi_file in args[1:]:
+                check(abi_file)
+            return
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print("Usage: python3 warmStart.py plan <vec_input_file> <task_list>")
+    print("       python3 warmStart.py check <abi_file> [<abi_file> ...]")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
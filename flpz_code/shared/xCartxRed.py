@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 import sys
-import os
 import numpy as np
+from crystalGeometry import lattice_vectors, xcart_to_xred, xred_to_xcart
+
+# Command line wrapper of the reduced/cartesian conversion in crystalGeometry.py
 
 def parse_args():
     if len(sys.argv) != 8:
@@ -15,44 +17,25 @@ def parse_args():
         print(f"Error parsing arguments: {e}")
         sys.exit(1)
 
-def reshape_rprimxCxR(rprim_str, xCxR_str):
+def reshape_rprimxCxR(rprim_str, xCxR_str, natom):
     rprim_list = [float(x) for x in rprim_str.split()]
     xCxR_list = [float(x) for x in xCxR_str.split()]
-    return np.array(rprim_list).reshape(3, 3), np.array(xCxR_list).reshape(int(natom), 3)
-
-def calculateXred(rprim, xcart, a, b, c):
-    # Scale the primitive vectors by acell
-    rprim_scaled = rprim.copy()  # Created a copy to avoid modifying the original
-    natom, num_cords = xcart.shape
-    xred=np.empty((natom, num_cords))
-    rprim_scaled[0] *= a
-    rprim_scaled[1] *= b
-    rprim_scaled[2] *= c
-    xred = np.dot(xcart, np.linalg.inv(rprim_scaled))
-    return xred
-
-def calculateXcart(rprim, xred, a, b, c): 
-    # Scale the primitive vectors by acell
-    rprim_scaled = rprim.copy()  # Created a copy to avoid modifying the original
-    natom, num_cords = xred.shape
-    xcart=np.empty((natom, num_cords))
-    rprim_scaled[0] *= a
-    rprim_scaled[1] *= b
-    rprim_scaled[2] *= c
-    xcart = np.dot(xred, rprim_scaled)
-    return xcart
-
+    return np.array(rprim_list).reshape(3, 3), np.array(xCxR_list).reshape(natom, 3)
 
-mode, rprim_str, xCxR_str, a, b, c, natom = parse_args()
-rprim, xCxR = reshape_rprimxCxR(rprim_str, xCxR_str)
+def main():
+    mode, rprim_str, xCxR_str, a, b, c, natom = parse_args()
+    rprim, xCxR = reshape_rprimxCxR(rprim_str, xCxR_str, natom)
+    rprimd = lattice_vectors([a, b, c], rprim)
 
-if mode.lower() == "xred":
-    result = calculateXred(rprim, xCxR, a, b, c)
-    for row in result:
-        print(" ".join(f"{x:.10f}" for x in row))
-elif mode.lower() == "xcart":
-    result = calculateXcart(rprim, xCxR, a, b, c)
+    if mode.lower() == "xred":
+        result = xcart_to_xred(xCxR, rprimd)
+    elif mode.lower() == "xcart":
+        result = xred_to_xcart(xCxR, rprimd)
+    else:
+        print("Invalid mode. Please use 'xred' or 'xcart'.")
+        sys.exit(1)
     for row in result:
         print(" ".join(f"{x:.10f}" for x in row))
-else:
-    print("Invalid mode. Please use 'xred' or 'xcart'.")
+
+if __name__ == "__main__":
+    main()
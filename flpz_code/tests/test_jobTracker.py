@@ -0,0 +1,125 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+
+from jobTracker import FakeScheduler, JobTracker, SlurmScheduler, UNREACHABLE, merge_task
+
+
+class Clock:
+    """Simulated time that only moves when the tracker sleeps."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class ScriptedSlurm(SlurmScheduler):
+    """SlurmScheduler whose squeue and sacct calls return scripted (exit code, output) pairs."""
+
+    def __init__(self, squeue, sacct):
+        self.replies = {"squeue": list(squeue), "sacct": list(sacct)}
+        self.calls = []
+
+    def run(self, args):
+        self.calls.append(args[0])
+        replies = self.replies[args[0]]
+        return replies.pop(0) if len(replies) > 1 else replies[0]
+
+
+def tracker(scheduler, clock, **options):
+    return JobTracker(scheduler, min_interval=10.0, max_interval=60.0, backoff=2.0, sleep=clock.sleep,
+                      clock=clock, log=lambda message: None, **options)
+
+
+def test_backoff_grows_while_nothing_changes_and_resets_on_a_finish():
+    clock = Clock()
+    scheduler = FakeScheduler(clock)
+    short = scheduler.submit(25)
+    long = scheduler.submit(200)
+    records = tracker(scheduler, clock).wait([short, long])
+    assert set(records) == {short, long}
+    # 10, 20 (short finishes at 30), reset to 10, then 20, 40, 60, 60 ... capped at max_interval
+    assert clock.sleeps[:5] == [10.0, 20.0, 10.0, 20.0, 40.0]
+    assert max(clock.sleeps) == 60.0
+    assert records[short]["elapsed"] == 25 and records[long]["state"] == "COMPLETED"
+
+
+def test_timeout_returns_the_jobs_finished_so_far():
+    clock = Clock()
+    scheduler = FakeScheduler(clock)
+    quick = scheduler.submit(5)
+    stuck = scheduler.submit(10000)
+    records = tracker(scheduler, clock).wait([quick, stuck], timeout=100)
+    assert list(records) == [quick]
+    assert 100 <= clock.now < 200
+
+
+def test_failed_jobs_are_reported():
+    clock = Clock()
+    scheduler = FakeScheduler(clock)
+    good = scheduler.submit(5)
+    bad = scheduler.submit(5, state="FAILED", exit_code="1:0")
+    job_tracker = tracker(scheduler, clock)
+    job_tracker.wait([good, bad])
+    assert job_tracker.failed() == [bad]
+
+
+def test_failed_queries_keep_the_jobs_pending():
+    clock = Clock()
+    scheduler = FakeScheduler(clock)
+    job = scheduler.submit(5)
+    scheduler.failures = 4
+    records = tracker(scheduler, clock).wait([job])
+    assert records[job]["state"] == "COMPLETED"
+    assert len(clock.sleeps) == 4
+
+
+def test_unknown_jobs_are_only_given_up_after_several_ticks():
+    clock = Clock()
+    records = tracker(FakeScheduler(clock), clock, unknown_ticks=3).wait(["42"])
+    assert records["42"]["state"] == "UNKNOWN"
+    assert len(clock.sleeps) == 2
+
+
+def test_squeue_failure_is_unreachable_not_finished():
+    slurm = ScriptedSlurm(squeue=[(1, "")], sacct=[(1, "")])
+    assert slurm.query(["7", "8"]) == {"7": (UNREACHABLE, None, None), "8": (UNREACHABLE, None, None)}
+    # sacct is not asked about jobs squeue could not account for
+    assert "sacct" not in slurm.calls
+
+
+def test_sacct_failure_is_unreachable_and_missing_records_unknown():
+    slurm = ScriptedSlurm(squeue=[(0, "7 RUNNING\n")], sacct=[(1, "")])
+    assert slurm.query(["7", "8"]) == {"7": ("RUNNING", None, None), "8": (UNREACHABLE, None, None)}
+    slurm = ScriptedSlurm(squeue=[(0, "")], sacct=[(0, "")])
+    assert slurm.query(["8"]) == {"8": ("UNKNOWN", None, None)}
+
+
+def test_driver_waits_through_a_slurmctld_outage():
+    clock = Clock()
+    slurm = ScriptedSlurm(squeue=[(0, "7 RUNNING\n"), (1, ""), (1, ""), (1, ""), (0, "")],
+                          sacct=[(0, "7|COMPLETED|0:0|00:01:00\n")])
+    records = tracker(slurm, clock).wait(["7"])
+    assert records["7"]["state"] == "COMPLETED" and records["7"]["elapsed"] == 60
+
+
+def test_array_tasks_merge_into_one_record():
+    slurm = ScriptedSlurm(squeue=[(0, "")],
+                          sacct=[(0, "9_0|COMPLETED|0:0|00:02:00\n9_1|FAILED|1:0|00:00:30\n"
+                                     "9_2|COMPLETED|0:0|00:05:00\n")])
+    assert slurm.query(["9"]) == {"9": ("FAILED", "1:0", 300.0)}
+    assert merge_task(None, ("COMPLETED", "0:0", 5.0)) == ("COMPLETED", "0:0", 5.0)
+    assert merge_task(("FAILED", "1:0", 5.0), ("TIMEOUT", "0:1", 9.0)) == ("FAILED", "1:0", 9.0)
+
+
+def test_array_tasks_still_in_the_queue_keep_the_array_pending():
+    slurm = ScriptedSlurm(squeue=[(0, "9_[3-5] PENDING\n9_2 RUNNING\n")], sacct=[(0, "")])
+    assert slurm.query(["9"]) == {"9": ("RUNNING", None, None)}
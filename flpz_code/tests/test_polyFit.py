@@ -0,0 +1,80 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "polynomialFitting"))
+
+from polyFit import compile_powers, compile_terms, evaluate, fit, parse_term
+
+
+def old_powers_polynomial(powers):
+    """The model of the former polynomialFitting2D.py: the given powers of x plus a constant."""
+    def polynomial(x, *params):
+        return sum(param * x**power for param, power in zip(params, powers)) + params[-1]
+    return polynomial
+
+
+def old_terms_polynomial(terms):
+    """The model of the former polynomialFitting3D.py, which read a term's powers as letter counts."""
+    def polynomial(xy, *params):
+        x, y = xy
+        result = 0
+        for param, term in zip(params, terms):
+            result += param * x**term.count('x') * y**term.count('y')
+        return result
+    return polynomial
+
+
+def test_parse_term():
+    assert parse_term("x") == [1, 0, 0]
+    assert parse_term("x^2") == [2, 0, 0]
+    assert parse_term("xy^2") == [1, 2, 0]
+    assert parse_term("x^2y^4", "xy") == [2, 4]
+    # Repeated letters add up, so the old 'xx' spelling keeps its meaning
+    assert parse_term("xxy") == [2, 1, 0]
+    assert parse_term("1") == [0, 0, 0]
+    assert parse_term("") == [0, 0, 0]
+
+
+@pytest.mark.parametrize("term", ["w", "z", "x^", "2x", "x y", "x^2 "])
+def test_parse_term_rejects_what_it_cannot_read(term):
+    with pytest.raises(ValueError):
+        parse_term(term, "xy")
+
+
+def test_compile():
+    assert compile_terms(["x^2", "xy", "1"], "xy").tolist() == [[2, 0], [1, 1], [0, 0]]
+    assert compile_powers([2, 4]).tolist() == [[2], [4], [0]]
+
+
+def test_one_variable_fit_matches_the_old_curve_fit():
+    curve_fit = pytest.importorskip("scipy.optimize").curve_fit
+    rng = np.random.default_rng(3)
+    x = np.linspace(-0.6, 0.6, 25)
+    y = -0.02 * x**2 + 0.15 * x**4 - 0.01 * x**6 + 3.5 + rng.normal(scale=1e-5, size=x.size)
+    powers = [2, 4, 6]
+    expected, _ = curve_fit(old_powers_polynomial(powers), x, y, p0=[1.0] * 4, maxfev=10000)
+    result = fit(compile_powers(powers), [x], y)
+    # curve_fit stops once its cost settles, the closed form is the exact minimum
+    np.testing.assert_allclose(result["coefficients"], expected, rtol=1e-3)
+    old_mse = np.mean((y - old_powers_polynomial(powers)(x, *expected))**2)
+    assert result["mse"] <= old_mse * (1 + 1e-9)
+    assert result["mse"] == pytest.approx(old_mse, rel=1e-3)
+    np.testing.assert_allclose(result["predicted"], evaluate(compile_powers(powers), result["coefficients"], x))
+
+
+def test_two_variable_fit_matches_the_old_curve_fit():
+    curve_fit = pytest.importorskip("scipy.optimize").curve_fit
+    rng = np.random.default_rng(5)
+    x, y = np.meshgrid(np.linspace(-0.5, 0.5, 9), np.linspace(-0.4, 0.5, 8))
+    x, y = x.ravel(), y.ravel()
+    z = 0.3 * x**2 - 0.1 * y**2 + 0.8 * x**2 * y**2 + 0.05 * x**4 + 1.0 + rng.normal(scale=1e-5, size=x.size)
+    old_terms = ["xx", "yy", "xxyy", "xxxx", "1"]
+    expected, covariance = curve_fit(old_terms_polynomial(old_terms), (x, y), z, p0=[1.0] * 5, maxfev=10000)
+    result = fit(compile_terms(["x^2", "y^2", "x^2y^2", "x^4", "1"], "xy"), (x, y), z)
+    np.testing.assert_allclose(result["coefficients"], expected, rtol=1e-6)
+    np.testing.assert_allclose(result["covariance"], covariance, rtol=1e-4, atol=1e-4 * np.abs(covariance).max())
+    predicted = old_terms_polynomial(old_terms)((x, y), *expected)
+    assert result["r2"] == pytest.approx(1 - np.sum((z - predicted)**2) / np.sum((z - np.mean(z))**2), rel=1e-9)
@@ -0,0 +1,200 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+
+from smodes_symmadapt_abinit import atomList, clean_list, orthonormalize, symmPrec, write_irrep
+
+
+def baseline_orthonormalize(distMat):
+    """The normalize and orthogonalize loops of the original smodes_symmadapt_abinit.py, on a
+    (numAtoms, 3, numModes+1) matrix whose column 0 is unused."""
+    numModes = distMat.shape[2] - 1
+    distMat = distMat.copy()
+    for m in range(1, numModes + 1):
+        distMat[:, :, m] = distMat[:, :, m] / np.sqrt(np.sum(np.multiply(distMat[:, :, m], distMat[:, :, m])))
+    orthMat = np.zeros(distMat.shape)
+    for m in range(1, numModes + 1):
+        SAM = distMat[:, :, m]
+        for n in range(m + 1, numModes + 1):
+            SAM = SAM - distMat[:, :, n] * np.sum(np.multiply(distMat[:, :, n], SAM))
+        orthMat[:, :, m] = SAM / np.sqrt(np.sum(np.multiply(SAM, SAM)))
+    return orthMat
+
+
+def baseline_write_irrep(targetIrrep, record, precLatParam):
+    """The cleaning, orthogonalization and writing steps of the original smodes_symmadapt_abinit.py,
+    kept line for line as the golden writer of headerFile_<irrep>.dat and dist_<irrep>_<m>."""
+    numModes = record["numModes"]
+    shapeCell = np.matrix(record["shapeCell"])
+    atom_list = record["atom_list"]
+    atom_pos = [list(row) for row in record["atom_pos_raw"]]
+    numAtoms = len(atom_list)
+    typeList = []
+    for a in range(numAtoms):
+        if atom_list[a] not in typeList:
+            typeList.append(atom_list[a])
+    typeCount = np.zeros((len(typeList)))
+    for a in range(numAtoms):
+        for type in range(len(typeList)):
+            if atom_list[a] == typeList[type]:
+                typeCount[type] = typeCount[type] + 1
+    cleanList = list(clean_list())
+    for n in range(3):
+        for i in range(3):
+            for c in range(len(cleanList)):
+                if (np.absolute(np.absolute(shapeCell[n, i]) - np.absolute(cleanList[c]))) < symmPrec:
+                    shapeCell[n, i] = np.sign(shapeCell[n, i]) * cleanList[c]
+    Cell = np.multiply(shapeCell, np.matrix([precLatParam, precLatParam, precLatParam]))
+    for n in range(numAtoms):
+        for i in range(3):
+            for c in range(len(cleanList)):
+                if (np.absolute(np.absolute(atom_pos[n][i]) - np.absolute(cleanList[c]))) < symmPrec:
+                    atom_pos[n][i] = np.sign(atom_pos[n][i]) * cleanList[c]
+    for n in range(numAtoms):
+        for i in range(3):
+            atom_pos[n][i] = atom_pos[n][i] * precLatParam[i]
+    posMatCart = np.matrix(atom_pos)
+    atomicNumList = []
+    atomicMassList = []
+    for i in range(len(typeList)):
+        for k in range(len(atomList)):
+            if atomList[k][1] == typeList[i]:
+                atomicNumList.append(atomList[k][0])
+                atomicMassList.append(atomList[k][2])
+                break
+
+    h = open("headerFile_" + str(targetIrrep) + ".dat", "w")
+    h.write("Irrep: " + str(targetIrrep) + "\n")
+    h.write("NumSAM: " + str(numModes) + "\n")
+    h.write("NumAtomTypes: " + str(len(typeList)) + "\n")
+    h.write("NumAtoms: " + str(numAtoms) + "\n")
+    h.write("DispMag(angstrom): " + str(0.001) + "\n")
+    for i in range(len(typeList)):
+        h.write(f"{typeList[i]} {int(typeCount[i])} {atomicMassList[i]}\n")
+    distMat = np.zeros((numAtoms, 3, numModes + 1))
+    modeInd = 1
+    modeTypeList = [" "] * (numModes + 1)
+    for line in record["modeLines"]:
+        thisLine = line.split()
+        if line == "------------------------------------------":
+            modeInd = modeInd + 1
+        else:
+            atom = int(thisLine[0]) - 1
+            modeTypeList[modeInd] = thisLine[1]
+            distMat[atom, :, modeInd] = [float(thisLine[2]), float(thisLine[3]), float(thisLine[4])]
+    distMat = baseline_orthonormalize(distMat)
+    for m in range(numModes + 1):
+        thisDispCart = posMatCart + 1.88973 * 0.001 * distMat[:, :, m]
+        thisDispFrac = np.matmul(thisDispCart, np.linalg.inv(Cell))
+        f = open("dist_" + str(targetIrrep) + "_" + str(m), "w")
+        f.write("natom " + str(numAtoms) + "\n")
+        f.write("ntypat " + str(len(typeCount)) + "\n")
+        f.write("typat ")
+        for i in range(len(typeCount)):
+            for j in range(int(typeCount[i])):
+                f.write(str(int(i) + 1) + "  ")
+        f.write("\n")
+        f.write("znucl ")
+        for i in range(len(atomicNumList)):
+            f.write(str(atomicNumList[i]) + " ")
+        f.write("\n")
+        f.write("xred \n")
+        if m > 0:
+            h.write("SAM_" + str(m) + ": " + modeTypeList[m] + "\n")
+        for i in range(numAtoms):
+            for j in range(3):
+                f.write("{:.10f}".format(thisDispFrac[i, j]) + " ")
+                if m > 0:
+                    h.write("{:.10f}".format(distMat[i, j, m]) + " ")
+            f.write("\n")
+            if m > 0:
+                h.write("\n")
+        f.write("acell 3*1.0\nrprim\n")
+        for i in range(3):
+            for j in range(3):
+                f.write("{:.10f}".format(Cell[i, j]) + " ")
+            f.write("\n")
+        f.close()
+    h.close()
+
+
+def hexagonal_record():
+    """A parsed smodes block: a hexagonal cell printed with smodes' precision, two atom types and three
+    overlapping SAMs."""
+    modes = [["1 Ga 0.5 0.0 0.0", "2 Ga -0.5 0.0 0.0"],
+             ["1 Ga 0.3 0.2 0.0", "3 N 0.0 0.4 0.1"],
+             ["2 Ga 0.1 0.0 0.7", "3 N 0.2 0.2 0.2", "4 N 0.0 -0.3 0.6"]]
+    return {"numModes": 3,
+            "shapeCell": np.array([[1.0, 0.0, 0.0], [-0.5, 0.866025, 0.0], [0.0, 0.0, 1.6]]),
+            "atom_list": ["Ga", "Ga", "N", "N"],
+            "atom_pos_raw": [[0.333333, 0.666667, 0.0], [0.666667, 0.333333, 0.5],
+                             [0.333333, 0.666667, 0.375], [0.666667, 0.333333, 0.875]],
+            "modeLines": modes[0] + ["------------------------------------------"] + modes[1]
+            + ["------------------------------------------"] + modes[2]}
+
+
+def vectorized(distMat):
+    numAtoms, _, columns = distMat.shape
+    return orthonormalize(distMat[:, :, 1:].reshape(numAtoms * 3, columns - 1)).reshape(numAtoms, 3, columns - 1)
+
+
+def formatted(values):
+    return ["{:.10f}".format(v) for v in values.ravel()]
+
+
+def overlapping_sams():
+    """Four SAMs on five atoms (GM5--like: pairs of atoms moving along x and y) that all overlap."""
+    distMat = np.zeros((5, 3, 5))
+    distMat[:, :, 1] = [[1, 0, 0], [0, 0, 0], [0, 0, 0], [0, 0, 0], [0, 0, 0]]
+    distMat[:, :, 2] = [[1, 0, 0], [1, 0, 0], [0, 0, 0], [0, 0, 0], [0, 0, 0]]
+    distMat[:, :, 3] = [[0, 0, 0], [1, 1, 0], [0, 1, 0], [0, 0, 0], [0, 0, 0]]
+    distMat[:, :, 4] = [[1, 0, 0], [0, 1, 0], [0, 1, 0], [0, 0, 1], [0, 0, 1]]
+    return distMat
+
+
+def test_overlapping_sams_match_the_baseline_loop():
+    distMat = overlapping_sams()
+    expected = baseline_orthonormalize(distMat)[:, :, 1:]
+    result = vectorized(distMat)
+    np.testing.assert_allclose(result, expected, rtol=0, atol=1e-14)
+    assert formatted(result) == formatted(expected)
+    # The baseline projects onto the original later SAMs, so the set is not orthogonal
+    columns = result.reshape(15, 4)
+    assert abs(columns[:, 0] @ columns[:, 2]) > 1e-3
+
+
+def test_random_overlapping_sams_match_the_baseline_loop():
+    rng = np.random.default_rng(7)
+    distMat = np.zeros((12, 3, 9))
+    distMat[:, :, 1:] = rng.normal(size=(12, 3, 8))
+    np.testing.assert_allclose(vectorized(distMat), baseline_orthonormalize(distMat)[:, :, 1:], rtol=0, atol=1e-12)
+
+
+def test_orthogonal_sams_are_only_normalized():
+    distMat = np.zeros((2, 3, 4))
+    distMat[0, :, 1] = [2, 0, 0]
+    distMat[0, :, 2] = [0, -3, 0]
+    distMat[1, :, 3] = [0, 0, 0.5]
+    result = vectorized(distMat)
+    assert formatted(result) == formatted(np.sign(distMat[:, :, 1:]))
+
+
+# The original writer works on np.matrix
+@pytest.mark.filterwarnings("ignore::PendingDeprecationWarning")
+def test_dist_and_header_files_match_the_baseline_writer(tmp_path, monkeypatch):
+    precLatParam = [6.0, 6.0, 9.7]
+    for name in ("baseline", "new"):
+        (tmp_path / name).mkdir()
+    monkeypatch.chdir(tmp_path / "baseline")
+    baseline_write_irrep("GM5-", hexagonal_record(), precLatParam)
+    monkeypatch.chdir(tmp_path / "new")
+    write_irrep("GM5-", hexagonal_record(), precLatParam)
+    names = sorted(os.listdir(tmp_path / "baseline"))
+    assert names == ["dist_GM5-_0", "dist_GM5-_1", "dist_GM5-_2", "dist_GM5-_3", "headerFile_GM5-.dat"]
+    assert sorted(os.listdir(tmp_path / "new")) == names
+    for name in names:
+        assert (tmp_path / "new" / name).read_bytes() == (tmp_path / "baseline" / name).read_bytes(), name
@@ -0,0 +1,65 @@
+import os
+import sys
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "polynomialFitting"))
+
+import subsetSearch
+from polyFit import compile_terms, design_matrix
+
+TERMS = ["1", "x^2", "y^2", "xy", "x^4", "y^4", "x^2y^2", "x^3y", "xy^3", "x^6", "y^6", "x^4y^2"]
+
+
+def coupling_surface():
+    """A noisy synthetic energy surface on a coupling grid and the design matrix of TERMS on it."""
+    rng = np.random.default_rng(11)
+    x, y = np.meshgrid(np.linspace(-0.5, 0.5, 9), np.linspace(-0.5, 0.5, 9))
+    x, y = x.ravel(), y.ravel()
+    z = (-0.04 * x**2 - 0.02 * y**2 + 0.3 * x**4 + 0.25 * y**4 + 0.6 * x**2 * y**2 + 0.1 * x**6
+         + rng.normal(scale=1e-4, size=x.size))
+    return design_matrix(compile_terms(TERMS, "xy"), x, y), z
+
+
+def exhaustive(A, values, forced):
+    """Lowest RSS model of every size, refitting every subset that keeps the forced terms."""
+    free = [t for t in range(A.shape[1]) if t not in forced]
+    best = {}
+    for size in range(len(free) + 1):
+        for subset in combinations(free, size):
+            model = tuple(sorted(list(forced) + list(subset)))
+            if not model:
+                continue
+            coefficients = np.linalg.lstsq(A[:, model], values, rcond=None)[0]
+            rss = float(np.sum((values - A[:, model] @ coefficients) ** 2))
+            if len(model) not in best or rss < best[len(model)][0]:
+                best[len(model)] = (rss, model)
+    return best
+
+
+def assert_same_subsets(found, expected, values):
+    assert sorted(found) == sorted(expected)
+    # The search scores RSS as |y|^2 - b.beta, which cancels down to about eps |y|^2 times the conditioning
+    for size, (rss, subset) in expected.items():
+        assert found[size][1] == subset, size
+        assert found[size][0] == pytest.approx(rss, rel=1e-6, abs=1e-8 * float(values @ values))
+
+
+def test_serial_search_finds_the_exhaustive_best_subsets():
+    A, z = coupling_surface()
+    assert_same_subsets(subsetSearch.best_subsets(A, z, forced=[0], workers=1), exhaustive(A, z, [0]), z)
+
+
+def test_pool_search_finds_the_exhaustive_best_subsets(monkeypatch):
+    A, z = coupling_surface()
+    # Hand the branches of this small problem to the pool as well
+    monkeypatch.setattr(subsetSearch, "PARALLEL_MIN_TERMS", 2)
+    assert_same_subsets(subsetSearch.best_subsets(A, z, forced=[0], workers=2), exhaustive(A, z, [0]), z)
+
+
+def test_search_without_forced_terms():
+    A, z = coupling_surface()
+    A, z = A[:, 1:9], z - np.mean(z)
+    assert_same_subsets(subsetSearch.best_subsets(A, z, workers=1), exhaustive(A, z, []), z)